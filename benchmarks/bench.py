@@ -0,0 +1,590 @@
+"""Measures the throughput of pptrees' hot paths
+
+Run this with pptrees importable, optionally naming the benchmarks to run:
+
+    python benchmarks/bench.py [rotations copies ...]
+
+Each benchmark prints one line of figures.
+"""
+import os
+import random
+import time
+
+# Width used by the slower construction benchmarks
+# Set PPTREES_BENCH_WIDTH=128 to reproduce the figures quoted in the history
+BENCH_WIDTH = int(os.environ.get("PPTREES_BENCH_WIDTH", 32))
+
+
+def _throughput(fun, args):
+    """Returns the number of calls of fun per second, over a list of args"""
+    start = time.perf_counter()
+    for a in args:
+        fun(*a)
+    return len(args) / (time.perf_counter() - start)
+
+
+def bench_unrank():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.util import catalan, catalan_split
+
+    def linear_split(n, rank):
+        # Linear scan formerly used by ExpressionTree.unrank
+        for i in range((n + 1) // 2):
+            big_number = catalan(i) * catalan(n - i - 1)
+            if rank < big_number:
+                break
+            rank -= big_number
+        return i, rank
+
+    for width in [32, 64, 128, 256]:
+        ranks = [random.randrange(catalan(width - 1)) for _ in range(20)]
+        trees = _throughput(
+            AdderTree, [(width, None, None, "t", r) for r in ranks]
+        )
+        ranks = [r % (catalan(width - 1) >> 1) for r in ranks]
+        old = _throughput(linear_split, [(width - 1, r) for r in ranks])
+        new = _throughput(catalan_split, [(width - 1, r) for r in ranks])
+        print(
+            "unrank width {0}: {1:.1f} trees/s;"
+            " split {2:.0f}/s linear vs {3:.0f}/s bisect".format(
+                width, trees, old, new
+            )
+        )
+
+
+def bench_skeleton_sweep():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.SkeletonTree import SkeletonTree
+
+    width = 32
+    ranks = list(range(1000, 1050))
+    skeleton = SkeletonTree(width)
+    full = _throughput(AdderTree, [(width, None, None, "t", r) for r in ranks])
+    bare = _throughput(skeleton.unrank, [(r,) for r in ranks])
+    print(
+        "sweep width {0}: {1:.1f} trees/s vs {2:.1f} skeletons/s".format(
+            width, full, bare
+        )
+    )
+
+
+def bench_rotation_walk():
+    from itertools import islice
+
+    from pptrees.AdderTree import AdderTree
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.sweep import rotation_walk
+
+    def walked(tree, steps):
+        for _ in islice(rotation_walk(tree), steps):
+            pass
+
+    for tree_type, width, steps in [
+        (SkeletonTree, 12, 20000),
+        (AdderTree, 10, 2000),
+    ]:
+        walk = steps * _throughput(walked, [(tree_type(width), steps)])
+        rebuilt = _throughput(
+            lambda rank: tree_type(width, start_point=rank),
+            [(r,) for r in range(steps // 10)],
+        )
+        print(
+            "{0} walk width {1}: {2:.0f} trees/s by rotation"
+            " vs {3:.0f} trees/s rebuilt".format(
+                tree_type.__name__, width, walk, rebuilt
+            )
+        )
+
+
+def bench_constrained_ranking():
+    from pptrees.constrained import count, rank_constrained, unrank_constrained
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.util import catalan
+
+    width = 2 * BENCH_WIDTH
+    height = (width - 1).bit_length() + 1
+    total = count(width, height)
+    indices = [random.randrange(total) for _ in range(200)]
+    ranks = [unrank_constrained(width, height, i) for i in indices]
+    assert all(SkeletonTree(width, r).height() <= height for r in ranks)
+    print(
+        "height {0} width {1}: {2:.3g} of {3:.3g} trees,"
+        " {4:.0f} unranks/s, {5:.0f} ranks/s".format(
+            height,
+            width,
+            float(total),
+            float(catalan(width - 1)),
+            _throughput(
+                unrank_constrained, [(width, height, i) for i in indices]
+            ),
+            _throughput(rank_constrained, [(width, height, r) for r in ranks]),
+        )
+    )
+
+
+def bench_lazy_positions():
+    from pptrees.AdderTree import AdderTree
+
+    class EagerTree(AdderTree):
+        # Lays out the whole diagram after every rotation, as was once done
+        def _eager_layout(self):
+            self._dirty_nodes.update(self.nodes)
+            self._fix_diagram_positions()
+
+        def left_rotate(self, node):
+            node = super().left_rotate(node)
+            self._eager_layout()
+            return node
+
+        def right_rotate(self, node):
+            node = super().right_rotate(node)
+            self._eager_layout()
+            return node
+
+    for alias in ["sklansky", "kogge-stone"]:
+        args = [(BENCH_WIDTH, None, None, "t", 0, alias)]
+        eager = 1 / _throughput(EagerTree, args)
+        lazy = 1 / _throughput(AdderTree, args)
+        print(
+            "{0} width {1}: {2:.2f}s eager layout vs {3:.2f}s lazy".format(
+                alias, BENCH_WIDTH, eager, lazy
+            )
+        )
+
+
+def bench_port_matching():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.util import _match_definitions, match_nodes
+
+    def rescan(parent, child, index):
+        # Port scan formerly done on every edge
+        return _match_definitions.__wrapped__(
+            parent.node_data, child.node_data, index
+        )
+
+    tree = AdderTree(BENCH_WIDTH, alias="sklansky")
+    edges = [
+        (p, c, i) for p in tree for i, c in enumerate(p) if c is not None
+    ] * 20
+    print(
+        "port matching width {0}: {1:.0f} edges/s rescanned,"
+        " {2:.0f} edges/s cached".format(
+            BENCH_WIDTH,
+            _throughput(rescan, edges),
+            _throughput(match_nodes, edges),
+        )
+    )
+    start = time.perf_counter()
+    AdderTree(BENCH_WIDTH, alias="kogge-stone")
+    print(
+        "kogge-stone tree built in {0:.3f}s".format(time.perf_counter() - start)
+    )
+
+
+def bench_rotations():
+    from pptrees.AdderTree import AdderTree
+
+    def rotate(tree, nodes):
+        node = nodes[random.randrange(len(nodes))]
+        if node not in tree:
+            # Rotations through the left spine replace nodes
+            nodes[:] = list(tree)
+            return
+        if node.parent is None or None in node.children or not node.children:
+            return
+        if node.parent[1] is node:
+            tree.left_rotate(node)
+        else:
+            tree.right_rotate(node)
+
+    tree = AdderTree(BENCH_WIDTH, alias="sklansky")
+    nodes = list(tree)
+    random.seed(0)
+    rate = _throughput(rotate, [(tree, nodes)] * 20000)
+    print("rotations width {0}: {1:.0f}/s".format(BENCH_WIDTH, rate))
+
+
+def bench_copies():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+
+    def rebuild(tree):
+        return AdderTree(tree.width, start_point=tree.rank())
+
+    tree = AdderTree(BENCH_WIDTH, alias="sklansky")
+    forest = AdderForest(BENCH_WIDTH, alias="sklansky")
+    forest.find_equivalent_nodes()
+    print(
+        "copies width {0}: {1:.0f} trees/s rebuilt from rank vs {2:.0f}"
+        " cloned, {3:.1f} forests/s cloned".format(
+            BENCH_WIDTH,
+            _throughput(rebuild, [(tree,)] * 5),
+            _throughput(tree.copy, [()] * 5),
+            _throughput(forest.copy, [()] * 5),
+        )
+    )
+
+
+def bench_transactions():
+    from pptrees.AdderTree import AdderTree
+
+    def attempt(tree, nodes):
+        node = nodes[random.randrange(len(nodes))]
+        if node.parent is None or None in node.children or not node.children:
+            return
+        if node.parent[1] is node:
+            tree.left_rotate(node)
+        else:
+            tree.right_rotate(node)
+
+    # Each local search step tries a rotation, and then rejects it
+    def rebuilt(state):
+        tree, nodes = state
+        rank = tree.rank()
+        attempt(tree, nodes)
+        state[0] = AdderTree(tree.width, start_point=rank)
+        state[1] = list(state[0])
+
+    def copied(state):
+        tree, nodes = state
+        old = tree.copy()
+        attempt(tree, nodes)
+        state[0] = old
+        state[1] = list(old)
+
+    def rolled_back(state):
+        tree, nodes = state
+        with tree.transaction() as tx:
+            attempt(tree, nodes)
+            tx.rollback()
+
+    rates = []
+    for undo, steps in [(rebuilt, 20), (copied, 50), (rolled_back, 2000)]:
+        tree = AdderTree(BENCH_WIDTH, alias="sklansky")
+        random.seed(0)
+        rates.append(_throughput(undo, [([tree, list(tree)],)] * steps))
+    print(
+        "rejected rotations width {0}: {1:.0f}/s rebuilt from rank,"
+        " {2:.0f}/s copied, {3:.0f}/s rolled back".format(BENCH_WIDTH, *rates)
+    )
+
+
+def bench_equivalent_nodes():
+    from pptrees.AdderForest import AdderForest
+
+    for width in [16, 32, 64, 128]:
+        if width > BENCH_WIDTH:
+            break
+        forest = AdderForest(width, alias="sklansky")
+        forest.optimize_nodes()
+        elapsed = 1 / _throughput(forest.find_equivalent_nodes, [()])
+        print(
+            "equivalence width {0}: {1:.3f}s for {2} nodes, {3} classes".format(
+                width,
+                elapsed,
+                sum(len(t.nodes) for t in forest),
+                len(forest.equiv_classes),
+            )
+        )
+
+
+def bench_compiled_simulation():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import compile_graph, is_adder, simulate
+
+    for graph in [
+        AdderTree(2 * BENCH_WIDTH, alias="sklansky"),
+        AdderForest(BENCH_WIDTH, alias="sklansky"),
+    ]:
+        width = graph.width
+        inputs = {
+            "a_in": [random.getrandbits(256) for _ in range(width)],
+            "b_in": [random.getrandbits(256) for _ in range(width)],
+        }
+        compile_graph(graph)
+        walk = _throughput(simulate, [(graph, inputs, 256)] * 10)
+        kernel = _throughput(simulate, [(graph, inputs, 256, True)] * 10)
+        check = 1 / _throughput(is_adder, [(graph, 256, None, True)])
+        print(
+            "{0} width {1}: {2:.0f} batches/s walked vs {3:.0f} compiled;"
+            " {4:.1f}ms to check 256 vectors".format(
+                type(graph).__name__, width, walk, kernel, 1000 * check
+            )
+        )
+
+
+def bench_static_timing():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.StaticTiming import StaticTiming
+
+    tree = AdderTree(BENCH_WIDTH, alias="sklansky")
+    sta = StaticTiming(tree)
+    cocycle = tree.node_defs["cocycle"]
+    parent = next(
+        n for n in tree if n.value == cocycle and n[0].value == cocycle
+    )
+    node = parent[0]
+
+    def rotate_and_query(rotate, node):
+        rotate(node)
+        return sta.delay()
+
+    old = _throughput(tree.critical_path, [()] * 10)
+    full = _throughput(sta.update, [(True,)] * 10)
+    steps = [(tree.right_rotate, node), (tree.left_rotate, parent)] * 50
+    incremental = _throughput(rotate_and_query, steps)
+    print(
+        "timing width {0}: {1:.0f} critical_path/s, {2:.0f} full updates/s,"
+        " {3:.0f} rotations and incremental updates/s".format(
+            BENCH_WIDTH, old, full, incremental
+        )
+    )
+
+
+def bench_mapping():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.util import (
+        _mapping_registry,
+        load_mapping,
+        merge_mapping_into_cells,
+    )
+
+    def generate(mapping):
+        AdderForest(BENCH_WIDTH, alias="sklansky").hdl(mapping=mapping)
+
+    def parse(mapping):
+        _mapping_registry.clear()
+        load_mapping(mapping)
+
+    hdl = "\n".join(
+        "\tmux2 U{0}(yout,w1 ,xin,yin);".format(i) for i in range(8)
+    )
+    templates = load_mapping("sky130_fd_sc_hd")
+    print(
+        "mapping: {0:.0f} parses/s, {1:.0f} cold merges/s,"
+        " {2:.2f} forests of width {3}/s".format(
+            _throughput(parse, [("sky130_fd_sc_hd",)] * 20),
+            _throughput(
+                merge_mapping_into_cells,
+                [(hdl + "\n" * i, templates) for i in range(200)],
+            ),
+            _throughput(generate, [("sky130_fd_sc_hd",)] * 3),
+            BENCH_WIDTH,
+        )
+    )
+
+
+def bench_hdl():
+    from pptrees.AdderForest import AdderForest
+
+    for width in [BENCH_WIDTH, 2 * BENCH_WIDTH]:
+        forest = AdderForest(width)
+        forest._prepare_for_hdl()
+        start = time.perf_counter()
+        hdl = forest.hdl()[2]
+        elapsed = time.perf_counter() - start
+        print(
+            "hdl width {0}: {1:.3f}s for {2} nodes, {3} characters".format(
+                width, elapsed, sum(len(t.nodes) for t in forest), len(hdl)
+            )
+        )
+
+
+def bench_streamed_hdl():
+    import pathlib
+    import tempfile
+    import tracemalloc
+
+    from pptrees.AdderForest import AdderForest
+
+    width = 2 * BENCH_WIDTH
+    peaks = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out = pathlib.Path(tmp) / "adder.v"
+        for write in [
+            lambda f: f.hdl(out=str(out)),
+            lambda f: f.write_hdl(out),
+        ]:
+            forest = AdderForest(width)
+            forest._prepare_for_hdl()
+            tracemalloc.start()
+            write(forest)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        size = os.path.getsize(out)
+    print(
+        "hdl width {0}: {1:.0f}kB peak in memory vs {2:.0f}kB streamed,"
+        " for a {3:.0f}kB file".format(
+            width, peaks[0] / 1024, peaks[1] / 1024, size / 1024
+        )
+    )
+
+
+def bench_internal_nets():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.NetTable import net_sort_key, parse_net
+    from pptrees.util import natural_keys
+
+    def legacy_wires(graph):
+        # String nets, formerly named when they were created
+        nets = set()
+        for node in graph.nodes:
+            for net in list(node.in_nets.values()) + list(
+                node.out_nets.values()
+            ):
+                nets.update(parse_net(x) for x in net)
+        ports = [x[0][0] for x in graph.in_ports + graph.out_ports]
+        nets = [x for x in nets if x.split("[")[0] not in ports]
+        return sorted(nets, key=natural_keys)
+
+    def wires(graph):
+        nets = set().union(*graph._get_internal_nets())
+        return [parse_net(x) for x in sorted(nets, key=net_sort_key)]
+
+    forest = AdderForest(2 * BENCH_WIDTH)
+    tree = forest.trees[-1]
+    assert wires(tree) == legacy_wires(tree)
+    print(
+        "internal nets width {0}: {1:.0f}/s interned vs {2:.0f}/s strings".format(
+            2 * BENCH_WIDTH,
+            _throughput(wires, [(tree,)] * 20),
+            _throughput(legacy_wires, [(tree,)] * 20),
+        )
+    )
+
+
+def bench_netlist():
+    from pptrees.AdderForest import AdderForest
+
+    width = 2 * BENCH_WIDTH
+    forest = AdderForest(width)
+    forest._prepare_for_hdl()
+    start = time.perf_counter()
+    netlist = forest.netlist()
+    lowered = time.perf_counter() - start
+    formats = [
+        ("behavioral", "verilog"),
+        ("sky130_fd_sc_hd", "verilog"),
+        ("behavioral", "vhdl"),
+    ]
+    start = time.perf_counter()
+    for mapping, language in formats:
+        netlist.hdl(mapping=mapping, language=language)
+    written = time.perf_counter() - start
+    print(
+        "netlist width {0}: lowered {1} cells in {2:.3f}s,"
+        " wrote {3} formats in {4:.3f}s".format(
+            width, len(netlist), lowered, len(formats), written
+        )
+    )
+
+
+def bench_aiger_blif():
+    from pptrees.AdderForest import AdderForest
+
+    for width in [BENCH_WIDTH // 4, BENCH_WIDTH // 2, BENCH_WIDTH]:
+        netlist = AdderForest(width, alias="sklansky").netlist()
+        start = time.perf_counter()
+        aig = netlist.aiger()
+        aig_time = time.perf_counter() - start
+        start = time.perf_counter()
+        blif = netlist.blif()
+        blif_time = time.perf_counter() - start
+        print(
+            "aiger/blif width {0}: {1} cells, aiger {2} bytes in {3:.4f}s,"
+            " blif {4} bytes in {5:.4f}s".format(
+                width, len(netlist), len(aig), aig_time, len(blif), blif_time
+            )
+        )
+
+
+def bench_multiple_mappings():
+    from pptrees.AdderForest import AdderForest
+
+    width = BENCH_WIDTH
+    mappings = [
+        "sky130_fd_sc_hd",
+        "sky130_fd_sc_hs",
+        "sky130_fd_sc_ms",
+        "sky130_fd_sc_ls",
+    ]
+    start = time.perf_counter()
+    for mapping in mappings:
+        AdderForest(width, alias="sklansky").hdl(mapping=mapping)
+    rebuilt = time.perf_counter() - start
+    start = time.perf_counter()
+    AdderForest(width, alias="sklansky").hdl_mappings(mappings, max_workers=4)
+    shared = time.perf_counter() - start
+    print(
+        "{0} mappings width {1}: {2:.3f}s rebuilding vs {3:.3f}s shared".format(
+            len(mappings), width, rebuilt, shared
+        )
+    )
+
+
+def bench_memory():
+    import tracemalloc
+
+    from pptrees.AdderForest import AdderForest
+
+    for width in [BENCH_WIDTH // 4, BENCH_WIDTH // 2, BENCH_WIDTH]:
+        tracemalloc.start()
+        forest = AdderForest(width, alias="sklansky")
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        nodes = sum(t.number_of_nodes() for t in forest)
+        print(
+            "memory width {0}: {1} nodes, {2:.1f} KiB ({3:.0f} B/node),"
+            " peak {4:.1f} KiB".format(
+                width, nodes, size / 1024, size / nodes, peak / 1024
+            )
+        )
+
+
+def bench_import_time():
+    import subprocess
+    import sys
+
+    import pptrees
+
+    # Time imports in fresh interpreters, as the Yosys flow spawns them
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(pptrees.__file__))
+    env["PYTHONPATH"] = os.pathsep.join([src, env.get("PYTHONPATH", "")])
+    script = (
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "import pptrees.yosys_alu\n"
+        "print(time.perf_counter() - start)\n"
+    )
+    times = []
+    for _ in range(5):
+        out = subprocess.run(
+            [sys.executable, "-c", script],
+            env=env,
+            stdout=subprocess.PIPE,
+            check=True,
+            universal_newlines=True,
+        ).stdout.split("\n")
+        times.append(float(out[0]))
+    print("import pptrees.yosys_alu: {0:.3f}s".format(min(times)))
+
+
+def main(names):
+    """Runs the named benchmarks, or all of them"""
+    benchmarks = {
+        k[len("bench_") :]: v
+        for k, v in globals().items()
+        if k.startswith("bench_")
+    }
+    for name in names or benchmarks:
+        if name not in benchmarks:
+            raise ValueError("Unknown benchmark: {0}".format(name))
+        benchmarks[name]()
+
+
+if __name__ == "__main__":
+    import sys
+
+    main(sys.argv[1:])
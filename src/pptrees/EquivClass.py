@@ -14,6 +14,8 @@ class EquivClass:
         parents (set of EquivClass): The parents of this equivalence class
     """
 
+    __slots__ = ("rep", "nodes", "out_nets", "parents")
+
     def __init__(self, rep):
         """Initializes an EquivClass object
 
@@ -26,6 +28,34 @@ class EquivClass:
         self.out_nets = rep.out_nets
         self.parents = set()
 
+    def _clone(self, memo):
+        """Copies this class, among the nodes that were copied
+
+        Args:
+            memo (dict): Maps nodes and classes to their copies
+
+        Returns:
+            EquivClass: The copy, or None if the representative was not copied
+        """
+        if self in memo:
+            return memo[self]
+        rep = memo.get(self.rep)
+        if rep is None:
+            memo[self] = None
+            return None
+        new = memo[self] = EquivClass.__new__(EquivClass)
+        new.rep = rep
+        new.nodes = {memo[x] for x in self.nodes if x in memo}
+        # The class's nets are those of its representative
+        if self.out_nets is self.rep.out_nets:
+            new.out_nets = rep.out_nets
+        else:
+            new.out_nets = {k: v.copy() for k, v in self.out_nets.items()}
+        new.parents = {
+            memo.get(x) for x in self.parents if x is None or x in memo
+        }
+        return new
+
     def __len__(self):
         """Returns the number of nodes in this equivalence class"""
         return len(self.nodes)
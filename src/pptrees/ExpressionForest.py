@@ -1,11 +1,11 @@
 from .ExpressionGraph import ExpressionGraph
 from .ExpressionTree import ExpressionTree
+from .Netlist import Netlist
 from .util import (
     display_gif,
     hdl_syntax,
-    increment_iname,
-    increment_wname,
     natural_keys,
+    reserve_names,
     wrap_quotes,
 )
 
@@ -215,6 +215,27 @@ class ExpressionForest(ExpressionGraph):
         """Automatically display diagrams in a Notebook"""
         return display_gif(self.trees)
 
+    def copy(self):
+        """Copies the forest, keeping the classes of equivalent nodes
+
+        See ExpressionGraph.__copy__
+        """
+        return self.__copy__()
+
+    def _clone(self, memo):
+        """Copies the forest's trees, for __copy__"""
+        trees = [t._clone(memo) for t in self.trees]
+        new = super()._clone(memo)
+        new.trees = trees
+        new.node_defs = self.node_defs.copy()
+        return new
+
+    def _clone_classes(self, new, memo):
+        """Copies the equivalence classes of the forest, for __copy__"""
+        super()._clone_classes(new, memo)
+        new.equiv_classes = {ec._clone(memo) for ec in self.equiv_classes}
+        new.equiv_classes.discard(None)
+
     ### NOTE: Equivalence requires nodes to be fully equivalent
     ### It is possible for two nodes to be partially equivalent
     ### For example, if their subtrees are identical
@@ -222,26 +243,38 @@ class ExpressionForest(ExpressionGraph):
     ### Such as (+,-) vs (+) or (-)
     ### This should be accounted for
     def find_equivalent_nodes(self):
-        """Finds equivalent nodes amongst the forest's trees"""
-        for i1 in reversed(range(len(self.trees))):
-            t1 = self.trees[i1]
-            for n1 in t1.nodes:
-                self.equiv_classes.add(n1.equiv_class)
-            for i2 in range(i1):
-                t2 = self.trees[i2]
-                for n1 in t1.nodes:
-                    for n2 in t2.nodes:
-                        # Try to merge equivalence classes
-                        old_ec = n2.equiv_class
-                        new_ec = n1.equiv_class
-                        if old_ec.equiv(new_ec):
-                            new_ec.merge(old_ec, check_equiv=False)
-                            if old_ec in self.equiv_classes:
-                                self.equiv_classes.remove(old_ec)
-                            self.equiv_classes.add(new_ec)
+        """Finds equivalent nodes amongst the forest's trees
+
+        Nodes are hash-consed bottom-up. Two nodes are equivalent if they
+        share a value and leafs, and their children are equivalent index by
+        index. Since children are visited before their parents, this is a
+        single pass over the forest.
+
+        Trees are visited from widest to narrowest, so that each equivalence
+        class is represented by a node in the widest tree that contains it.
+        """
+        classes = {}
+        for t in reversed(self.trees):
+            # Visit deeper rows first, so that children precede parents
+            for depth in sorted(t._rows, reverse=True):
+                for n in t._rows[depth]:
+                    key = (
+                        n.value,
+                        n.leafs,
+                        tuple(
+                            None if c is None else c.equiv_class
+                            for c in n.children
+                        ),
+                    )
+                    ec = classes.setdefault(key, n.equiv_class)
+                    if ec is not n.equiv_class:
+                        ec.merge(n.equiv_class, check_equiv=False)
+        self.equiv_classes.update(classes.values())
         for ec in self.equiv_classes:
             ec._recalculate_parents()
         self.mark_equivalent_nodes()
+        if self._timing is not None:
+            self._timing.update(full=True)
 
     def mark_equivalent_nodes(self):
         """Mark all redundant nodes with stripes on diagrams"""
@@ -261,6 +294,8 @@ class ExpressionForest(ExpressionGraph):
         self.unmark_equivalent_nodes()
         for ec in self.equiv_classes:
             ec.reset()
+        if self._timing is not None:
+            self._timing.update(full=True)
 
     def unmark_equivalent_nodes(self):
         """Remove stripes from all redundant nodes on diagrams"""
@@ -389,7 +424,6 @@ class ExpressionForest(ExpressionGraph):
 
     def _prepare_for_hdl(
         self,
-        mapping="behavioral",
         language="verilog",
         uniquify_names=True,
         optimization=1,
@@ -399,10 +433,9 @@ class ExpressionForest(ExpressionGraph):
         Note that this process may destructively render the graph unusable
 
         Args:
-            mapping (str): The cell mapping to use for the HDL generation
             language (str): The language in which to generate the HDL
-            description_string (str): String commend to prepend to the HDL
             uniquify_names (str): Whether wire/instance must be uniquified
+            optimization (int): The optimizaton level to use; see hdl
         """
         # Check if graph has already been prepared
         if self._prepared:
@@ -419,12 +452,65 @@ class ExpressionForest(ExpressionGraph):
         # Uniquify wire/instance names, if requested
         if uniquify_names:
             reps = [ec.rep for ec in self.equiv_classes]
-            increment_iname(reps, 1, language)
-            increment_wname(reps, 1, language)
+            self.next_iname, self.next_wname = reserve_names(
+                reps, self.next_iname, self.next_wname, language
+            )
+            # Blocks are instantiated in the trees after all of the cells
+            for t in self.trees:
+                t.next_iname = self.next_iname
 
         # Toggle the prepared flag
         self._prepared = True
 
+    def netlist(self, optimization=1):
+        """Lowers the forest to a flat netlist, which all HDL writers share
+
+        The forest is first prepared for HDL, as by hdl. The netlist is cached
+        until the structure of any of the trees changes.
+
+        Args:
+            optimization (int): The optimizaton level to use; see hdl
+
+        Returns:
+            Netlist: The netlist of the forest
+        """
+        self._prepare_for_hdl(optimization=optimization)
+        version = tuple(t._version for t in self.trees)
+        if self._netlist is None or self._netlist[0] != version:
+            self._netlist = (version, Netlist(self))
+        return self._netlist[1]
+
+    def aiger(self, out=None, optimization=1):
+        """Exports the forest's logic as a binary AIGER file
+
+        Args:
+            out (str): The file to write the AIGER to
+            optimization (int): The optimizaton level to use; see hdl
+
+        Returns:
+            bytes: The contents of the AIGER file
+        """
+        aig = self.netlist(optimization=optimization).aiger()
+        if out is not None:
+            self._write_hdl(aig, out)
+        return aig
+
+    def blif(self, out=None, module_name=None, optimization=1):
+        """Exports the forest's logic as a BLIF model
+
+        Args:
+            out (str): The file to write the BLIF to
+            module_name (str): The name of the model
+            optimization (int): The optimizaton level to use; see hdl
+
+        Returns:
+            str: The BLIF model
+        """
+        blif = self.netlist(optimization=optimization).blif(module_name)
+        if out is not None:
+            self._write_hdl(blif, out)
+        return blif
+
     def hdl(
         self,
         out=None,
@@ -450,6 +536,7 @@ class ExpressionForest(ExpressionGraph):
                 better.
             mapping (str): The technology mapping to use
             language (str): The language in which to generate the HDL
+                Other languages are written from the flat netlist; see netlist
             flat (bool): If True, flatten the graph's HDL
             module_name (str): The name of the module to generate
             uniquify_names (str): Whether wire/instance must be uniquified
@@ -462,8 +549,14 @@ class ExpressionForest(ExpressionGraph):
             list: Set of HDL module definitions used in the graph
 
         """
+        # Other languages are written from the forest's flat netlist
+        if language != "verilog":
+            netlist = self.netlist(optimization=optimization)
+            return self._netlist_hdl(
+                netlist, out, mapping, language, module_name
+            )
+
         self._prepare_for_hdl(
-            mapping=mapping,
             language=language,
             uniquify_names=uniquify_names,
             optimization=optimization,
@@ -490,7 +583,7 @@ class ExpressionForest(ExpressionGraph):
         for t in reversed(self.trees):
             # Get the graph's HDL
             desc = "{}_forest {}".format(self.name, t.name)
-            t_hdl, t_module_defs, _ = t.hdl(
+            t_hdl, t_module_defs, _ = t._module_hdl(
                 language=language,
                 mapping=mapping,
                 flat=flat,
@@ -521,14 +614,93 @@ class ExpressionForest(ExpressionGraph):
 
         hdl = "".join(hdl)
 
-        hdl, module_defs, file_out_hdl = self._wrap_hdl(
+        hdl, module_defs, module_def = self._wrap_hdl(
             hdl, module_defs, language, module_name
         )
+        file_out_hdl = "".join(self._hdl_file(module_def, module_defs))
         if out is not None:
             self._write_hdl(file_out_hdl, out)
 
         return hdl, module_defs, file_out_hdl
 
+    def iter_hdl(
+        self,
+        optimization=1,
+        mapping="behavioral",
+        language="verilog",
+        module_name=None,
+        uniquify_names=True,
+        hdl_comments=True,
+    ):
+        """Yields the HDL file of the forest, in chunks as it is generated
+
+        The forest's module only instantiates its trees, and the ports of the
+        trees are known once they are prepared. So, the forest's module comes
+        first, one tree instance at a time, and the trees' modules are streamed
+        one at a time after it. The chunks join up to the file that hdl
+        creates.
+
+        Args:
+            optimization (int): The optimizaton level to use; see hdl
+            mapping (str): The technology mapping to use
+            language (str): The language in which to generate the HDL
+            module_name (str): The name of the module to generate
+            uniquify_names (str): Whether wire/instance must be uniquified
+            hdl_comments (bool): Whether to include comments in the HDL
+
+        Yields:
+            str: The next chunk of the HDL file
+        """
+        self._prepare_for_hdl(
+            language=language,
+            uniquify_names=uniquify_names,
+            optimization=optimization,
+        )
+
+        # Update module name, if provided
+        if module_name is None:
+            module_name = self.name
+
+        # Set language-specific syntax
+        syntax = hdl_syntax[language]
+
+        # Find the wires that connect the trees, in the same order as hdl
+        inp, outp = self._get_ports()
+        self_port_names = set([x[0][0] for x in inp + outp])
+        wires = set()
+        for t in reversed(self.trees):
+            t._prepare_for_hdl(language=language, uniquify_names=False)
+            inp, outp = t._get_ports()
+            wires |= set(
+                [x[0][0] for x in inp + outp if x[0][0] not in self_port_names]
+            )
+        wires = sorted(list(wires), key=natural_keys)
+
+        def body():
+            # Instantiate all wires that connect to the trees
+            if len(wires) > 0:
+                wire_hdl = syntax["wire_def"].format(", ".join(wires))
+                yield f"\t{wire_hdl}\n"
+            # Then instantiate each tree
+            for tree_ctr, t in enumerate(reversed(self.trees)):
+                t_module_name = "{0}_{1}".format(module_name, t.name)
+                yield t._hdl_inst(
+                    t_module_name, "U{0}".format(tree_ctr), language
+                )
+
+        yield from self._stream_module(module_name, language, body())
+
+        # Module definitions are sorted by name in the file
+        for t in sorted(self.trees, key=lambda x: natural_keys(x.name)):
+            yield from t.iter_hdl(
+                mapping=mapping,
+                language=language,
+                module_name="{0}_{1}".format(module_name, t.name),
+                uniquify_names=False,
+                description_string="{}_forest {}".format(self.name, t.name),
+                hdl_comments=hdl_comments,
+            )
+
     def gif(self, out="forest.gif"):
         with open(out, "wb") as fout:
             fout.write(self._repr_png_())
@@ -1,29 +1,26 @@
+import gzip
 import pathlib
+from concurrent.futures import ThreadPoolExecutor
 
 import networkx as nx
 
 from .ExpressionNode import ExpressionNode
+from .Netlist import Netlist
+from .NetTable import NetTable, net_port, net_sort_key, parse_net
 from .util import (
     hdl_arch,
+    hdl_arch_parts,
     hdl_entity,
     hdl_inst,
     hdl_syntax,
-    increment_iname,
-    increment_wname,
-    merge_mapping_into_cells,
+    load_mapping,
     natural_keys,
-    parse_mapping,
-    parse_net,
+    reserve_names,
     sub_brackets,
     sub_ports,
-    wrap_quotes,
+    sub_tokens,
 )
 
-try:
-    from importlib.resources import path as respath
-except ImportError:
-    from importlib_resources import path as respath
-
 
 class ExpressionGraph(nx.DiGraph):
     """Defines a di-graph of arithmetic expressions
@@ -35,6 +32,7 @@ class ExpressionGraph(nx.DiGraph):
     Attributes:
         name (string): The name of the graph
         next_net (int): The next net name to be used
+        nets (NetTable): The table of the nets created by the graph
         next_block (int): The next block name to be used
         blocks (list): The list of blocks in the graph
         in_ports (list of ((string, int), string)): The list of input ports
@@ -78,7 +76,14 @@ class ExpressionGraph(nx.DiGraph):
         self.out_extras = []
 
         # Procedurally-generated net names start with "n1"
+        # Nets are interned as integers, and only named when HDL is generated
         self.next_net = 1
+        self.nets = NetTable()
+        self._extra_nets = set()
+
+        # Procedurally-generated instance and wire names start with "U1"/"w1"
+        self.next_iname = 1
+        self.next_wname = 1
 
         # Procedurally-generated block names start with "block1"
         self.next_block = 0
@@ -91,6 +96,97 @@ class ExpressionGraph(nx.DiGraph):
         # NOTE: Preparing a graph for HDL may be destructive
         self._prepared = False
 
+        # Index of the graph's nodes by depth (y_pos)
+        self._rows = {}
+
+        # Count structural changes, so that derived data can be cached
+        self._version = 0
+        self._kernel = None
+        self._netlist = None
+
+        # Static timing analysis to notify of structural changes, if any
+        self._timing = None
+
+        # Transaction recording the graph's changes, if any
+        self._journal = None
+
+    def __copy__(self):
+        """Copies the graph, with the same nodes, nets and classes
+
+        This takes time linear in the size of the graph. Data that is never
+        modified, such as node definitions and derived caches, is shared.
+
+        Returns:
+            ExpressionGraph: The copy of the graph
+        """
+        memo = {}
+        new = self._clone(memo)
+        self._clone_classes(new, memo)
+        return new
+
+    def _clone(self, memo):
+        """Copies the graph's nodes and edges, for __copy__
+
+        Args:
+            memo (dict): Maps the graph's objects to their copies
+                Graphs that share nodes, such as blocks, share their copies
+
+        Returns:
+            ExpressionGraph: The copy of the graph
+        """
+        new = self.__class__.__new__(self.__class__)
+        memo[self] = new
+        # networkx's own state, and views it caches, are built afresh
+        nx.DiGraph.__init__(new)
+        state = self.__dict__
+        new.__dict__.update(
+            (k, v)
+            for k, v in state.items()
+            if k not in new.__dict__ and not hasattr(nx.DiGraph, k)
+        )
+
+        # Copy the nodes, and then their families
+        created = [n for n in state["_node"] if n not in memo]
+        for n in created:
+            memo[n] = n._clone(memo)
+        for n in created:
+            copy = memo[n]
+            copy.parent = memo.get(n.parent)
+            copy.children = [None if c is None else memo[c] for c in n]
+            copy.graph = memo.get(n.graph, n.graph)
+
+        # Copy networkx's dicts, sharing edge data between _succ and _pred
+        new.graph = state["graph"].copy()
+        new._node = {memo[n]: attr.copy() for n, attr in state["_node"].items()}
+        succ = {memo[n]: {} for n in state["_adj"]}
+        pred = {memo[n]: {} for n in state["_pred"]}
+        for n, edges in state["_adj"].items():
+            for c, data in edges.items():
+                data = {
+                    k: v.copy() if isinstance(v, list) else v
+                    for k, v in data.items()
+                }
+                succ[memo[n]][memo[c]] = pred[memo[c]][memo[n]] = data
+        new._adj = new._succ = succ
+        new._pred = pred
+
+        new._timing = None
+        new._journal = None
+        new._rows = {d: {memo[n] for n in r} for d, r in self._rows.items()}
+        new._extra_nets = self._extra_nets.copy()
+        new.in_extras = self.in_extras.copy()
+        new.out_extras = self.out_extras.copy()
+        new.blocks = [
+            None if b is None else b._clone(memo) for b in self.blocks
+        ]
+        return new
+
+    def _clone_classes(self, new, memo):
+        """Copies the equivalence classes of copied nodes, for __copy__"""
+        for n, copy in list(memo.items()):
+            if isinstance(n, ExpressionNode) and n._equiv_class is not None:
+                copy._equiv_class = n._equiv_class._clone(memo)
+
     def add_node(self, node, **attr):
         """Adds a node to the graph
 
@@ -103,7 +199,8 @@ class ExpressionGraph(nx.DiGraph):
             raise TypeError("Node must be an ExpressionNode")
 
         # Add GraphViz attributes
-        kwargs = node.node_data
+        # The node's definition is shared, so only these are stored per node
+        kwargs = dict(node.node_data.graphviz)
         kwargs.update(attr)
         kwargs["shape"] = kwargs.get("shape", "square")
         kwargs["fillcolor"] = kwargs.get("fillcolor", "white")
@@ -111,12 +208,16 @@ class ExpressionGraph(nx.DiGraph):
         kwargs["style"] = kwargs.get("style", "filled")
         kwargs["pos"] = "{0},{1}!".format(node.x_pos * -1, node.y_pos * -1)
 
-        kwargs["verilog"] = wrap_quotes(kwargs.get("verilog", ""))
-        kwargs["vhdl"] = wrap_quotes(kwargs.get("vhdl", ""))
-
         # Add the node to the graph
+        if self._journal is not None:
+            self._journal._save_node(node)
+            self._journal._save_edges(node)
         node.graph = self
         super().add_node(node, **kwargs)
+        self._rows.setdefault(node.y_pos, set()).add(node)
+        self._version += 1
+        if self._timing is not None:
+            self._timing._touch(node)
         return node
 
     def remove_node(self, node):
@@ -140,9 +241,60 @@ class ExpressionGraph(nx.DiGraph):
                 self.remove_edge(node, child)
 
         # Remove the node from the graph
+        if self._journal is not None:
+            self._journal._save_order()
+            self._journal._save_node(node)
+            for n in [
+                node,
+                *self._adj.get(node, ()),
+                *self._pred.get(node, ()),
+            ]:
+                self._journal._save_edges(n)
         super().remove_node(node)
+        self._move_row(node, node.y_pos, None)
+        self._version += 1
+        if self._timing is not None:
+            self._timing._touch(node)
         return node
 
+    def _move_row(self, node, old_depth, new_depth):
+        """Moves a node between rows of the graph's depth index
+
+        Args:
+            node (ExpressionNode): The node to move
+            old_depth (int): The depth the node is currently indexed at
+            new_depth (int): The new depth of the node; None to drop it
+        """
+        if self._journal is not None:
+            self._journal._save_node(node)
+        row = self._rows.get(old_depth)
+        if row is None or node not in row:
+            return
+        row.discard(node)
+        if not row:
+            del self._rows[old_depth]
+        if new_depth is not None:
+            self._rows.setdefault(new_depth, set()).add(node)
+
+    def _shift_rows(self, node, delta):
+        """Moves the subtree rooted at a node down by delta rows"""
+        rows = self._rows
+        journal = self._journal
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            depth = n._y_pos
+            if journal is not None:
+                journal._save_node(n)
+            row = rows.get(depth)
+            if row is not None and n in row:
+                row.discard(n)
+                if not row:
+                    del rows[depth]
+                rows.setdefault(depth + delta, set()).add(n)
+            n._y_pos = depth + delta
+            stack.extend(c for c in n.children if c is not None)
+
     def add_edge(self, parent, pin1, child, pin2):
         """Adds a directed edge to the graph, from parent to child
 
@@ -159,17 +311,56 @@ class ExpressionGraph(nx.DiGraph):
             raise TypeError("Node2 must be an ExpressionNode")
 
         # Connect the nodes
-        proposed_net_name = "$n{0}_{1}".format(self.next_net, self.name)
-        net_name = parent.add_child(child, pin1, pin2, proposed_net_name)
-        if proposed_net_name == net_name:
+        if self._journal is not None:
+            self._journal._save_edges(parent)
+            self._journal._save_edges(child)
+        net_name = self._connect(parent, pin1, child, pin2)
+        kwargs = self._edge_attributes(child, [pin1], [pin2], [net_name])
+
+        # If the two nodes are already connnected, simply update the pins
+        if self.has_edge(parent, child):
+            edge_data = self.get_edge_data(parent, child, default=kwargs)
+            if self._journal is not None:
+                self._journal._save_edge_data(edge_data)
+            edge_data["ins"].append(pin1)
+            edge_data["outs"].append(pin2)
+            edge_data["edge_nets"].append(net_name)
+        else:
+            # Add the edge to the graph
+            super().add_edge(parent, child, **kwargs)
+
+        return self.get_edge_data(parent, child)
+
+    def _connect(self, parent, pin1, child, pin2, update_leafs=True):
+        """Connects a pin of a child to a pin of its parent
+
+        Returns:
+            int: The net connecting the pins, which is created if needed
+        """
+        self._version += 1
+        if self._timing is not None:
+            self._timing._touch(parent)
+            self._timing._touch(child)
+        if self._journal is not None:
+            self._journal._save_path(parent)
+            self._journal._save_node(child)
+        proposed_net = self.nets.next_net()
+        net_name = parent.add_child(
+            child, pin1, pin2, proposed_net, update_leafs
+        )
+        if proposed_net == net_name:
+            self.nets.add_net(self.name, self.next_net)
             self.next_net += 1
+        return net_name
 
+    def _edge_attributes(self, child, ins, outs, nets):
+        """Returns the attributes of a new edge towards a child"""
         # Styles the edge for GraphViz visualization
         kwargs = {
             "arrowhead": "none",
-            "ins": [pin1],
-            "outs": [pin2],
-            "edge_nets": [net_name],
+            "ins": ins,
+            "outs": outs,
+            "edge_nets": nets,
         }
 
         # Initialize weight to parasitc delay
@@ -177,18 +368,48 @@ class ExpressionGraph(nx.DiGraph):
         kwargs["fanout"] = 1
         kwargs["delay"] = child.node_data["pd"]
         kwargs["weight"] = kwargs["delay"]
+        return kwargs
 
-        # If the two nodes are already connnected, simply update the pins
-        if self.has_edge(parent, child):
-            edge_data = self.get_edge_data(parent, child, default=kwargs)
-            edge_data["ins"].append(pin1)
-            edge_data["outs"].append(pin2)
-            edge_data["edge_nets"].append(net_name)
-        else:
-            # Add the edge to the graph
-            super().add_edge(parent, child, **kwargs)
+    def _attach(self, parent, pin_pairs, child):
+        """Connects a child to its parent, like add_edge, but faster
 
-        return self.get_edge_data(parent, child)
+        The edge is added to networkx's adjacency directly, and the leafs of
+        the nodes are left to the caller.
+
+        Args:
+            parent (ExpressionNode): The parent node
+            pin_pairs (list of (tuple, tuple)): The pins to connect
+            child (ExpressionNode): The child node
+        """
+        nets = [
+            self._connect(parent, pin1, child, pin2, update_leafs=False)
+            for pin1, pin2 in pin_pairs
+        ]
+        data = self._edge_attributes(
+            child, [x[0] for x in pin_pairs], [x[1] for x in pin_pairs], nets
+        )
+        if self._journal is not None:
+            self._journal._save_edges(parent)
+            self._journal._save_edges(child)
+        self._succ[parent][child] = self._pred[child][parent] = data
+
+    def _detach(self, parent, child):
+        """Disconnects a child from its parent, like remove_edge, but faster
+
+        See _attach.
+        """
+        self._version += 1
+        if self._timing is not None:
+            self._timing._touch(parent)
+            self._timing._touch(child)
+        if self._journal is not None:
+            self._journal._save_path(parent)
+            self._journal._save_node(child)
+            self._journal._save_edges(parent)
+            self._journal._save_edges(child)
+        parent.remove_child(child, update_leafs=False)
+        del self._succ[parent][child]
+        del self._pred[child][parent]
 
     def remove_edge(self, parent, child):
         """Removes an edge from the graph
@@ -209,7 +430,16 @@ class ExpressionGraph(nx.DiGraph):
         edge_data = self.get_edge_data(parent, child)
 
         # Remove the edge from the graph
+        if self._journal is not None:
+            self._journal._save_edges(parent)
+            self._journal._save_edges(child)
+            self._journal._save_path(parent)
+            self._journal._save_node(child)
         super().remove_edge(parent, child)
+        self._version += 1
+        if self._timing is not None:
+            self._timing._touch(parent)
+            self._timing._touch(child)
 
         # Remove the edge from the nodes
         parent.remove_child(child)
@@ -350,7 +580,7 @@ class ExpressionGraph(nx.DiGraph):
         return
 
     def _get_internal_nets(self, null_flag=False):
-        """Returns the internal nets of the graph"""
+        """Returns the internal nets of the graph, as interned nets"""
 
         # Compatibility issue
         if null_flag:
@@ -365,10 +595,10 @@ class ExpressionGraph(nx.DiGraph):
             # Ignore any nodes that are not the representative of their class
             if node.equiv_class.rep is not node:
                 continue
-            for net in node.in_nets.values():
-                in_nets.update([parse_net(x) for x in net])
+            for net in node._resolved_in_nets().values():
+                in_nets.update(net)
             for net in node.out_nets.values():
-                out_nets.update([parse_net(x) for x in net])
+                out_nets.update(net)
 
         # Get the nets from blocks
         for block in [x for x in self.blocks if x is not None]:
@@ -387,11 +617,20 @@ class ExpressionGraph(nx.DiGraph):
             out_ports = []
         in_extras = [x[0][0] for x in self.in_extras]
         out_extras = [x[0][0] for x in self.out_extras]
-        all_ports = in_ports + out_ports + in_extras + out_extras
-        in_nets = [x for x in in_nets if x.split("[")[0] not in all_ports]
-        out_nets = [x for x in out_nets if x.split("[")[0] not in all_ports]
+        all_ports = set(in_ports + out_ports + in_extras + out_extras)
+        extras = self._extra_nets
+        in_nets = {
+            x
+            for x in in_nets
+            if x not in extras and net_port(x) not in all_ports
+        }
+        out_nets = {
+            x
+            for x in out_nets
+            if x not in extras and net_port(x) not in all_ports
+        }
 
-        return (set(in_nets), set(out_nets))
+        return (in_nets, out_nets)
 
     def _get_ports(self):
         """Returns the ports of the graph"""
@@ -411,6 +650,8 @@ class ExpressionGraph(nx.DiGraph):
 
         # Form the ports
         # Assume that all these retrieved nets are 1-bit
+        in_ports = [parse_net(x) for x in sorted(in_ports, key=net_sort_key)]
+        out_ports = [parse_net(x) for x in sorted(out_ports, key=net_sort_key)]
         in_internal = [(sub_brackets(x), 1) for x in in_ports]
         in_external = list(in_ports)
         in_ports = [(x, y) for x, y in zip(in_internal, in_external)]
@@ -421,18 +662,14 @@ class ExpressionGraph(nx.DiGraph):
 
         return (in_ports + self.in_extras, out_ports + self.out_extras)
 
-    def _prepare_for_hdl(
-        self,
-        mapping="behavioral",
-        language="verilog",
-        uniquify_names=True,
-    ):
+    def _prepare_for_hdl(self, language="verilog", uniquify_names=True):
         """Prepares the graph for HDL generation
 
-        Note that this process may destructively render the graph unusable
+        The graph is prepared only once, and mappings are only merged into
+        its cells as they are rendered, so that the same graph can be
+        rendered with any number of mappings.
 
         Args:
-            mapping (str): The cell mapping to use for the HDL generation
             language (str): The language in which to generate the HDL
             uniquify_names (str): Whether wire/instance must be uniquified
         """
@@ -444,28 +681,11 @@ class ExpressionGraph(nx.DiGraph):
         if language not in ["verilog"]:
             raise ValueError("Unsupported hardware-descriptive language")
 
-        # Set language-specific syntax
-        syntax = hdl_syntax[language]
-
-        # Merge in mapping file, if requested
-        if self.merge_mapping:
-            # Parse the mapping file
-            file_suffix = syntax["file_extension"]
-            map_file = "{0}_map{1}".format(mapping, file_suffix)
-            map_path = respath("pptrees.mappings", map_file)
-            with map_path as pkg_map_file:
-                mapping_dict = parse_mapping(pkg_map_file)
-            # Merge mapping info into the nodes
-            for node in self:
-                node_hdl = node.hdl(language=language)
-                node_hdl = node.node_data[language]
-                node_hdl = merge_mapping_into_cells(node_hdl, mapping_dict)
-                node.node_data[language] = node_hdl
-
         # Uniquify wire/instance names, if requested
         if uniquify_names:
-            increment_iname(self.nodes(), 1, language)
-            increment_wname(self.nodes(), 1, language)
+            self.next_iname, self.next_wname = reserve_names(
+                self.nodes(), self.next_iname, self.next_wname, language
+            )
 
         # Generate the list of extra nets caused by equivalence classes
         in_extras = []
@@ -476,33 +696,34 @@ class ExpressionGraph(nx.DiGraph):
             # and the node is not part of a bigger equivalent subtree,
             # bring up its internal wires to the top level
             if (
-                any([x not in self for x in node.equiv_class])
+                any(x not in self for x in node.equiv_class)
                 and node.parent.equiv_class.rep is node.parent
             ):
 
                 # If this node is the representative, its wires become outputs
                 if node.equiv_class.rep is node:
                     out_extras += [
-                        parse_net(wire)
+                        wire
                         for net in node.equiv_class.out_nets.values()
                         for wire in net
                     ]
                 # Otherwise, its wires become inputs
                 else:
                     in_extras += [
-                        parse_net(wire)
+                        wire
                         for net in node.equiv_class.out_nets.values()
                         for wire in net
                     ]
         # Format the list of extra nets caused by equivalence classes
+        self._extra_nets = set(in_extras + out_extras)
+        in_extras = [parse_net(x) for x in in_extras]
+        out_extras = [parse_net(x) for x in out_extras]
         self.in_extras = [((sub_brackets(x), 1), x) for x in in_extras]
         self.out_extras = [((sub_brackets(x), 1), x) for x in out_extras]
 
         # Toggle the prepared flag
         self._prepared = True
 
-    # NOTE: This function fails flake8 C901
-    # TO-DO: Make this function pass flake8 C901
     def hdl(
         self,
         out=None,
@@ -521,6 +742,7 @@ class ExpressionGraph(nx.DiGraph):
             out (str): The file to write the HDL to
             mapping (str): The cell mapping to use for the HDL generation
             language (str): The language in which to generate the HDL
+                Other languages are written from the flat netlist; see netlist
             flat (bool): If True, flatten the graph's HDL
             module_name (str): The name of the module to generate
             uniquify_names (str): Whether wire/instance must be uniquified
@@ -533,24 +755,313 @@ class ExpressionGraph(nx.DiGraph):
             list: Set of HDL module definitions used in the graph
 
         """
-        self._prepare_for_hdl(
+        # Other languages are written from the graph's flat netlist
+        if language != "verilog":
+            netlist = self.netlist()
+            return self._netlist_hdl(
+                netlist, out, mapping, language, module_name
+            )
+
+        hdl, module_defs, module_def = self._module_hdl(
             mapping=mapping,
             language=language,
+            flat=flat,
+            module_name=module_name,
             uniquify_names=uniquify_names,
+            description_string=description_string,
+            hdl_comments=hdl_comments,
+            inst_id=inst_id,
+        )
+
+        # If flat HDL is desired, there is no module definition
+        if flat:
+            return hdl, module_defs, hdl
+
+        file_out_hdl = "".join(self._hdl_file(module_def, module_defs))
+
+        # Write the HDL to file
+        if out is not None:
+            self._write_hdl(file_out_hdl, out)
+
+        return hdl, module_defs, file_out_hdl
+
+    def hdl_mappings(self, mappings, out=None, max_workers=0, **kwargs):
+        """Creates the HDL of the graph for each of several mappings
+
+        The graph is prepared for HDL only once. Rendering its HDL leaves it
+        untouched, so that the mappings after the first can be rendered in
+        parallel threads.
+
+        Args:
+            mappings (list of str): The cell mappings to use
+            out (str): The file to write each HDL to
+                This must contain '{mapping}', to be replaced by the mapping
+            max_workers (int): The number of threads to render mappings in
+                If this is 0, mappings are rendered in this thread
+            **kwargs: Further arguments to hdl
+
+        Returns:
+            dict: Maps each mapping to its HDL file, as returned by hdl
+        """
+        mappings = list(mappings)
+        if out is not None and "{mapping}" not in str(out):
+            raise ValueError("Output path must contain '{mapping}'")
+
+        def render(mapping):
+            path = None if out is None else str(out).format(mapping=mapping)
+            return self.hdl(out=path, mapping=mapping, **kwargs)[2]
+
+        # The first mapping prepares the graph, which threads then share
+        ret = {}
+        if mappings:
+            ret[mappings[0]] = render(mappings[0])
+        if max_workers == 0:
+            for mapping in mappings[1:]:
+                ret[mapping] = render(mapping)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                ret.update(zip(mappings[1:], pool.map(render, mappings[1:])))
+        return ret
+
+    def netlist(self):
+        """Lowers the graph to a flat netlist, which all HDL writers share
+
+        The netlist is cached until the graph's structure changes.
+
+        Returns:
+            Netlist: The netlist of the graph
+        """
+        if self._netlist is None or self._netlist[0] != self._version:
+            self._netlist = (self._version, Netlist(self))
+        return self._netlist[1]
+
+    def _netlist_hdl(self, netlist, out, mapping, language, module_name):
+        """Writes a netlist as HDL, in the format returned by hdl"""
+        hdl = netlist.hdl(mapping, language, module_name)
+        if out is not None:
+            self._write_hdl(hdl, out)
+        return hdl, set(), hdl
+
+    def aiger(self, out=None):
+        """Exports the graph's logic as a binary AIGER file
+
+        Args:
+            out (str): The file to write the AIGER to
+
+        Returns:
+            bytes: The contents of the AIGER file
+        """
+        aig = self.netlist().aiger()
+        if out is not None:
+            self._write_hdl(aig, out)
+        return aig
+
+    def blif(self, out=None, module_name=None):
+        """Exports the graph's logic as a BLIF model
+
+        Args:
+            out (str): The file to write the BLIF to
+            module_name (str): The name of the model
+
+        Returns:
+            str: The BLIF model
+        """
+        blif = self.netlist().blif(module_name)
+        if out is not None:
+            self._write_hdl(blif, out)
+        return blif
+
+    def iter_hdl(
+        self,
+        mapping="behavioral",
+        language="verilog",
+        module_name=None,
+        uniquify_names=True,
+        description_string="start of unnamed graph",
+        hdl_comments=True,
+    ):
+        """Yields the HDL file of the graph, in chunks as it is generated
+
+        The graph's module is yielded one node or block instance at a time,
+        followed by the module definitions of its blocks. The chunks join up
+        to the file that hdl creates.
+
+        Args:
+            mapping (str): The cell mapping to use for the HDL generation
+            language (str): The language in which to generate the HDL
+            module_name (str): The name of the module to generate
+            uniquify_names (str): Whether wire/instance must be uniquified
+            description_string (str): String commend to prepend to the HDL
+            hdl_comments (bool): Whether to include comments in the HDL
+
+        Yields:
+            str: The next chunk of the HDL file
+        """
+        self._prepare_for_hdl(language=language, uniquify_names=uniquify_names)
+
+        # Update module name, if provided
+        if module_name is None:
+            module_name = self.name
+
+        module_defs = set()
+        yield from self._stream_module(
+            module_name,
+            language,
+            self._module_body(
+                mapping,
+                language,
+                False,
+                module_name,
+                description_string,
+                hdl_comments,
+                module_defs,
+            ),
         )
 
+        # The graph's own module is not among those of its blocks
+        for x in sorted(module_defs, key=natural_keys):
+            yield x
+
+    def write_hdl(self, out, compress=None, **kwargs):
+        """Streams the HDL file of the graph to a file, as it is generated
+
+        The graph's module is written one node at a time, so that only the
+        module definitions of the graph's blocks are held in memory.
+
+        Args:
+            out (str or file): The path or file object to write the HDL to
+                File objects must be binary if the HDL is compressed
+            compress (bool): Whether to compress the HDL with gzip
+                By default, paths ending in '.gz' are compressed
+            **kwargs: Further arguments to iter_hdl
+        """
+        if isinstance(out, (str, pathlib.Path)):
+            outdir = pathlib.Path(out).resolve().parent
+            if not outdir.exists():
+                raise ValueError("Output path does not exist")
+            if compress is None:
+                compress = str(out).endswith(".gz")
+        if compress:
+            f = gzip.open(out, "wt")
+        elif isinstance(out, (str, pathlib.Path)):
+            f = open(out, "w")
+        else:
+            # File objects are left open
+            for chunk in self.iter_hdl(**kwargs):
+                out.write(chunk)
+            return
+        with f as stream:
+            for chunk in self.iter_hdl(**kwargs):
+                stream.write(chunk)
+
+    def _module_hdl(
+        self,
+        mapping="behavioral",
+        language="verilog",
+        flat=False,
+        module_name=None,
+        uniquify_names=True,
+        description_string="start of unnamed graph",
+        hdl_comments=True,
+        inst_id="U0",
+    ):
+        """Creates the HDL of the graph's module; see hdl
+
+        Returns:
+            str: HDL instance of the graph's module, or the flat HDL
+            set: Set of HDL module definitions used in the graph
+            str: HDL module definition of the graph, or None if flat
+        """
+        self._prepare_for_hdl(language=language, uniquify_names=uniquify_names)
+
         # Update module name, if provided
         if module_name is None:
             module_name = self.name
 
+        module_defs = set()
+        hdl = "".join(
+            self._module_body(
+                mapping,
+                language,
+                flat,
+                module_name,
+                description_string,
+                hdl_comments,
+                module_defs,
+            )
+        )
+
+        # If flat HDL is desired, it can returned here
+        if flat:
+            return hdl, module_defs, None
+
+        # Otherwise, return the HDL module definition
+        return self._wrap_hdl(hdl, module_defs, language, module_name, inst_id)
+
+    # NOTE: This function fails flake8 C901
+    # TO-DO: Make this function pass flake8 C901
+    def _module_body(
+        self,
+        mapping,
+        language,
+        flat,
+        module_name,
+        description_string,
+        hdl_comments,
+        module_defs,
+    ):
+        """Yields the body of the graph's module, one chunk at a time
+
+        The graph must already be prepared for HDL. The module definitions of
+        its blocks are added to module_defs, as the blocks are instantiated.
+        """
+        # Look up the mapping, which is only parsed once per process
+        mapping_dict = None
+        if self.merge_mapping:
+            mapping_dict = load_mapping(mapping, language)
+
         # Set language-specific syntax
         syntax = hdl_syntax[language]
 
-        # Create the HDL
-        hdl = ""
-        module_defs = set()
+        ### NOTE: Is this general? Improvements wanted
+        ### In general, hard-coding an is_block flag sounds like a bad idea
+        is_block = next(iter(self.nodes)).graph is not self
+
+        # If the graph is a block, then it has individual ports
+        # for each bit of every input and output port.
+        # So the HDL should reflect through judicious use of net name fixing
+        (in_ports, out_ports) = self._get_ports()
+        cell_subs = None
+        if is_block and not flat:
+            cell_subs = {a[1]: a[0][0] for a in in_ports + out_ports}
+
+        def finish(hdl, cell=True):
+            if cell and cell_subs is not None:
+                hdl = sub_tokens(hdl, cell_subs)
+            # Flat HDL refers to the ports of the enclosing module
+            if flat:
+                hdl = sub_ports(hdl, in_ports + out_ports)
+            return hdl
+
+        if hdl_comments:
+            yield finish(
+                syntax["comment_string"] + description_string + "\n", False
+            )
+
+        # Add wire definitions
+        # But if this graph is a block,
+        # all wires that are inputs into the module are not internal
+        # all wires that are outputs from from the cells are not internal
+        # therefore, no wires are internal
+        in_wires, out_wires = self._get_internal_nets(null_flag=is_block)
+        wires = in_wires | out_wires
+        wires = [parse_net(x) for x in sorted(wires, key=net_sort_key)]
+        if len(wires) > 0:
+            wire_hdl = syntax["wire_def"].format(", ".join(wires))
+            yield finish("\t" + wire_hdl + "\n", False)
 
         # Pull in the HDL description of blocks
+        # Their instances are named after those of the graph's cells
         block_ctr = 0
         for block_id in range(len(self.blocks)):
             # Skip non-existent blocks
@@ -561,7 +1072,7 @@ class ExpressionGraph(nx.DiGraph):
             # Provide support for not merging in the mapping file
             block.merge_mapping = self.merge_mapping
             # Get block HDL and add it to master HDL
-            block_hdl, block_defs, _ = block.hdl(
+            block_hdl, block_defs, _ = block._module_hdl(
                 mapping=mapping,
                 language=language,
                 flat=flat,
@@ -569,11 +1080,11 @@ class ExpressionGraph(nx.DiGraph):
                 uniquify_names=False,
                 description_string="block {0}".format(block_id),
                 hdl_comments=hdl_comments,
-                inst_id="U{0}".format(block_ctr),
+                inst_id="U{0}".format(self.next_iname + block_ctr),
             )
-            hdl += block_hdl
             module_defs.update(block_defs)
             block_ctr += 1
+            yield finish(block_hdl)
 
         # Pull in the HDL description of nodes
         for node in self:
@@ -584,57 +1095,7 @@ class ExpressionGraph(nx.DiGraph):
             if not usable:
                 if node.graph.blocks[node.block] is not self:
                     continue
-            # Get node HDL and add it to master HDL
-            node_hdl = node.hdl(language=language)
-            hdl += node_hdl
-
-        ### NOTE: Is this general? Improvements wanted
-        ### In general, hard-coding an is_block flag sounds like a bad idea
-        is_block = list(self.nodes)[0].graph is not self
-
-        # If the graph is a block, then it has individual ports
-        # for each bit of every input and output port.
-        # So the HDL should reflect through judicious use of net name fixing
-        if is_block and not flat:
-            (in_ports, out_ports) = self._get_ports()
-            for a in in_ports + out_ports:
-                hdl = hdl.replace(a[1], a[0][0])
-
-        # Add wire definitions
-        # But if this graph is a block,
-        # all wires that are inputs into the module are not internal
-        # all wires that are outputs from from the cells are not internal
-        # therefore, no wires are internal
-        in_wires, out_wires = self._get_internal_nets(null_flag=is_block)
-        wires = in_wires | out_wires
-        wires = sorted(list(wires), key=natural_keys)
-        if len(wires) > 0:
-            wire_hdl = syntax["wire_def"].format(", ".join(wires))
-        else:
-            wire_hdl = ""
-
-        # Assemble the HDL
-        if wire_hdl:
-            hdl = "\t" + wire_hdl + "\n" + hdl
-        if hdl_comments:
-            hdl = syntax["comment_string"] + description_string + "\n" + hdl
-
-        # If flat HDL is desired, it can returned here
-        if flat:
-            (in_ports, out_ports) = self._get_ports()
-            hdl = sub_ports(hdl, in_ports + out_ports)
-            return hdl, module_defs, hdl
-
-        # Otherwise, return the HDL module definition
-        hdl, module_defs, file_out_hdl = self._wrap_hdl(
-            hdl, module_defs, language, module_name, inst_id
-        )
-
-        # Write the HDL to file
-        if out is not None:
-            self._write_hdl(file_out_hdl, out)
-
-        return hdl, module_defs, file_out_hdl
+            yield finish(node.hdl(language=language, mapping=mapping_dict))
 
     def _wrap_hdl(
         self,
@@ -644,7 +1105,13 @@ class ExpressionGraph(nx.DiGraph):
         module_name=None,
         inst_id="U0",
     ):
-        """Wraps the HDL in a module definition"""
+        """Wraps the HDL in a module definition
+
+        Returns:
+            str: HDL instance of the module
+            set: Set of HDL module definitions, including this module's
+            str: HDL module definition
+        """
 
         # If flat HDL is not desired, wrap the graph in a module
         ## First get in_ports and out_ports
@@ -656,16 +1123,53 @@ class ExpressionGraph(nx.DiGraph):
         ## Then create the architecture
         arch = hdl_arch(module_name, hdl, language)
         ## Add the entity and architecture to the module_defs
-        formatted_defs = sorted(list(module_defs), key=natural_keys)
-        file_out_hdl = entity + arch + "".join(formatted_defs)
-        module_defs.add(entity + arch)
+        module_def = entity + arch
+        module_defs.add(module_def)
         ## Create an instance of the module
+        hdl = self._hdl_inst(module_name, inst_id, language)
+
+        return hdl, module_defs, module_def
+
+    def _stream_module(self, module_name, language, chunks):
+        """Wraps the chunks of a module's body in its definition, as they come
+
+        The chunks join up to the module definition that _wrap_hdl creates.
+        """
+        (in_ports, out_ports) = self._get_ports()
+        entity = hdl_entity(
+            module_name,
+            [x[0] for x in in_ports],
+            [x[0] for x in out_ports],
+            language,
+        )
+        head, tail = hdl_arch_parts(module_name, language)
+
+        # The last chunk of the body is held back, to be closed as hdl_arch
+        last = entity + head
+        for chunk in chunks:
+            # Nodes without logic have no HDL
+            if not chunk:
+                continue
+            yield last
+            last = chunk
+        if last[-1] == "\n":
+            last = last[:-1]
+        yield last + tail
+
+    def _hdl_inst(self, module_name, inst_id="U0", language="verilog"):
+        """Returns an HDL instance of the graph's module"""
+        (in_ports, out_ports) = self._get_ports()
         inst_ports = [[x[0][0], x[1]] for x in in_ports + out_ports]
-        inst = hdl_inst(inst_id, module_name, inst_ports, language)
-        ## Add the instance to the HDL
-        hdl = inst
+        return hdl_inst(inst_id, module_name, inst_ports, language)
 
-        return hdl, module_defs, file_out_hdl
+    def _hdl_file(self, module_def, module_defs):
+        """Yields the module definitions of the graph's HDL file, in order
+
+        The graph's own module comes first, then all others in natural order.
+        """
+        yield module_def
+        for x in sorted(module_defs - {module_def}, key=natural_keys):
+            yield x
 
     def _write_hdl(
         self,
@@ -681,7 +1185,7 @@ class ExpressionGraph(nx.DiGraph):
         if not outdir.exists():
             raise ValueError("Output path does not exist")
 
-        with open(out, "w") as f:
+        with open(out, "wb" if isinstance(file_out_hdl, bytes) else "w") as f:
             f.write(file_out_hdl)
 
 
@@ -1,6 +1,83 @@
+from functools import lru_cache
+
 from .EquivClass import EquivClass
+from .NetTable import parse_net
 from .node_data import node_data
-from .util import change_in_nets, lg, parse_net, verso_pin
+from .NodeDef import NodeDef
+from .util import (
+    change_in_nets,
+    hdl_identifier,
+    hdl_names,
+    lg,
+    merge_mapping_into_cells,
+)
+
+
+@lru_cache(maxsize=4096)
+def _cells_template(hdl_def, pins):
+    """Compiles the cells of a node's HDL definition into a template
+
+    Only the instantiated cells, assignments and wires are kept. Pins become
+    slots to be filled with the nets of an instance's pins, and the names of
+    instances and wires become slots to be filled with unique names.
+
+    Args:
+        hdl_def (str): The HDL definition of the node
+        pins (tuple of (str, int)): The names and widths of the node's pins
+
+    Returns:
+        tuple: Literal strings, (pin, index) slots for nets,
+            and (prefix, index, name) slots for instance and wire names
+    """
+    ### Grab only instantiated cells from the HDL definiton
+
+    # Flag whether we're currently looking at a cell
+    in_std_cell = False
+
+    # Store the filtered HDL lines
+    lines = []
+
+    for line in hdl_def.splitlines():
+        if "assign" in line or "wire" in line:
+            lines.append(line + "\n")
+        else:
+            if "U" in line:
+                in_std_cell = True
+            if in_std_cell:
+                lines.append(line + "\n")
+            if line != "" and line[-1] == ";":
+                in_std_cell = False
+    cells = "".join(lines)
+
+    # Split the cells around each pin and name
+    widths = dict(pins)
+    names = hdl_names(hdl_def)
+    template = []
+    start = 0
+    for match in hdl_identifier.finditer(cells):
+        name, bit = match.groups()
+        if name in names:
+            template.append(cells[start : match.start()])
+            template.append((name[0], names[name], name))
+            start = match.end(1)
+            continue
+        width = widths.get(name)
+        if width is None:
+            continue
+        if width == 1:
+            # Single-bit pins keep any bit select they are given
+            template.append(cells[start : match.start()])
+            template.append((name, 0))
+            start = match.end(1)
+        elif bit is not None:
+            # Multi-bit pins are listed most-significant bit first
+            index = width - int(bit[1:-1]) - 1
+            if 0 <= index < width:
+                template.append(cells[start : match.start()])
+                template.append((name, index))
+                start = match.end()
+    template.append(cells[start:])
+    return tuple(template)
 
 
 class ExpressionNode:
@@ -12,7 +89,7 @@ class ExpressionNode:
             and the first child is leftmost
         parent (ExpressionNode): The parent node
         value (str): The value of the node; a module name
-        node_data (dict): The data associated with the node
+        node_data (NodeDef): The definition of the node, shared by its type
         leafs (int): A binary encoding of all leafs reachable from this node
         graph (ExpressionGraph): The graph this node belongs to
         block (int): The block number of this node's HDL (if applicable)
@@ -21,8 +98,26 @@ class ExpressionNode:
         x_pos (float): The x-coordinate of this node's graphical representation
         y_pos (float): The y-coordinate of this node's graphical representation
         equiv_class (EquivClass): The equivalence class of this node
+            This is only created once it is needed
     """
 
+    __slots__ = (
+        "value",
+        "node_data",
+        "children",
+        "parent",
+        "in_nets",
+        "out_nets",
+        "leafs",
+        "_height",
+        "graph",
+        "block",
+        "_equiv_class",
+        "name_offsets",
+        "x_pos",
+        "_y_pos",
+    )
+
     def __init__(self, value, x_pos=0, y_pos=0, custom_data=None):
         """Initializes a new ExpressionNode
 
@@ -40,13 +135,10 @@ class ExpressionNode:
 
         # Node attributes
         self.value = value
-        ### NOTE: This is not a deepcopy
-        ### This is done for performance purposes.
-        ### It causes no problems, for now.
         if custom_data is None:
-            self.node_data = node_data[value].copy()
+            self.node_data = node_data[value]
         else:
-            self.node_data = custom_data.copy()
+            self.node_data = NodeDef(value, custom_data)
         self.children = []
         self.parent = None
 
@@ -56,9 +148,13 @@ class ExpressionNode:
 
         # Graph-related attributes
         self.leafs = 0
+        self._height = None
         self.graph = None
         self.block = None
-        self.equiv_class = EquivClass(self)
+        self._equiv_class = None
+
+        # First numbers of the node's instance and wire names, once unique
+        self.name_offsets = None
 
         # Visualization-related attributes
         ### NOTE: The use of these attributes is no longer restricted to
@@ -66,7 +162,32 @@ class ExpressionNode:
         ### role in the function of the library. Code rot has begun to
         ### set in before the official release of V1.0
         self.x_pos = x_pos
-        self.y_pos = y_pos
+        self._y_pos = y_pos
+
+    @property
+    def equiv_class(self):
+        """The equivalence class of this node, created on first use"""
+        if self._equiv_class is None:
+            self._equiv_class = EquivClass(self)
+            if self.parent is not None:
+                self._equiv_class.parents.add(self.parent)
+        return self._equiv_class
+
+    @equiv_class.setter
+    def equiv_class(self, value):
+        self._equiv_class = value
+
+    @property
+    def y_pos(self):
+        """The y-coordinate of this node's graphical representation"""
+        return self._y_pos
+
+    @y_pos.setter
+    def y_pos(self, value):
+        """Moves this node to another row of its graph's depth index"""
+        if self.graph is not None:
+            self.graph._move_row(self, self._y_pos, value)
+        self._y_pos = value
 
     def __str__(self):
         """Returns a string representation of this node"""
@@ -79,10 +200,16 @@ class ExpressionNode:
         )
 
     def __len__(self):
-        """Returns the height of the subtree rooted at this node"""
-        if not self.children:
-            return 0
-        return 1 + max([len(x) for x in self])
+        """Returns the height of the subtree rooted at this node
+
+        The height is cached, and invalidated by _recalculate_leafs
+        """
+        if self._height is None:
+            if not self.children:
+                self._height = 0
+            else:
+                self._height = 1 + max([len(x) for x in self])
+        return self._height
 
     def __lt__(self, other):
         """Compares this node to another node by position in tree
@@ -110,6 +237,37 @@ class ExpressionNode:
         """Redefine __copy__"""
         return ExpressionNode(self.value)
 
+    def _clone(self, memo):
+        """Copies this node's state, but not its family, graph or class
+
+        Args:
+            memo (dict): Maps the ids of lists of nets to their copies
+                Classes share lists of nets between nodes, and so do copies
+        """
+
+        def copy_nets(nets):
+            copies = {}
+            for k, v in nets.items():
+                copy = memo.get(id(v))
+                if copy is None:
+                    copy = memo[id(v)] = v.copy()
+                copies[k] = copy
+            return copies
+
+        new = ExpressionNode.__new__(ExpressionNode)
+        new.value = self.value
+        new.node_data = self.node_data
+        new.in_nets = copy_nets(self.in_nets)
+        new.out_nets = copy_nets(self.out_nets)
+        new.leafs = self.leafs
+        new._height = self._height
+        new.block = self.block
+        new._equiv_class = None
+        new.name_offsets = self.name_offsets
+        new.x_pos = self.x_pos
+        new._y_pos = self._y_pos
+        return new
+
     def copy(self):
         """Shorthand for __copy__"""
         return self.__copy__()
@@ -205,7 +363,7 @@ class ExpressionNode:
                 return c.leftmost_leaf()
         return self
 
-    def add_child(self, child, pin1, pin2, net_name):
+    def add_child(self, child, pin1, pin2, net_name, update_leafs=True):
         """Adds a child node to this node
 
         Args:
@@ -213,6 +371,8 @@ class ExpressionNode:
             pin1 (tuple): (name, index) of the parent pin
             pin2 (tuple): (name, index) of the child pin
             net_name (str): Fall-back net name, if it does not exist
+            update_leafs (bool): Whether to recalculate the leafs of the
+                node and its ancestors
         """
 
         # Break the pins apart into names and indices
@@ -240,29 +400,35 @@ class ExpressionNode:
             except ValueError:
                 self.children.append(child)
             child.parent = self
-            child.equiv_class.parents.add(self)
+            # Classes that are not created yet will find their parent
+            if child._equiv_class is not None:
+                child._equiv_class.parents.add(self)
             # Recalculate leafs recursively
-            self._recalculate_leafs()
+            if update_leafs:
+                self._recalculate_leafs()
 
         return net_name
 
-    def remove_child(self, child):
+    def remove_child(self, child, update_leafs=True):
         """Removes a child node from this node
 
         Args:
             child (ExpressionNode): The child node to remove
+            update_leafs (bool): Whether to recalculate the leafs of the
+                node and its ancestors
         """
 
         # Remove child/parent connection
         index = self.children.index(child)
         self.children[index] = None
         child.parent = None
-        child.equiv_class.parents.discard(self)
+        if child._equiv_class is not None:
+            child._equiv_class.parents.discard(self)
 
         # Reset net names in parent (inpins only!)
         for pin_name, pins in self.in_nets.items():
             # Check if port is connected to this child
-            vrs = verso_pin(pin_name)
+            vrs = self.node_data.verso[pin_name]
             if vrs not in child.out_nets:
                 continue
             # If so, query the port pin by pin
@@ -274,7 +440,8 @@ class ExpressionNode:
                     pins[pin_index] = None
 
         # Recalculate leafs recursively
-        self._recalculate_leafs()
+        if update_leafs:
+            self._recalculate_leafs()
 
     def iter_down(self, fun):
         """Calls a function on this node and all descendants
@@ -290,8 +457,12 @@ class ExpressionNode:
     ### NOTE: THIS ASSUMES THAT PARENTS AND CHILDREN ARE FULLY CONNECTED
     ### TO-DO: Handle case of partially connected nodes
     def _recalculate_leafs(self, leafs=0):
-        """Recalculates the leafs of this node and its parents"""
+        """Recalculates the leafs of this node and its parents
+
+        This also invalidates the cached heights of the same nodes.
+        """
         self.leafs = leafs
+        self._height = None
         for c in self:
             if c is None:
                 continue
@@ -299,11 +470,16 @@ class ExpressionNode:
         if self.parent is not None:
             self.parent._recalculate_leafs()
 
-    def hdl(self, language="verilog"):
+    def hdl(self, language="verilog", mapping=None):
         """Returns the HDL of this node
 
+        The node itself is left untouched, so that it can be rendered again
+        with other mappings.
+
         Args:
             language (str): The language in which to generate the HDL
+            mapping (dict): The mapping to merge into the node's cells,
+                as returned by load_mapping
 
         Returns:
             str: The HDL of this node
@@ -312,68 +488,57 @@ class ExpressionNode:
         if language not in ["verilog"]:
             raise ValueError("Unsupported hardware descriptive language")
         if language == "verilog":
-            return self._verilog()
+            return self._verilog(mapping)
         if language == "vhdl":
             return self._vhdl()
 
-    def _verilog(self):
-        """Return Verilog consisting of the module's internal logic"""
+    def _resolved_in_nets(self):
+        """Returns the input nets of this node, as they are built in HDL
 
-        # If this node is part of an equivalence class,
-        # but not the main representative,
-        # destructively change the net names of its parent
-        if self.equiv_class.rep is not self:
-            parent = self.parent
-            # But if this node is part of a bigger equivalent subtree
-            # There is no need to even do assign statements
-            # The equivalent subtree will take care of everything
-            if parent.equiv_class.rep is not parent:
-                return ""
-            ret = ""
-            index = parent.children.index(self)
+        Children that are not the representative of their equivalence class
+        are not built, so their outputs are read from the representative.
+        """
+        in_nets = self.in_nets
+        for index, c in enumerate(self.children):
+            if c is None or c.equiv_class.rep is c:
+                continue
+            if in_nets is self.in_nets:
+                in_nets = in_nets.copy()
             change_in_nets(
-                parent, self.out_nets, self.equiv_class.out_nets, index
+                self, c.out_nets, c.equiv_class.out_nets, index, in_nets
             )
-            return ret
-
-        ### Grab only instantiated cells from the HDL definiton
+        return in_nets
 
-        # Iterate over each line in the HDL definition
-        hdl_def = self.node_data["verilog"].splitlines()
-
-        # Flag whether we're currently looking at a cell
-        in_std_cell = False
+    def _verilog(self, mapping=None):
+        """Return Verilog consisting of the module's internal logic"""
 
-        # Store the filtered HDL in a string
-        ret = ""
+        # If this node is part of an equivalence class,
+        # but not the main representative, its parent reads the class's nets
+        if self.equiv_class.rep is not self:
+            return ""
 
-        for line in hdl_def:
-            if "assign" in line or "wire" in line:
-                ret += line + "\n"
-            else:
-                if "U" in line:
-                    in_std_cell = True
-                if in_std_cell:
-                    ret += line + "\n"
-                if line != "" and line[-1] == ";":
-                    in_std_cell = False
-
-        # Create list of all instance pins and copy in unformatted net IDs
-        pins = self.in_nets.copy()
+        # Fill the nets of the instance's pins into its cells' template
+        hdl_def = self.node_data["verilog"]
+        if mapping is not None:
+            hdl_def = merge_mapping_into_cells(hdl_def, mapping)
+        pins = self._resolved_in_nets().copy()
         pins.update(self.equiv_class.out_nets)
-
-        # Format net IDs and replace them into module's HDL
-        for a in pins:
-            if len(pins[a]) == 1:
-                net_name = parse_net(pins[a][0])
-                ret = ret.replace(a, net_name)
+        template = _cells_template(
+            hdl_def, tuple((a, len(pins[a])) for a in pins)
+        )
+        offsets = self.name_offsets
+        ret = []
+        for x in template:
+            if isinstance(x, str):
+                pass
+            elif len(x) == 2:
+                x = parse_net(pins[x[0]][x[1]])
+            elif offsets is None:
+                x = x[2]
             else:
-                for b in range(len(pins[a])):
-                    net_name = parse_net(pins[a][b])
-                    idx = len(pins[a]) - b - 1
-                    ret = ret.replace("{0}[{1}]".format(a, idx), net_name)
-
-        return ret
+                x = x[0] + str(offsets[x[0]] + x[1])
+            ret.append(x)
+        return "".join(ret)
 
 
 if __name__ == "__main__":
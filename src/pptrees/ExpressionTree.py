@@ -1,9 +1,17 @@
-import networkx as nx
-
 from .ExpressionGraph import ExpressionGraph
 from .ExpressionNode import ExpressionNode as Node
+from .NetTable import port_net
 from .node_data import node_data
-from .util import catalan, catalan_mirror_point, display_png, lg, match_nodes
+from .Transaction import Transaction
+from .util import (
+    catalan,
+    catalan_mirror_point,
+    catalan_split,
+    catalan_splits,
+    display_png,
+    lg,
+    match_nodes,
+)
 
 
 class ExpressionTree(ExpressionGraph):
@@ -142,6 +150,10 @@ class ExpressionTree(ExpressionGraph):
         # Initialize the graph
         super().__init__(name=name, in_ports=in_ports, out_ports=out_ports)
 
+        # Nodes whose diagram x-positions are stale
+        # These, and their ancestors, are laid out again on demand
+        self._dirty_nodes = set()
+
         # Initialize the tree
 
         ## If the tree should not be initialized, do not initialize it
@@ -281,13 +293,39 @@ class ExpressionTree(ExpressionGraph):
         """Define order by rank"""
         return self.rank(self.root) < other.rank(other.root)
 
-    def __copy__(self):
-        """Define copying of Trees in terms of rank"""
-        return self.__class__(width=self.width, start_point=self.rank())
-
     def copy(self):
-        """Define copying of Trees in terms of rank"""
-        return self.__class__(width=self.width, start_point=self.rank())
+        """Copies the tree, keeping its buffers and node definitions
+
+        See ExpressionGraph.__copy__
+        """
+        return self.__copy__()
+
+    def _clone(self, memo):
+        """Copies the tree's nodes and edges, for __copy__"""
+        new = super()._clone(memo)
+        new.root = memo[self.root]
+        new.node_defs = self.node_defs.copy()
+        # Nodes that left the tree may still be marked dirty
+        new._dirty_nodes = {memo[n] for n in self._dirty_nodes if n in memo}
+        return new
+
+    def transaction(self):
+        """Records changes to the tree, so that they can be rolled back
+
+        Changes made while the transaction is open are undone by its rollback
+        method, or if an exception is raised:
+
+            sta = StaticTiming(tree)
+            best = sta.delay()
+            with tree.transaction() as tx:
+                tree.left_rotate(node)
+                if sta.delay() > best:
+                    tx.rollback()
+
+        Returns:
+            Transaction: The transaction, which opens in a with statement
+        """
+        return Transaction(self)
 
     def _repr_png_(self):
         """Automatically display diagrams in a Notebook"""
@@ -299,8 +337,8 @@ class ExpressionTree(ExpressionGraph):
 
     def _get_row(self, depth):
         """Return the nodes at a given depth"""
-        nodes = [n for n in self.nodes if n.y_pos == depth]
-        return sorted(nodes, key=lambda x: -x.x_pos)
+        self._fix_diagram_positions()
+        return sorted(self._rows.get(depth, ()), key=lambda x: -x.x_pos)
 
     def _get_reversed_leafs(self, node):
         """Return a list of leaf nodes in the subtree rooted at node"""
@@ -324,21 +362,19 @@ class ExpressionTree(ExpressionGraph):
         for a in range(len(self.out_shape)):
             port_name = self.out_ports[a][0][0]
             if self.out_shape[a] == 1:
-                net_name = "${}".format(port_name)
-                root.out_nets[port_name][0] = net_name
+                root.out_nets[port_name][0] = port_net(port_name)
                 continue
             for b in range(self.out_shape[a]):
-                net_name = "${}[{}]".format(port_name, b)
-                root.out_nets[port_name][b] = net_name
+                root.out_nets[port_name][b] = port_net(port_name, b)
 
     def _connect_inports(self, node, index):
         """Connect the tree's input ports to a pre-processing node"""
         for a in range(len(self.in_shape)):
             port_name = self.in_ports[a][0][0]
             if self.width == 1:
-                net_name = "${}".format(port_name)
+                net_name = port_net(port_name)
             else:
-                net_name = "${}[{}]".format(port_name, index)
+                net_name = port_net(port_name, index)
             node.in_nets[port_name][0] = net_name
 
     def add_edge(self, parent, child, index):
@@ -390,8 +426,10 @@ class ExpressionTree(ExpressionGraph):
         child.x_pos = x_pos
         child.y_pos = y_pos
 
-        diagram_pos = "{0},{1}!".format(x_pos * -1, y_pos * -1)
-        self.nodes[child]["pos"] = diagram_pos
+        # The final x-pos depends on the rest of the tree
+        if self._journal is not None:
+            self._journal._save_add(self._dirty_nodes, child)
+        self._dirty_nodes.add(child)
 
     def detach_subtree(self, node, return_data=True):
         """Detach the subtree rooted at node
@@ -657,11 +695,15 @@ class ExpressionTree(ExpressionGraph):
         if "lspine" in self.node_defs and self._on_lspine(parent):
             thru_lspine = True
 
+        # Rotations that keep every node's definition only move pointers
+        if not thru_root and not thru_lspine:
+            return self._rotate_pointers(node, 1)
+
         # Adjust the y-pos
         parent.y_pos += 1
-        plchild.iter_down(lambda x: setattr(x, "y_pos", x.y_pos + 1))
-        node.iter_down(lambda x: setattr(x, "y_pos", x.y_pos - 1))
-        lchild.iter_down(lambda x: setattr(x, "y_pos", x.y_pos + 1))
+        self._shift_rows(plchild, 1)
+        self._shift_rows(node, -1)
+        self._shift_rows(lchild, 1)
 
         # Disconnect the nodes
         if not thru_root:
@@ -699,7 +741,6 @@ class ExpressionTree(ExpressionGraph):
         if thru_lspine:
             self.add_edge(node, rchild, 1)
 
-        self._fix_diagram_positions()
         return node
 
     ### NOTE: THIS IS HARD-CODED FOR RADIX OF 2
@@ -734,11 +775,15 @@ class ExpressionTree(ExpressionGraph):
         if "lspine" in self.node_defs and self._on_lspine(parent):
             thru_lspine = True
 
+        # Rotations that keep every node's definition only move pointers
+        if not thru_root and not thru_lspine:
+            return self._rotate_pointers(node, 0)
+
         # Adjust the y-pos
         parent.y_pos += 1
-        prchild.iter_down(lambda x: setattr(x, "y_pos", x.y_pos + 1))
-        node.iter_down(lambda x: setattr(x, "y_pos", x.y_pos - 1))
-        rchild.iter_down(lambda x: setattr(x, "y_pos", x.y_pos + 1))
+        self._shift_rows(prchild, 1)
+        self._shift_rows(node, -1)
+        self._shift_rows(rchild, 1)
 
         # Disconnect the nodes
         if not thru_root:
@@ -772,7 +817,63 @@ class ExpressionTree(ExpressionGraph):
         if thru_lspine:
             self.add_edge(parent, prchild, 1)
 
-        self._fix_diagram_positions()
+        return node
+
+    def _rotate_pointers(self, node, side):
+        """Rotates a node that has a grandparent, without morphing any node
+
+        This rewires the same pins as the edges that left_rotate and
+        right_rotate remove and add, but networkx is only synced once it is
+        next read, and only the leafs of the two rotated nodes change.
+
+        Args:
+            node (Node): The node to rotate
+            side (int): The index of the node under its parent
+                This is 1 for left rotations and 0 for right rotations
+        """
+        parent = node.parent
+        grandparent = parent.parent
+        parent_dir = grandparent.children.index(parent)
+        other = 1 - side
+        inner = node[other]
+        if self._journal is not None:
+            # The heights of all ancestors are invalidated below
+            self._journal._save_path(grandparent)
+
+        # Adjust the y-pos
+        parent.y_pos += 1
+        self._shift_rows(parent[other], 1)
+        node.y_pos -= 1
+        self._shift_rows(node[side], -1)
+
+        # Disconnect the nodes
+        self._detach(grandparent, parent)
+        self._detach(parent, node)
+        self._detach(node, inner)
+
+        # Rotate the nodes
+        for p, c, index in [
+            (grandparent, node, parent_dir),
+            (parent, inner, side),
+            (node, parent, other),
+        ]:
+            self._attach(p, match_nodes(p, c, index), c)
+            # Adjust x-pos and y-pos of the child, as add_edge does
+            c.x_pos = p.x_pos + (1 if index == 0 else -1)
+            c.y_pos = p.y_pos + 1
+            if self._journal is not None:
+                self._journal._save_add(self._dirty_nodes, c)
+            self._dirty_nodes.add(c)
+
+        # Only the rotated nodes cover new leafs, but heights change above
+        for n in [parent, node]:
+            n.leafs = n[0].leafs | n[1].leafs
+            n._height = None
+        n = grandparent
+        while n is not None and n._height is not None:
+            n._height = None
+            n = n.parent
+
         return node
 
     ### NOTE: THIS IS HARD-CODED FOR RADIX OF 2
@@ -908,15 +1009,9 @@ class ExpressionTree(ExpressionGraph):
             self.add_edge(parent, node, index)
 
         # Take advantage of Catalan properties
-        i1, i2, ci1 = 0, 0, 0
-        for i in range((width + 1) // 2):
-            i1, i2 = i, width - i - 1
-            ci1 = catalan(i1)
-            big_number = ci1 * catalan(i2)
-            rem = rank - big_number
-            if rem < 0:
-                break
-            rank = rem
+        i1, rank = catalan_split(width, rank)
+        i2 = width - i1 - 1
+        ci1 = catalan(i1)
 
         # Recurse
         if mirror:
@@ -961,10 +1056,7 @@ class ExpressionTree(ExpressionGraph):
         # Calculate rank stub
         rank = lrank + rrank * catalan(lwidth)
         # Add rest of rank
-        for i in range(lwidth):
-            i1, i2 = i, width - i - 1
-            big_number = catalan(i1) * catalan(i2)
-            rank += big_number
+        rank += catalan_splits(width)[lwidth]
 
         # Account for mirroring
         dir_switched = new_mirror != mirror
@@ -972,28 +1064,35 @@ class ExpressionTree(ExpressionGraph):
         return rank
 
     def _fix_diagram_positions(self):
-        """Fix the positions of the nodes in the diagram"""
-
-        height = len(self)
-        leafs = self._get_reversed_leafs(self.root)
-        # Set x_pos of the leafs to consecutive numbers
-        ctr = 0
-        for leaf in leafs:
-            leaf.x_pos = ctr
-            ctr -= 1
-        # Adjust other nodes' x_pos based on the leafs
-        for d in range(height - 1, -1, -1):
-            for node in self._get_row(d):
-                if len(node.children) > 0:
-                    children = [x for x in node.children if x is not None]
-                    num_children = len(children)
-                    sum_children = sum([x.x_pos for x in children])
-                    avg = sum_children / num_children
-                    node.x_pos = avg
-                x_pos = node.x_pos
-                y_pos = node.y_pos
-                diagram_pos = "{0},{1}!".format(x_pos * -1, y_pos * -1)
-                self.nodes[node]["pos"] = diagram_pos
+        """Fix the positions of the nodes in the diagram
+
+        Leafs sit at consecutive x-positions, and every other node is centered
+        above its children. Only the nodes marked as dirty by add_edge, and
+        their ancestors, need to be laid out again.
+        """
+
+        # Gather the dirty nodes that are still part of the tree,
+        # along with all of their ancestors
+        stale = set()
+        for node in self._dirty_nodes:
+            if node not in self:
+                continue
+            while node is not None and node not in stale:
+                stale.add(node)
+                node = node.parent
+        if self._journal is not None:
+            self._journal._save_attribute(self, "_dirty_nodes")
+            for node in stale:
+                self._journal._save_node(node)
+        self._dirty_nodes = set()
+
+        # Lay out the stale nodes bottom-up
+        for node in sorted(stale, key=lambda x: -x.y_pos):
+            children = [x for x in node.children if x is not None]
+            if children:
+                node.x_pos = sum([x.x_pos for x in children]) / len(children)
+            else:
+                node.x_pos = lg(node.leafs) - self.width + 1
 
     def _check_attr(self, others, *attr):
         """Check if a set of trees share a set of common attributes
@@ -1015,9 +1114,15 @@ class ExpressionTree(ExpressionGraph):
 
         # Correct the positions of the nodes
         self._fix_diagram_positions()
+        for node in self:
+            diagram_pos = "{0},{1}!".format(node.x_pos * -1, node.y_pos * -1)
+            self.nodes[node]["pos"] = diagram_pos
+
+        # Import the renderer here, so that only drawing requires pydot
+        from networkx.drawing.nx_pydot import to_pydot
 
         # Convert the graph to pydot
-        pg = nx.drawing.nx_pydot.to_pydot(self)
+        pg = to_pydot(self)
         pg.set_splines("false")
         pg.set_concentrate("true")
 
@@ -0,0 +1,186 @@
+import weakref
+from array import array
+from itertools import count
+
+from .util import natural_keys
+
+# Each table hands out nets from its own range of integers, so that nets stay
+# unique when they are shared between graphs, such as the trees of a forest
+# Integers below the first range are plain net numbers, named n{number}
+_TABLE_SHIFT = 32
+_tables = weakref.WeakValueDictionary()
+_table_ids = count(1)
+
+
+class NetTable:
+    """Interns the nets of a graph as integers
+
+    A net is either internal to a graph, and named after it, or a bit of one
+    of its ports. Nets are stored in parallel arrays of labels and numbers,
+    and their names are only formatted when HDL is generated.
+    Ports are named independently of graphs, so their nets are interned in a
+    single table shared by all graphs; see port_net.
+
+    Attributes:
+        labels (list of str): The names of the graphs and ports of nets
+    """
+
+    def __init__(self):
+        """Initializes an empty table of nets"""
+        self._id = next(_table_ids)
+        self._base = self._id << _TABLE_SHIFT
+        _tables[self._id] = self
+
+        self.labels = []
+        self._label_ids = {}
+        self._label_keys = []
+        # For internal nets, the number is the net's number in its graph
+        # For ports, it is the net's bit, or -1 if the port has a single bit
+        self._labels = array("l")
+        self._numbers = array("l")
+        self._is_port = array("b")
+        self._port_nets = {}
+
+    def __len__(self):
+        return len(self._labels)
+
+    def _label(self, label):
+        """Returns the index of a label, interning it if needed"""
+        index = self._label_ids.get(label)
+        if index is None:
+            index = len(self.labels)
+            self.labels.append(label)
+            self._label_ids[label] = index
+            self._label_keys.append(natural_keys(label))
+        return index
+
+    def _add(self, label, number, is_port):
+        """Appends a net to the table and returns it"""
+        net = self._base + len(self._labels)
+        self._labels.append(self._label(label))
+        self._numbers.append(number)
+        self._is_port.append(is_port)
+        return net
+
+    def next_net(self):
+        """Returns the net that the next call to add_net will return"""
+        return self._base + len(self._labels)
+
+    def add_net(self, graph_name, number):
+        """Adds an internal net, named 'n{number}_{graph_name}'
+
+        Args:
+            graph_name (str): The name of the graph that owns the net
+            number (int): The number of the net in its graph
+
+        Returns:
+            int: The new net
+        """
+        return self._add(graph_name, number, 0)
+
+    def _port_net(self, port, bit):
+        """Returns the net of a bit of a port, adding it if needed"""
+        key = (port, bit)
+        net = self._port_nets.get(key)
+        if net is None:
+            net = self._add(port, -1 if bit is None else bit, 1)
+            self._port_nets[key] = net
+        return net
+
+    def name(self, net):
+        """Formats the HDL name of a net"""
+        index = net - self._base
+        label = self.labels[self._labels[index]]
+        number = self._numbers[index]
+        if not self._is_port[index]:
+            return "n{0}_{1}".format(number, label)
+        if number < 0:
+            return label
+        return "{0}[{1}]".format(label, number)
+
+    def port(self, net):
+        """Returns the name of a net's port, or None for internal nets"""
+        index = net - self._base
+        if not self._is_port[index]:
+            return None
+        return self.labels[self._labels[index]]
+
+    def sort_key(self, net):
+        """Returns a key that sorts nets in the natural order of their names"""
+        index = net - self._base
+        number = self._numbers[index]
+        keys = self._label_keys[self._labels[index]]
+        if self._is_port[index]:
+            return (1, keys, number)
+        return (0, number, keys)
+
+
+_ports = NetTable()
+
+
+def port_net(port, bit=None):
+    """Returns the net of a bit of a port
+
+    Args:
+        port (str): The name of the port
+        bit (int): The bit of the port, or None if it has a single bit
+
+    Returns:
+        int: The port's net, which is the same in every graph
+    """
+    return _ports._port_net(port, bit)
+
+
+def net_table(net):
+    """Returns the table that a net belongs to"""
+    table = _tables.get(net >> _TABLE_SHIFT)
+    if table is None:
+        raise ValueError("Net {0} belongs to a deleted graph".format(net))
+    return table
+
+
+def parse_net(x):
+    """Converts a net's ID to its name in HDL
+
+    These come in 3 possible flavors:
+        - None (unassigned net) -> parsed to n0
+        - Integer (interned net) -> parsed to its name in its NetTable
+        - Integer (plain net) -> parsed to n`Integer
+        - Hardcoded name ($net_name) -> parsed to net_name
+    """
+    if x is None:
+        return "n0"
+    if isinstance(x, int):
+        if x >> _TABLE_SHIFT:
+            return net_table(x).name(x)
+        return "n" + str(x)
+    if "$" in x:
+        return x.replace("$", "")
+    raise TypeError("net stored in node {0} is invalid".format(repr(x)))
+
+
+def net_port(x):
+    """Returns the name of a net's port, or None if it is not a port
+
+    Hardcoded nets ($net_name) are named after their port, if they have one.
+    """
+    if isinstance(x, int) and x >> _TABLE_SHIFT:
+        return net_table(x).port(x)
+    if isinstance(x, str) and x.startswith("$"):
+        return x[1:].split("[")[0]
+    return None
+
+
+def net_sort_key(x):
+    """Returns a key that sorts nets in the natural order of their names"""
+    if x is None:
+        return (0, 0, [])
+    if isinstance(x, int):
+        if x >> _TABLE_SHIFT:
+            return net_table(x).sort_key(x)
+        return (0, x, [])
+    return (2, natural_keys(parse_net(x)), 0)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
@@ -0,0 +1,599 @@
+import re
+from array import array
+from functools import lru_cache
+
+from .NetTable import net_port, parse_net
+from .util import (
+    hdl_entity,
+    hdl_inst,
+    hdl_syntax,
+    load_mapping,
+    parse_mapping,
+)
+
+try:
+    from importlib.resources import path as respath
+except ImportError:
+    from importlib_resources import path as respath
+
+# Matches a cell instance, such as 'mux2 U2(xout,gin,xin,yin)'
+_cell_statement = re.compile(r"(\w+)\s+(\w+)\s*\((.*)\)$", re.S)
+
+# Matches a connection to a cell, such as 'pin[1]' or 'w1'
+_cell_connection = re.compile(r"([A-Za-z_]\w*)(?:\[(\d+)\])?$")
+
+
+@lru_cache(maxsize=4096)
+def _node_cells(hdl_def, pins):
+    """Parses the cells instantiated by a node's HDL definition
+
+    Args:
+        hdl_def (str): The Verilog definition of the node
+        pins (tuple of (str, int)): The names and widths of the node's pins
+
+    Returns:
+        tuple of (str, tuple): The type of each cell, and its connections
+            These are (pin, index) for the node's pins, a string for the
+            node's local wires, and (None, value) for constants
+    """
+    widths = dict(pins)
+    cells = []
+    # Skip the module's header
+    body = hdl_def.partition(");")[2]
+    for statement in body.split(";"):
+        statement = statement.strip()
+        keyword = re.match(r"\w*", statement).group()
+        if keyword in ("", "input", "output", "wire", "endmodule"):
+            continue
+        if keyword == "assign":
+            cell = "assign"
+            args = [x.strip() for x in statement[6:].split("=")]
+        else:
+            match = _cell_statement.match(statement)
+            if match is None:
+                raise ValueError("Unsupported statement: {0}".format(statement))
+            cell = match.group(1)
+            args = [x.strip() for x in match.group(3).split(",")]
+
+        connections = []
+        for arg in args:
+            match = _cell_connection.match(arg)
+            if match is None:
+                if "'" not in arg:
+                    raise ValueError("Unsupported connection: {0}".format(arg))
+                connections.append((None, arg))
+                continue
+            name, bit = match.groups()
+            width = widths.get(name)
+            if width is None:
+                connections.append(arg)
+            elif width == 1:
+                connections.append((name, 0))
+            else:
+                # Multi-bit pins are listed most-significant bit first
+                connections.append((name, width - int(bit) - 1))
+        cells.append((cell, tuple(connections)))
+    return tuple(cells)
+
+
+@lru_cache(maxsize=None)
+def _logical_ports(cell):
+    """Returns the ports of a logical cell, in the order that nodes use"""
+    if cell not in _behavioral_cells():
+        raise ValueError("Unknown cell: {0}".format(cell))
+    return _behavioral_cells()[cell][0]
+
+
+@lru_cache(maxsize=None)
+def _behavioral_cells():
+    """Maps each cell of the behavioral mapping to its ports and body"""
+    with respath("pptrees.mappings", "behavioral_map.v") as map_path:
+        return parse_mapping(map_path)
+
+
+def _parse_expression(tokens, ports):
+    """Parses a behavioral expression into a tree of operations
+
+    Operators bind as in Verilog, from ~ down to ?:. Operations are tuples
+    of an operator and its operands, and operands are indices of ports.
+    """
+
+    def parse(level):
+        if level == 0:
+            token = tokens.pop(0)
+            if token == "~":
+                return ("~", parse(0))
+            if token == "(":
+                x = parse(4)
+                tokens.pop(0)
+                return x
+            return ports.index(token)
+        x = parse(level - 1)
+        op = "&^|?"[level - 1]
+        while tokens and tokens[0] == op:
+            tokens.pop(0)
+            if op != "?":
+                x = (op, x, parse(level - 1))
+                continue
+            # The branches of a ternary are selected by x
+            y = parse(4)
+            tokens.pop(0)
+            x = ("?", x, y, parse(4))
+        return x
+
+    return parse(4)
+
+
+@lru_cache(maxsize=None)
+def _cell_logic(cell):
+    """Returns the output of a logical cell, as a tree of operations
+
+    The output of every cell is its first port, and its inputs follow.
+    """
+    if cell == "assign":
+        return 1
+    ports, body = _behavioral_cells().get(cell, (None, ""))
+    match = re.match(r"\s*assign\s+(\w+)\s*=(.*);", body, re.S)
+    if match is None or match.group(1) != ports[0]:
+        raise ValueError("Cell {0} has no behavioral logic".format(cell))
+    tokens = re.findall(r"\w+|[~&^|?:()]", match.group(2))
+    return _parse_expression(tokens, ports)
+
+
+def _evaluate(logic, inputs, ops):
+    """Evaluates a cell's tree of operations over a list of its pins"""
+    if isinstance(logic, int):
+        return inputs[logic]
+    args = [_evaluate(x, inputs, ops) for x in logic[1:]]
+    return ops[logic[0]](*args)
+
+
+# Operations on bits, for truth tables
+_bit_ops = {
+    "~": lambda a: a ^ 1,
+    "&": lambda a, b: a & b,
+    "^": lambda a, b: a ^ b,
+    "|": lambda a, b: a | b,
+    "?": lambda s, b, a: b if s else a,
+}
+
+
+@lru_cache(maxsize=None)
+def _cell_cover(cell, num_inputs):
+    """Returns the rows of a cell's truth table whose output is 1"""
+    logic = _cell_logic(cell)
+    rows = []
+    for x in range(1 << num_inputs):
+        bits = [0] + [x >> (num_inputs - i - 1) & 1 for i in range(num_inputs)]
+        if _evaluate(logic, bits, _bit_ops):
+            rows.append("".join(str(b) for b in bits[1:]) + " 1")
+    return rows
+
+
+class _AndInverterGraph:
+    """Builds a structurally hashed graph of AND gates and inverters
+
+    Literals are numbered as in AIGER: twice the variable, plus one if it is
+    inverted. Variable 0 is the constant false, followed by the inputs.
+    """
+
+    def __init__(self, num_inputs):
+        self.num_inputs = num_inputs
+        self.ands = []
+        self._hashed = {}
+        self.ops = {
+            "~": lambda a: a ^ 1,
+            "&": self.and_gate,
+            "^": self.xor_gate,
+            "|": lambda a, b: self.and_gate(a ^ 1, b ^ 1) ^ 1,
+            "?": lambda s, b, a: self.and_gate(
+                self.and_gate(s, b) ^ 1, self.and_gate(s ^ 1, a) ^ 1
+            )
+            ^ 1,
+        }
+
+    def and_gate(self, a, b):
+        """Returns the literal of a AND b, adding a gate if needed"""
+        if a < b:
+            a, b = b, a
+        if b == 0 or a == b ^ 1:
+            return 0
+        if b == 1 or a == b:
+            return a
+        lit = self._hashed.get((a, b))
+        if lit is None:
+            lit = 2 * (self.num_inputs + len(self.ands) + 1)
+            self.ands.append((lit, a, b))
+            self._hashed[(a, b)] = lit
+        return lit
+
+    def xor_gate(self, a, b):
+        """Returns the literal of a XOR b"""
+        return (
+            self.and_gate(
+                self.and_gate(a, b ^ 1) ^ 1, self.and_gate(a ^ 1, b) ^ 1
+            )
+            ^ 1
+        )
+
+
+@lru_cache(maxsize=None)
+def _vhdl_library(mapping):
+    """Loads the VHDL entities of a mapping's cells
+
+    Returns:
+        dict: The VHDL of each of the mapping's entities, by name
+    """
+    map_file = "{0}_map{1}".format(
+        mapping, hdl_syntax["vhdl"]["file_extension"]
+    )
+    try:
+        with respath("pptrees.mappings", map_file) as map_path:
+            with open(map_path, "r") as f:
+                library = f.read()
+    except FileNotFoundError:
+        raise ValueError("No VHDL mapping named {0}".format(mapping))
+    entities = {}
+    for chunk in re.findall(
+        r"^library\b.*?^end architecture;\n", library, re.M | re.S
+    ):
+        entities[re.search(r"^entity (\w+) is", chunk, re.M).group(1)] = chunk
+    return entities
+
+
+class Netlist:
+    """A flat netlist of cells, lowered from a tree or a forest
+
+    Cells are those instantiated by the definitions of the graph's nodes,
+    before any technology mapping. Equivalent nodes are already shared, as
+    in the graph's HDL. Cells, their connections, and nets are held in flat
+    arrays, so that writers only need to format them.
+
+    Attributes:
+        name (str): The name of the netlist's module
+        in_ports (list of (str, int)): The names and widths of input ports
+        out_ports (list of (str, int)): The names and widths of output ports
+        net_names (list of str): The name of each net
+            The bits of ports come first, in the order of the ports
+        num_port_nets (int): The number of nets that are bits of ports
+        cell_types (list of str): The types of cells in the netlist
+            Assignments from one net to another have type 'assign'
+        cells (array of int): The index of each cell's type in cell_types
+        pins (array of int): The nets connected to each cell
+            These are in the order of the cell's ports, in behavioral_map.v
+        pin_offsets (array of int): Where each cell's nets start in pins
+    """
+
+    def __init__(self, graph):
+        """Lowers a tree or forest to a netlist
+
+        Args:
+            graph (ExpressionTree or ExpressionForest): The graph to lower
+        """
+        self.name = graph.name
+        self.in_ports = [x[0] for x in graph.in_ports]
+        self.out_ports = [x[0] for x in graph.out_ports]
+        self.net_names = []
+        self.cell_types = []
+        self.cells = array("l")
+        self.pins = array("l")
+        self.pin_offsets = array("l", [0])
+
+        self._nets = {}
+        self._types = {}
+        for name, width in self.in_ports + self.out_ports:
+            if width == 1:
+                self._net(name)
+            else:
+                for bit in range(width):
+                    self._net("{0}[{1}]".format(name, bit))
+        self.num_port_nets = len(self.net_names)
+
+        widths = dict(self.in_ports + self.out_ports)
+        for t in getattr(graph, "trees", [graph]):
+            self._lower_tree(t, t is graph, widths)
+
+        del self._nets, self._types
+
+    def __len__(self):
+        return len(self.cells)
+
+    def _net(self, name):
+        """Returns the index of a net, adding it if needed"""
+        index = self._nets.get(name)
+        if index is None:
+            index = len(self.net_names)
+            self.net_names.append(name)
+            self._nets[name] = index
+        return index
+
+    def _lower_tree(self, tree, top, widths):
+        """Lowers the cells of a tree's representative nodes"""
+        # The tree's ports are bits of the graph's ports, unless it is the graph
+        remote = {}
+        if not top:
+            for (local, width), name in tree.in_ports + tree.out_ports:
+                if width != 1:
+                    name = name.split("[")[0]
+                remote[local] = (name, width)
+
+        def net_name(net):
+            port = net_port(net)
+            if port not in remote:
+                return parse_net(net)
+            name, width = remote[port]
+            if width != 1:
+                name = "{0}[{1}".format(name, parse_net(net).partition("[")[2])
+            # Single-bit ports of the graph have no bit select
+            if widths.get(name.split("[")[0]) == 1:
+                name = name.split("[")[0]
+            return name
+
+        # Visit children before parents, in the order of their pins
+        stack = [(tree.root, False)]
+        while stack:
+            node, visited = stack.pop()
+            if not visited:
+                stack.append((node, True))
+                stack.extend(
+                    (c, False) for c in reversed(node.children) if c is not None
+                )
+                continue
+            if node.equiv_class.rep is node:
+                self._lower_node(node, net_name)
+
+    def _lower_node(self, node, net_name):
+        """Lowers the cells of a node"""
+        # Children that are not representatives are read from their class
+        pins = node._resolved_in_nets().copy()
+        pins.update(node.equiv_class.out_nets)
+
+        hdl_def = node.node_data["verilog"]
+        cells = _node_cells(hdl_def, tuple((a, len(pins[a])) for a in pins))
+
+        wires = {}
+        for cell, connections in cells:
+            cell_type = self._types.get(cell)
+            if cell_type is None:
+                cell_type = len(self.cell_types)
+                self.cell_types.append(cell)
+                self._types[cell] = cell_type
+            self.cells.append(cell_type)
+            for x in connections:
+                if isinstance(x, str):
+                    # Local wires are unique to each instance of the node
+                    if x not in wires:
+                        wires[x] = "w{0}".format(len(self.net_names))
+                        self._net(wires[x])
+                    x = wires[x]
+                elif x[0] is None:
+                    x = x[1]
+                else:
+                    x = net_name(pins[x[0]][x[1]])
+                self.pins.append(self._net(x))
+            self.pin_offsets.append(len(self.pins))
+
+    def cell(self, index):
+        """Returns the type and nets of a cell"""
+        start, end = self.pin_offsets[index], self.pin_offsets[index + 1]
+        return self.cell_types[self.cells[index]], self.pins[start:end]
+
+    def port_nets(self):
+        """Returns the nets of the bits of the input and output ports"""
+        num_in = sum(width for _, width in self.in_ports)
+        nets = range(self.num_port_nets)
+        return list(nets[:num_in]), list(nets[num_in:])
+
+    def _drivers(self):
+        """Maps each net to the cell that drives it"""
+        drivers = {}
+        for index in range(len(self)):
+            drivers[self.pins[self.pin_offsets[index]]] = index
+        return drivers
+
+    def aiger(self):
+        """Writes the netlist as a binary AIGER file
+
+        Cells are decomposed into AND gates and inverters, with structural
+        hashing, so that equivalent logic is only built once. Only the logic
+        that drives the output ports is kept. Undriven nets are false.
+
+        Returns:
+            bytes: The contents of the AIGER file
+        """
+        in_nets, out_nets = self.port_nets()
+        aig = _AndInverterGraph(len(in_nets))
+        lits = {net: 2 * (i + 1) for i, net in enumerate(in_nets)}
+        for net, name in enumerate(self.net_names):
+            if name in ("1'b0", "1'b1"):
+                lits[net] = int(name[-1])
+        drivers = self._drivers()
+
+        # Visit the nets that drive the outputs, before the nets they drive
+        stack = list(out_nets)
+        while stack:
+            net = stack[-1]
+            if net in lits:
+                stack.pop()
+                continue
+            index = drivers.get(net)
+            if index is None:
+                lits[net] = 0
+                stack.pop()
+                continue
+            cell, pins = self.cell(index)
+            missing = [x for x in pins[1:] if x not in lits]
+            if missing:
+                stack.extend(missing)
+                continue
+            stack.pop()
+            inputs = [None] + [lits[x] for x in pins[1:]]
+            lits[net] = _evaluate(_cell_logic(cell), inputs, aig.ops)
+
+        header = "aig {0} {1} 0 {2} {3}\n".format(
+            len(in_nets) + len(aig.ands),
+            len(in_nets),
+            len(out_nets),
+            len(aig.ands),
+        )
+        data = bytearray(header.encode())
+        data += "".join("{0}\n".format(lits[x]) for x in out_nets).encode()
+        # Gates are delta-encoded, in groups of 7 bits
+        for lhs, rhs0, rhs1 in aig.ands:
+            for delta in (lhs - rhs0, rhs0 - rhs1):
+                while delta >= 0x80:
+                    data.append(delta & 0x7F | 0x80)
+                    delta >>= 7
+                data.append(delta)
+        symbols = [
+            "i{0} {1}".format(i, self.net_names[x])
+            for i, x in enumerate(in_nets)
+        ]
+        symbols += [
+            "o{0} {1}".format(i, self.net_names[x])
+            for i, x in enumerate(out_nets)
+        ]
+        data += ("\n".join(symbols) + "\nc\n{0}\n".format(self.name)).encode()
+        return bytes(data)
+
+    def blif(self, module_name=None):
+        """Writes the netlist as a BLIF model
+
+        Each cell becomes a logic function, given by the rows of its truth
+        table whose output is 1.
+
+        Args:
+            module_name (str): The name of the model
+
+        Returns:
+            str: The BLIF model
+        """
+        if module_name is None:
+            module_name = self.name
+        names = [
+            x.replace("1'b0", "$false").replace("1'b1", "$true")
+            for x in self.net_names
+        ]
+        in_nets, out_nets = self.port_nets()
+        blif = [
+            ".model {0}".format(module_name),
+            ".inputs " + " ".join(names[x] for x in in_nets),
+            ".outputs " + " ".join(names[x] for x in out_nets),
+        ]
+        if "$false" in names:
+            blif.append(".names $false")
+        if "$true" in names:
+            blif += [".names $true", "1"]
+        for index in range(len(self)):
+            cell, pins = self.cell(index)
+            blif.append(
+                ".names " + " ".join(names[x] for x in pins[1:] + pins[:1])
+            )
+            blif += _cell_cover(cell, len(pins) - 1)
+        blif.append(".end")
+        return "\n".join(blif) + "\n"
+
+    def wires(self):
+        """Returns the names of the nets that are not ports or constants"""
+        return [x for x in self.net_names[self.num_port_nets :] if "'" not in x]
+
+    def hdl(self, mapping="behavioral", language="verilog", module_name=None):
+        """Writes the netlist as a single HDL module
+
+        Args:
+            mapping (str): The cell mapping to use for the HDL generation
+            language (str): The language in which to generate the HDL
+            module_name (str): The name of the module to generate
+
+        Returns:
+            str: The HDL of the netlist
+        """
+        if module_name is None:
+            module_name = self.name
+        if language == "verilog":
+            return self._verilog(mapping, module_name)
+        if language == "vhdl":
+            return self._vhdl(mapping, module_name)
+        raise ValueError("Unsupported hardware-descriptive language")
+
+    def _verilog(self, mapping, module_name):
+        """Writes the netlist as a Verilog module"""
+        syntax = hdl_syntax["verilog"]
+        templates = load_mapping(mapping, "verilog")
+        names = self.net_names
+        hdl = []
+        wires = self.wires()
+        if wires:
+            hdl.append("\t" + syntax["wire_def"].format(", ".join(wires)))
+        for index in range(len(self)):
+            cell, nets = self.cell(index)
+            nets = [names[x] for x in nets]
+            inst = "U{0}".format(index + 1)
+            if cell == "assign":
+                hdl.append("\tassign {0} = {1};".format(*nets))
+            elif cell in templates:
+                ports, template = templates[cell]
+                line = []
+                for x in template:
+                    if x is None:
+                        x = inst
+                    elif not isinstance(x, str):
+                        x = nets[x] if x < len(nets) else ports[x]
+                    line.append(x)
+                hdl.append("".join(line))
+            else:
+                hdl.append(
+                    "\t{0} {1}({2});".format(cell, inst, ", ".join(nets))
+                )
+        hdl = "\n".join(hdl) + "\n"
+        entity = hdl_entity(module_name, self.in_ports, self.out_ports)
+        return entity + syntax["arch"].format(module_name, hdl)
+
+    def _vhdl(self, mapping, module_name):
+        """Writes the netlist as a VHDL entity, after those of its cells"""
+        syntax = hdl_syntax["vhdl"]
+        entities = _vhdl_library(mapping)
+        names = [syntax["slice_markers"](x) for x in self.net_names]
+        names = [re.sub(r"^1'b([01])$", r"'\1'", x) for x in names]
+        hdl = []
+        used = set()
+        for index in range(len(self)):
+            cell, nets = self.cell(index)
+            nets = [names[x] for x in nets]
+            if cell == "assign":
+                hdl.append("\t{0} <= {1};".format(*nets))
+                continue
+            # Cells that are reserved words in VHDL are suffixed
+            entity = cell
+            if entity not in entities:
+                entity += "_module"
+            if entity not in entities:
+                raise ValueError("Cell {0} is not in the mapping".format(cell))
+            used.add(entity)
+            ports = list(zip(_logical_ports(cell), nets))
+            inst = "U{0}".format(index + 1)
+            hdl.append(hdl_inst(inst, "entity work." + entity, ports, "vhdl"))
+
+        wires = [syntax["slice_markers"](x) for x in self.wires()]
+        if wires:
+            wires = "\t" + syntax["wire_def"].format(", ".join(wires)) + "\n"
+        else:
+            wires = ""
+
+        # Only the entities of the cells in use are written out
+        library = "".join(
+            vhdl + "\n" for name, vhdl in entities.items() if name in used
+        )
+        return (
+            library
+            + "library ieee;\nuse ieee.std_logic_1164.all;\n\n"
+            + hdl_entity(module_name, self.in_ports, self.out_ports, "vhdl")
+            + "architecture netlist of {0} is\n{1}begin\n{2}\n".format(
+                module_name, wires, "\n".join(hdl)
+            )
+            + "end architecture;\n"
+        )
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
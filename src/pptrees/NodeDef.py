@@ -0,0 +1,75 @@
+from collections.abc import Mapping
+
+from .util import verso_pin
+
+# Keys of a definition that describe the node's logic, not its drawing
+_LOGIC_KEYS = frozenset(
+    ["ins", "outs", "le", "pd", "logic", "footprint", "verilog", "vhdl"]
+)
+
+
+def _freeze(x):
+    """Converts nested lists to tuples, so that they cannot be modified"""
+    if isinstance(x, list):
+        return tuple(_freeze(y) for y in x)
+    return x
+
+
+class NodeDef(Mapping):
+    """An immutable definition of a node, shared by all nodes of its type
+
+    This reads like the dictionary found in the definition's module.
+    Attributes that only some nodes override, such as the labels of leafs,
+    are stored with the nodes' graph instead.
+
+    Attributes:
+        name (str): The name of the node's module
+        graphviz (dict): The attributes used to draw the node
+        verso (dict): Maps each pin of the node to its verso, and back
+        in_sides (dict): Maps each input pin to its widths on each side
+    """
+
+    __slots__ = ("name", "_data", "graphviz", "verso", "in_sides")
+
+    # Definitions are shared rather than compared, so they hash by identity
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+    def __init__(self, name, data):
+        """Freezes a node's definition
+
+        Args:
+            name (str): The name of the node's module
+            data (dict): The definition, as found in the node's module
+        """
+        if not isinstance(data, Mapping):
+            raise TypeError("Node definition must be a dictionary")
+        self.name = name
+        self._data = {k: _freeze(v) for k, v in data.items()}
+        self.graphviz = {
+            k: v for k, v in self._data.items() if k not in _LOGIC_KEYS
+        }
+
+        ins = self._data.get("ins", ())
+        outs = self._data.get("outs", ())
+        self.in_sides = {x[0]: x[2:] for x in ins}
+        self.verso = {}
+        for x in ins + outs:
+            self.verso[x[0]] = verso_pin(x[0])
+            self.verso.setdefault(verso_pin(x[0]), x[0])
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __repr__(self):
+        return "NodeDef({0})".format(self.name)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not intended to be run directly")
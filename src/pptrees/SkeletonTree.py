@@ -0,0 +1,336 @@
+from array import array
+
+from .util import catalan, catalan_mirror_point, catalan_split, catalan_splits
+
+
+class SkeletonTree:
+    """Defines the bare structure of a binary expression tree
+
+    This is a lightweight stand-in for ExpressionTree, meant for sweeping
+    large portions of the design space. It carries no node definitions,
+    nets, or graph attributes; only the shape of the tree.
+
+    Nodes are referred to by integer indices.
+    Indices 0 to width - 1 are the leafs, with leaf i spanning bit i.
+    The remaining indices are internal nodes.
+    A missing parent or child is represented by -1.
+
+    Attributes:
+        width (int): The number of leaves in the tree
+        root (int): The index of the root node
+        parent (array of int): The parent of each node
+        left (array of int): The left (more significant) child of each node
+        right (array of int): The right (less significant) child of each node
+        leafs (list of int): A binary encoding of all leafs under each node
+        heights (array of int): The height of the subtree under each node
+    """
+
+    __slots__ = (
+        "width",
+        "root",
+        "parent",
+        "left",
+        "right",
+        "leafs",
+        "heights",
+        "_next_node",
+    )
+
+    def __init__(self, width=1, start_point=0):
+        """Initializes the SkeletonTree
+
+        Args:
+            width (int): The number of leaves in the tree
+            start_point (int): The starting Catalan ID of the tree
+        """
+        if not isinstance(width, int):
+            raise TypeError("Tree width must be an integer")
+        if width < 1:
+            raise ValueError("Tree width must be at least 1")
+
+        self.width = width
+        size = 2 * width - 1
+        self.parent = array("l", [-1] * size)
+        self.left = array("l", [-1] * size)
+        self.right = array("l", [-1] * size)
+        self.heights = array("l", [0] * size)
+        self.leafs = [1 << a for a in range(width)] + [0] * (width - 1)
+        self.root = 0
+
+        self.unrank(start_point)
+
+    def __len__(self):
+        """Returns the height of the tree, counted as in ExpressionTree"""
+        # A 1-bit ExpressionTree still has a root above its leaf
+        if self.width == 1:
+            return 2
+        return self.heights[self.root] + 1
+
+    def __getitem__(self, key):
+        """Returns the root of the subtree that spans the interval [a,b]
+
+        This mirrors ExpressionTree's tree[a,b] accessor, with a >= b.
+        """
+        if not isinstance(key, tuple) or len(key) != 2:
+            raise TypeError("Nodes must be accessed as tree[a,b]")
+        if not isinstance(key[0], int) or not isinstance(key[1], int):
+            raise TypeError("Node indices must be integers")
+        if key[0] < key[1]:
+            raise ValueError("First index must be greater than second")
+        if key[1] < 0 or key[0] > self.width - 1:
+            raise IndexError("Node indices are not valid")
+
+        start = 1 << key[0]
+        target = 1 << key[1]
+
+        # Iterate up the tree until the target is met
+        node = key[0]
+        while True:
+            leafs = self.leafs[node]
+            # Check whether we have gone too far
+            if leafs & (start << 1) or leafs & (target >> 1):
+                raise IndexError("Requested node does not exist")
+            # Check whether we have combined the two leafs
+            if leafs & target:
+                return node
+            node = self.parent[node]
+
+    def __copy__(self):
+        """Returns a copy of this skeleton"""
+        new = SkeletonTree.__new__(SkeletonTree)
+        new.width = self.width
+        new.root = self.root
+        new.parent = array("l", self.parent)
+        new.left = array("l", self.left)
+        new.right = array("l", self.right)
+        new.heights = array("l", self.heights)
+        new.leafs = self.leafs.copy()
+        return new
+
+    def copy(self):
+        """Shorthand for __copy__"""
+        return self.__copy__()
+
+    def max_rank(self):
+        """Return the maximum rank of the tree"""
+        return catalan(self.width - 1) - 1
+
+    def is_leaf(self, node):
+        """Checks whether a node is a leaf"""
+        return node < self.width
+
+    def height(self, node=None):
+        """Returns the height of the subtree rooted at node"""
+        if node is None:
+            node = self.root
+        return self.heights[node]
+
+    def is_proper(self, node=None):
+        """Checks if the subtree rooted at node is proper"""
+        if node is None:
+            node = self.root
+        return 1 << self.heights[node] == bin(self.leafs[node]).count("1")
+
+    def min_height(self, node=None):
+        """Returns the smallest height the subtree at node could have"""
+        if node is None:
+            node = self.root
+        return (bin(self.leafs[node]).count("1") - 1).bit_length()
+
+    def is_balanced(self, node=None):
+        """Checks if the subtree rooted at node has minimal height"""
+        return self.height(node) == self.min_height(node)
+
+    def _connect(self, parent, child, index):
+        """Connects a child to a parent, without updating the parent"""
+        if index == 0:
+            self.left[parent] = child
+        else:
+            self.right[parent] = child
+        self.parent[child] = parent
+
+    def _update(self, node):
+        """Recalculates the leafs and height of a node from its children"""
+        lchild = self.left[node]
+        rchild = self.right[node]
+        self.leafs[node] = self.leafs[lchild] | self.leafs[rchild]
+        self.heights[node] = 1 + max(self.heights[lchild], self.heights[rchild])
+
+    def _update_heights(self, node):
+        """Propagates a height change from node towards the root"""
+        node = self.parent[node]
+        while node != -1:
+            old = self.heights[node]
+            lchild = self.left[node]
+            rchild = self.right[node]
+            self.heights[node] = 1 + max(
+                self.heights[lchild], self.heights[rchild]
+            )
+            if self.heights[node] == old:
+                break
+            node = self.parent[node]
+
+    def unrank(self, rank):
+        """Reshapes the skeleton in place into the tree of a given rank
+
+        Args:
+            rank (int): The Catalan ID of the tree
+        """
+        if rank < 0 or rank > self.max_rank():
+            raise ValueError("Tree start point out of bounds")
+
+        self.parent[0] = -1
+        if self.width == 1:
+            self.root = 0
+            return self
+
+        # Internal nodes are handed out in pre-order
+        self._next_node = self.width
+        leafs = list(range(self.width))
+        self.root = self._unrank(-1, 0, rank, self.width - 1, leafs, False)
+        return self
+
+    def _unrank(self, parent, index, rank, width, leafs, mirror):
+        """Generate a binary tree under a node by unranking it
+
+        This follows the exact same scheme as ExpressionTree.unrank
+        """
+        # The unranking function is symmetrical around the midpoint
+        mirror_test = rank >= catalan_mirror_point(width)
+        mirror = not mirror if mirror_test else mirror
+        rank = catalan(width) - 1 - rank if mirror_test else rank
+
+        # Width reaching zero signals the bottom of the tree
+        if width == 0:
+            node = leafs.pop()
+            self._connect(parent, node, index)
+            return node
+
+        # Add new node
+        node = self._next_node
+        self._next_node += 1
+        if parent == -1:
+            self.parent[node] = -1
+        else:
+            self._connect(parent, node, index)
+
+        # Take advantage of Catalan properties
+        i1, rank = catalan_split(width, rank)
+        i2 = width - i1 - 1
+        ci1 = catalan(i1)
+
+        # Recurse
+        if mirror:
+            self._unrank(node, 0, rank // ci1, i2, leafs, mirror)
+            self._unrank(node, 1, rank % ci1, i1, leafs, mirror)
+        else:
+            self._unrank(node, 0, rank % ci1, i1, leafs, mirror)
+            self._unrank(node, 1, rank // ci1, i2, leafs, mirror)
+
+        self._update(node)
+        return node
+
+    def rank(self, node=None, mirror=False):
+        """Classifies a binary tree under a node by ranking it"""
+        if node is None:
+            node = self.root
+
+        # If the node is a leaf, its rank is zero
+        if node < self.width:
+            return 0
+
+        # Calculate info that this node needs
+        lchild, rchild = self.left[node], self.right[node]
+        lwidth = bin(self.leafs[lchild]).count("1") - 1
+        rwidth = bin(self.leafs[rchild]).count("1") - 1
+
+        # Calculate info that the children need
+        width = lwidth + rwidth + 1
+        new_mirror = lwidth >= rwidth if mirror else lwidth > rwidth
+
+        # Account for mirroring
+        if new_mirror:
+            lchild, rchild = rchild, lchild
+            lwidth, rwidth = rwidth, lwidth
+
+        # Get information from the children
+        lrank = self.rank(lchild, new_mirror)
+        rrank = self.rank(rchild, new_mirror)
+
+        # Calculate rank
+        rank = lrank + rrank * catalan(lwidth) + catalan_splits(width)[lwidth]
+
+        # Account for mirroring
+        dir_switched = new_mirror != mirror
+        return catalan(width) - rank - 1 if dir_switched else rank
+
+    def _rotate(self, node, index):
+        """Rotates node above its parent, where node is the parent's index-th
+        child; see left_rotate and right_rotate"""
+        if node < self.width or self.parent[node] == -1:
+            raise ValueError("Can only rotate nodes with full families")
+        parent = self.parent[node]
+        sides = (self.left, self.right)
+        if sides[index][parent] != node:
+            if index:
+                raise ValueError("Can only rotate right children")
+            raise ValueError("Can only rotate left children")
+
+        grandparent = self.parent[parent]
+        # The inner grandchild changes sides
+        inner = sides[1 - index][node]
+
+        self._connect(parent, inner, index)
+        self._connect(node, parent, 1 - index)
+        if grandparent == -1:
+            self.parent[node] = -1
+            self.root = node
+        else:
+            parent_dir = 0 if self.left[grandparent] == parent else 1
+            self._connect(grandparent, node, parent_dir)
+
+        self._update(parent)
+        self._update(node)
+        self._update_heights(node)
+        return node
+
+    def left_rotate(self, node):
+        """Rotate a node to the left
+
+        Args:
+            node (int): The node to rotate
+
+        Returns:
+            int: The node, which has taken its former parent's place
+        """
+        return self._rotate(node, 1)
+
+    def right_rotate(self, node):
+        """Rotate a node to the right
+
+        Args:
+            node (int): The node to rotate
+
+        Returns:
+            int: The node, which has taken its former parent's place
+        """
+        return self._rotate(node, 0)
+
+    def materialize(self, tree_type=None, **kwargs):
+        """Builds a full ExpressionTree with the shape of this skeleton
+
+        Args:
+            tree_type (class): The type of tree to build; AdderTree by default
+            kwargs: Further arguments for the tree's constructor
+
+        Returns:
+            ExpressionTree: The materialized tree
+        """
+        if tree_type is None:
+            from .AdderTree import AdderTree as tree_type
+
+        return tree_type(width=self.width, start_point=self.rank(), **kwargs)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
@@ -0,0 +1,246 @@
+import heapq
+from array import array
+
+
+class StaticTiming:
+    """Performs static timing analysis on a tree or a forest
+
+    Delays follow the method of logical effort, with all gates of unit size.
+    A node's delay is its parasitic delay (pd), plus the logical effort (le)
+    of every input pin it drives. An equivalence class is built only once in
+    hardware, so its representative drives the parents of all of its nodes.
+    Equivalent parents share a single input pin.
+
+    Timing data is kept in arrays, indexed by node. The graph notifies the
+    analysis of every node and edge that changes, such as during rotations or
+    buffer insertions. Only the arrival times of the affected nodes and their
+    ancestors are recalculated, the next time that timing data is queried.
+    Required times are recalculated on demand.
+
+    Attributes:
+        graph (ExpressionGraph): The tree or forest being analyzed
+        trees (list of ExpressionTree): The trees being analyzed
+        output_load (float): The load driven by the root of each tree
+    """
+
+    def __init__(self, graph, output_load=1.0):
+        """Initializes the analysis, and attaches it to the graph
+
+        Args:
+            graph (ExpressionTree or ExpressionForest): The graph to analyze
+            output_load (float): The load driven by the root of each tree
+        """
+        self.graph = graph
+        self.trees = getattr(graph, "trees", [graph])
+        self.output_load = output_load
+
+        self._index = {}
+        self._free = []
+        self._delay = array("d")
+        self._arrival = array("d")
+        self._required = array("d")
+        self._required_valid = False
+        self._target = None
+        self._dirty = set()
+
+        graph._timing = self
+        for t in self.trees:
+            t._timing = self
+        self.update(full=True)
+
+    def detach(self):
+        """Stops the graph from notifying this analysis of changes"""
+        for g in [self.graph] + self.trees:
+            if g._timing is self:
+                g._timing = None
+
+    def _touch(self, node):
+        """Records that a node, or its connections, have changed"""
+        self._dirty.add(node)
+
+    def _slot(self, node):
+        """Returns the index of a node in the timing arrays"""
+        index = self._index.get(node)
+        if index is None:
+            if self._free:
+                index = self._free.pop()
+            else:
+                index = len(self._delay)
+                self._delay.append(0.0)
+                self._arrival.append(0.0)
+                self._required.append(0.0)
+            self._index[node] = index
+        return index
+
+    def _loads(self, rep):
+        """Returns the load driven by the representative of a class"""
+        pins = set()
+        load = 0.0
+        for node in rep.equiv_class:
+            parent = node.parent
+            if parent is None:
+                load += self.output_load
+                continue
+            index = parent.children.index(node)
+            pin = (parent.equiv_class.rep, index)
+            if pin not in pins:
+                pins.add(pin)
+                load += parent.node_data["le"][index]
+        return load
+
+    def _fanout(self, rep):
+        """Yields the representatives of all parents of a class"""
+        for node in rep.equiv_class:
+            if node.parent is not None:
+                yield node.parent.equiv_class.rep
+
+    def _calc_delay(self, rep):
+        """Recalculates the delay of a representative"""
+        delay = rep.node_data["pd"] + self._loads(rep)
+        self._delay[self._slot(rep)] = delay
+        return delay
+
+    def _calc_arrival(self, rep):
+        """Recalculates the arrival time at the output of a representative
+
+        Returns:
+            bool: Whether the arrival time changed
+        """
+        index = self._slot(rep)
+        arrival = 0.0
+        for c in rep:
+            if c is not None:
+                c = c.equiv_class.rep
+                arrival = max(arrival, self._arrival[self._index[c]])
+        arrival += self._delay[index]
+        if arrival == self._arrival[index]:
+            return False
+        self._arrival[index] = arrival
+        return True
+
+    def _reps(self):
+        """Returns all representatives, ordered from the leafs upward"""
+        reps = set()
+        for t in self.trees:
+            for n in t:
+                reps.add(n.equiv_class.rep)
+        return sorted(reps, key=len)
+
+    def update(self, full=False):
+        """Brings the timing data up to date with the graph
+
+        This is called automatically before timing data is queried.
+        Changes to equivalence classes are not tracked; a full update is
+        required after equivalent nodes are found or reset.
+
+        Args:
+            full (bool): Whether to recalculate all timing data
+        """
+        if full:
+            self._index = {}
+            self._free = []
+            self._delay = array("d")
+            self._arrival = array("d")
+            self._required = array("d")
+            self._dirty = set()
+            reps = self._reps()
+            for rep in reps:
+                self._calc_delay(rep)
+            for rep in reps:
+                self._calc_arrival(rep)
+            self._required_valid = False
+            return
+
+        if not self._dirty:
+            return
+        dirty = self._dirty
+        self._dirty = set()
+
+        # Release the slots of nodes that have left the graph
+        heap = []
+        for node in dirty:
+            if node.graph is None or node not in node.graph:
+                index = self._index.pop(node, None)
+                if index is not None:
+                    self._free.append(index)
+                continue
+            rep = node.equiv_class.rep
+            self._calc_delay(rep)
+            heap.append((len(rep), id(rep), rep))
+        heapq.heapify(heap)
+
+        # Propagate arrival times upward, children before parents
+        done = set()
+        while heap:
+            _, _, rep = heapq.heappop(heap)
+            if rep in done:
+                continue
+            done.add(rep)
+            if self._calc_arrival(rep):
+                for parent in self._fanout(rep):
+                    if parent not in done:
+                        heapq.heappush(heap, (len(parent), id(parent), parent))
+        self._required_valid = False
+
+    def _update_required(self, target):
+        """Recalculates the required times of all nodes, in one backward pass"""
+        for rep in reversed(self._reps()):
+            index = self._index[rep]
+            required = None
+            for node in rep.equiv_class:
+                parent = node.parent
+                if parent is None:
+                    time = target
+                else:
+                    parent = self._index[parent.equiv_class.rep]
+                    time = self._required[parent] - self._delay[parent]
+                if required is None or time < required:
+                    required = time
+            self._required[index] = required
+        self._required_valid = True
+
+    def delay(self):
+        """Returns the delay of the graph's critical path"""
+        self.update()
+        return max(self.arrival(t.root) for t in self.trees)
+
+    def arrival(self, node):
+        """Returns the arrival time at the output of a node"""
+        self.update()
+        return self._arrival[self._index[node.equiv_class.rep]]
+
+    def required(self, node, target=None):
+        """Returns the time by which the output of a node is required
+
+        Args:
+            node (ExpressionNode): The node to query
+            target (float): The required time at the trees' roots
+                By default, this is the delay of the critical path
+        """
+        if target is None:
+            target = self.delay()
+        else:
+            self.update()
+        if not self._required_valid or target != self._target:
+            self._target = target
+            self._update_required(target)
+        return self._required[self._index[node.equiv_class.rep]]
+
+    def slack(self, node, target=None):
+        """Returns the slack of a node; negative if it misses the target"""
+        return self.required(node, target) - self.arrival(node)
+
+    def critical_path(self):
+        """Returns the nodes along the critical path, from root to leaf"""
+        self.update()
+        node = max((t.root for t in self.trees), key=self.arrival)
+        path = [node.equiv_class.rep]
+        while node.children:
+            children = [c for c in node if c is not None]
+            node = max(children, key=self.arrival).equiv_class.rep
+            path.append(node)
+        return path
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
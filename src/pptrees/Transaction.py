@@ -0,0 +1,205 @@
+# Marks entries that did not exist before a change
+_MISSING = object()
+
+
+class Transaction:
+    """Records the changes made to a tree, so that they can be rolled back
+
+    While the transaction is open, the tree's mutation methods save each node,
+    adjacency and edge the first time that they change it. Rolling back
+    restores these in reverse order, so it takes time linear in the number of
+    changes, rather than in the size of the tree.
+
+    The depth index of the tree is derived from the nodes that were restored.
+    If nodes were removed, networkx's order of nodes is also saved, in one
+    pass, so that HDL is generated in the same order after rolling back.
+    Net numbers are never reused, so nets that were created by the rolled-back
+    changes are left unused.
+
+    Attributes:
+        tree (ExpressionTree): The tree whose changes are recorded
+    """
+
+    def __init__(self, tree):
+        """Prepares a transaction on a tree, which opens in a with statement
+
+        Args:
+            tree (ExpressionTree): The tree whose changes are recorded
+        """
+        self.tree = tree
+        self._log = []
+        self._nodes = set()
+        self._edges = set()
+        self._order = None
+        self._root = None
+
+    def __enter__(self):
+        tree = self.tree
+        if tree._journal is not None:
+            raise ValueError("The tree already has an open transaction")
+        self._root = tree.root
+        tree._journal = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.rollback()
+        self.tree._journal = None
+        self._clear()
+        return False
+
+    def __len__(self):
+        """Returns the number of changes recorded since the last rollback"""
+        return len(self._log)
+
+    def _clear(self):
+        """Forgets the recorded changes"""
+        self._log = []
+        self._nodes = set()
+        self._edges = set()
+        self._order = None
+
+    def rollback(self):
+        """Restores the tree to its state when the transaction was opened
+
+        The transaction stays open, and records any further changes.
+        """
+        tree = self.tree
+        if tree._journal is not self:
+            raise ValueError("The transaction is not open")
+
+        # Restore without recording the restoration itself
+        tree._journal = None
+        try:
+            for node in self._nodes:
+                tree._move_row(node, node._y_pos, None)
+            for restore, args in reversed(self._log):
+                restore(*args)
+            if self._order is not None:
+                self._restore_order()
+            tree.root = self._root
+
+            graph = tree._node
+            rows = tree._rows
+            for node in self._nodes:
+                if node in graph:
+                    rows.setdefault(node._y_pos, set()).add(node)
+                if tree._timing is not None:
+                    tree._timing._touch(node)
+            tree._version += 1
+        finally:
+            tree._journal = self
+        self._clear()
+
+    def _save_node(self, node):
+        """Saves the state of a node, before it first changes"""
+        if node in self._nodes:
+            return
+        self._nodes.add(node)
+        # Lists of nets may be shared, so they are restored in place
+        nets = [
+            (x, x.copy())
+            for x in [*node.in_nets.values(), *node.out_nets.values()]
+        ]
+        ec = node._equiv_class
+        parents = None if ec is None else ec.parents.copy()
+        state = (
+            node.value,
+            node.node_data,
+            node.children.copy(),
+            node.parent,
+            node.leafs,
+            node._height,
+            node.graph,
+            node.block,
+            ec,
+            node.name_offsets,
+            node.x_pos,
+            node._y_pos,
+        )
+        self._log.append((self._restore_node, (node, state, nets, parents)))
+
+    def _restore_node(self, node, state, nets, parents):
+        (
+            node.value,
+            node.node_data,
+            children,
+            node.parent,
+            node.leafs,
+            node._height,
+            node.graph,
+            node.block,
+            node._equiv_class,
+            node.name_offsets,
+            node.x_pos,
+            node._y_pos,
+        ) = state
+        node.children[:] = children
+        for x, old in nets:
+            x[:] = old
+        if parents is not None:
+            node._equiv_class.parents = parents
+
+    def _save_path(self, node):
+        """Saves a node and its ancestors, whose leafs and heights follow"""
+        while node is not None:
+            self._save_node(node)
+            node = node.parent
+
+    def _save_edges(self, node):
+        """Saves a node's entries in networkx, before they first change"""
+        if node in self._edges:
+            return
+        self._edges.add(node)
+        entries = []
+        for name in ["_node", "_succ", "_pred"]:
+            x = getattr(self.tree, name).get(node, _MISSING)
+            entries.append((x, None if x is _MISSING else x.copy()))
+        self._log.append((self._restore_edges, (node, entries)))
+
+    def _restore_edges(self, node, entries):
+        for name, (x, old) in zip(["_node", "_succ", "_pred"], entries):
+            adjacency = getattr(self.tree, name)
+            if x is _MISSING:
+                adjacency.pop(node, None)
+                continue
+            x.clear()
+            x.update(old)
+            adjacency[node] = x
+
+    def _save_order(self):
+        """Saves networkx's order of nodes, before a node is first removed"""
+        if self._order is None:
+            self._order = list(self.tree._node)
+
+    def _restore_order(self):
+        # Nodes added before the order was saved were removed again
+        for name in ["_node", "_succ", "_pred"]:
+            x = getattr(self.tree, name)
+            items = [(n, x[n]) for n in self._order if n in x]
+            x.clear()
+            x.update(items)
+
+    def _save_edge_data(self, data):
+        """Saves the attributes of an edge, before they change in place"""
+        old = {
+            k: v.copy() if isinstance(v, list) else v for k, v in data.items()
+        }
+        self._log.append((self._restore_edge_data, (data, old)))
+
+    def _restore_edge_data(self, data, old):
+        data.clear()
+        data.update(old)
+
+    def _save_attribute(self, obj, name):
+        """Saves an attribute of an object, before it is replaced"""
+        self._log.append((setattr, (obj, name, getattr(obj, name))))
+
+    def _save_add(self, items, x):
+        """Records that an item is about to be added to a set"""
+        if x not in items:
+            self._log.append((items.discard, (x,)))
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not intended to be run directly")
@@ -0,0 +1,174 @@
+from bisect import bisect_right
+from functools import lru_cache
+
+from .util import catalan, catalan_mirror_point, catalan_split, catalan_splits
+
+# Trees of n internal nodes are counted here, as in util's Catalan helpers
+# Heights are counted as in SkeletonTree.height; a leaf has height 0
+
+
+def _count(n, height):
+    """Counts the trees of n internal nodes, of height at most height"""
+    if height >= n:
+        return catalan(n)
+    if n >= 1 << height:
+        return 0
+    return _splits(n, height)[-1]
+
+
+@lru_cache(maxsize=None)
+def _splits(n, height):
+    """Returns the prefix sums of _count's recurrence, as in catalan_splits"""
+    splits = [0]
+    for i in range(n):
+        splits.append(
+            splits[-1] + _count(i, height - 1) * _count(n - i - 1, height - 1)
+        )
+    return splits
+
+
+def _fits(n, height, mirror, rank):
+    """Checks whether the tree of a rank is at most height high"""
+    if height >= n:
+        return True
+    if n >= 1 << height:
+        return False
+
+    # This follows the exact same scheme as ExpressionTree.unrank
+    if rank >= catalan_mirror_point(n):
+        mirror = not mirror
+        rank = catalan(n) - 1 - rank
+    i1, rank = catalan_split(n, rank)
+    ci1 = catalan(i1)
+    return _fits(i1, height - 1, mirror, rank % ci1) and _fits(
+        n - i1 - 1, height - 1, mirror, rank // ci1
+    )
+
+
+def _rank(n, height, mirror, rank):
+    """Counts the trees of height at most height, that rank below a rank"""
+    if height >= n:
+        return rank
+    if n >= 1 << height:
+        return 0
+
+    # Ranks past the mirror point count down, in the mirrored scheme
+    if rank <= catalan_mirror_point(n):
+        return _rank_unmirrored(n, height, mirror, rank)
+    return _count(n, height) - _rank_unmirrored(
+        n, height, not mirror, catalan(n) - rank
+    )
+
+
+def _rank_unmirrored(n, height, mirror, rank):
+    """Counts as _rank does, for a rank that is not mirrored"""
+    if rank >= catalan(n):
+        return _count(n, height)
+    i1, rank = catalan_split(n, rank)
+    i2 = n - i1 - 1
+    ci1 = catalan(i1)
+
+    # Subtrees are ordered by the rank of the second, then of the first
+    count = _splits(n, height)[i1]
+    count += _rank(i2, height - 1, mirror, rank // ci1) * _count(i1, height - 1)
+    if _fits(i2, height - 1, mirror, rank // ci1):
+        count += _rank(i1, height - 1, mirror, rank % ci1)
+    return count
+
+
+def _unrank(n, height, mirror, index):
+    """Returns the rank of the index-th tree of height at most height"""
+    if height >= n:
+        return index
+
+    # Trees past the mirror point are found in the mirrored scheme
+    middle = _splits(n, height)[(n + 1) // 2]
+    if index < middle:
+        return _unrank_unmirrored(n, height, mirror, index)
+    index = _count(n, height) - 1 - index
+    return catalan(n) - 1 - _unrank_unmirrored(n, height, not mirror, index)
+
+
+def _unrank_unmirrored(n, height, mirror, index):
+    """Unranks as _unrank does, for an index that is not mirrored"""
+    splits = _splits(n, height)
+    i1 = bisect_right(splits, index) - 1
+    index -= splits[i1]
+    i2 = n - i1 - 1
+    count1 = _count(i1, height - 1)
+
+    rank1 = _unrank(i1, height - 1, mirror, index % count1)
+    rank2 = _unrank(i2, height - 1, mirror, index // count1)
+    return catalan_splits(n)[i1] + rank1 + rank2 * catalan(i1)
+
+
+def _check(width, height):
+    """Checks the arguments shared by this module's functions"""
+    if not isinstance(width, int) or not isinstance(height, int):
+        raise TypeError("Tree width and height must be integers")
+    if width < 1:
+        raise ValueError("Tree width must be at least 1")
+    if height < 0:
+        raise ValueError("Tree height must be non-negative")
+
+
+def count(width, height):
+    """Counts the trees of a width, whose height is at most height
+
+    Args:
+        width (int): The number of leaves in the trees
+        height (int): The maximum height of the trees
+            This is counted as in SkeletonTree.height
+
+    Returns:
+        int: The number of such trees
+    """
+    _check(width, height)
+    return _count(width - 1, height)
+
+
+def rank_constrained(width, height, rank):
+    """Ranks a tree among the trees of a width whose height is bounded
+
+    The trees of bounded height keep the order of their Catalan IDs, so a
+    tree's constrained rank is the number of such trees of lower Catalan ID.
+    Without a binding bound, the constrained rank is the Catalan ID itself.
+
+    Args:
+        width (int): The number of leaves in the tree
+        height (int): The maximum height of the trees
+        rank (int): The Catalan ID of the tree, as returned by rank()
+
+    Returns:
+        int: The rank of the tree among the trees of bounded height
+    """
+    _check(width, height)
+    if rank < 0 or rank >= catalan(width - 1):
+        raise ValueError("Tree rank out of bounds")
+    if not _fits(width - 1, height, False, rank):
+        raise ValueError("Tree is higher than the given height")
+    return _rank(width - 1, height, False, rank)
+
+
+def unrank_constrained(width, height, index):
+    """Finds a tree among the trees of a width whose height is bounded
+
+    This is the inverse of rank_constrained. The returned Catalan ID can
+    start an AdderTree, unrank a SkeletonTree, or be swept.
+
+    Args:
+        width (int): The number of leaves in the tree
+        height (int): The maximum height of the trees
+        index (int): The rank of the tree among the trees of bounded height
+
+    Returns:
+        int: The Catalan ID of the tree
+    """
+    _check(width, height)
+    if index < 0 or index >= _count(width - 1, height):
+        raise ValueError("Tree rank out of bounds")
+    return _unrank(width - 1, height, False, index)
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not intended to be run directly")
@@ -190,7 +190,7 @@ entity muxi2 is
 end entity;
 
 begin
-  Y <= not (B when S = '1' else A);
+  Y <= not B when S = '1' else not A;
 end architecture;
 
 library ieee;
@@ -406,7 +406,7 @@ end entity;
 
 architecture behavior of oai22 is
 begin
-  Y <= not (A0 or A1) and (B0 or B1);
+  Y <= not ((A0 or A1) and (B0 or B1));
 end architecture;
 
 library ieee;
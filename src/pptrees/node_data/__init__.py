@@ -1,16 +1,48 @@
+from collections.abc import Mapping
 from importlib import import_module
-from pathlib import Path
+from pkgutil import iter_modules
 
-for f in Path(__file__).parent.glob("*.py"):
-    module_name = f.stem
-    if (not module_name.startswith("_")) and (module_name not in globals()):
-        import_module(f".{module_name}", __package__)
-    del f, module_name
-del import_module, Path
+from ..NodeDef import NodeDef
 
 __all__ = ["node_data"]
 
-imported = [globals()[x] for x in dir() if x[0] != "_"]
-node_data = {}
-for x in imported:
-    node_data[getattr(x, "name")] = getattr(x, "data")
+
+class _NodeData(Mapping):
+    """Maps the name of each node definition to its NodeDef
+
+    Each definition lives in the submodule of the same name. The index of
+    names is read from the package's directory, and a definition is only
+    imported the first time that it is looked up.
+    """
+
+    def __init__(self):
+        self._index = sorted(
+            x.name for x in iter_modules(__path__) if not x.name.startswith("_")
+        )
+        self._names = frozenset(self._index)
+        self._data = {}
+
+    def __getitem__(self, name):
+        data = self._data.get(name)
+        if data is None:
+            if name not in self._names:
+                raise KeyError(name)
+            module = import_module("." + name, __name__)
+            if module.name != name:
+                raise ValueError(
+                    "Node {0} is named {1}".format(name, module.name)
+                )
+            data = self._data[name] = NodeDef(name, module.data)
+        return data
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+node_data = _NodeData()
@@ -52,7 +52,7 @@ data["fillcolor"] = "white"
 data["ins"] = [("gin", 1, 1, 0), ("pin", 1, 1, 0)]
 data["outs"] = [("gout", 1), ("pout", 1)]
 
-data["logic"] = lambda pin, gin: [pin, gin]
+data["logic"] = lambda gin, pin: [gin, pin]
 
 data["pd"] = 2
 data["le"] = [1, 1]
@@ -47,7 +47,7 @@ data["style"] = "dashed"
 data["ins"] = [("a_in", 1, 1, 0), ("b_in", 1, 0, 1)]
 data["outs"] = [("xout", 1)]
 
-data["logic"] = lambda pin, gin: [pin ^ gin]
+data["logic"] = lambda a_in, b_in: [a_in ^ b_in]
 
 data["pd"] = 9 / 3
 data["le"] = [9 / 3, 9 / 3]
@@ -37,7 +37,10 @@ data["ins"] = [
 ]
 data["outs"] = [("xout", 1), ("yout", 1)]
 
-# ppa_lspine_single["logic"] = lambda pin, gin: [pin ^ gin, ~(pin ^ gin)]
+data["logic"] = lambda xin, yin, pin, gin: [
+    (gin & yin) | (~gin & xin),
+    (pin & yin) | (~pin & xin),
+]
 
 data["pd"] = 9 / 3
 data["le"] = [9 / 3, 9 / 3]
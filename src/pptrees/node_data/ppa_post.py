@@ -52,7 +52,7 @@ data["fontsize"] = "52"
 data["ins"] = [("gin", 1, 0, 1), ("xin", 1, 1, 0), ("yin", 1, 1, 0)]
 data["outs"] = [("sum", 1)]
 
-data["logic"] = lambda yin, xin, gin: [yin if gin else xin]
+data["logic"] = lambda gin, xin, yin: [(gin & yin) | (~gin & xin)]
 
 data["pd"] = 9 / 3
 data["le"] = [9 / 3, 9 / 3]
@@ -56,7 +56,7 @@ data["style"] = "dashed"
 data["ins"] = [("a_in", 1, 1, 0), ("b_in", 1, 1, 0)]
 data["outs"] = [("pout", 1), ("gout", 1)]
 
-data["logic"] = lambda a, b: [a | b, a & b]
+data["logic"] = lambda a_in, b_in: [a_in | b_in, a_in & b_in]
 
 data["pd"] = 2
 data["le"] = [5.0 / 3, 5.0 / 3]
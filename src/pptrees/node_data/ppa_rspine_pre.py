@@ -47,7 +47,7 @@ data["style"] = "dashed"
 data["ins"] = [("a_in", 1, 1, 0), ("b_in", 1, 1, 0)]
 data["outs"] = [("gout", 1)]
 
-data["logic"] = lambda a, b: [0, a & b]
+data["logic"] = lambda a_in, b_in: [a_in & b_in]
 
 data["pd"] = 2
 data["le"] = [4.0 / 3, 4.0 / 3]
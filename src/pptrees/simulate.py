@@ -0,0 +1,380 @@
+import random
+from functools import lru_cache
+
+from .ExpressionForest import ExpressionForest
+from .NetTable import port_net
+
+
+def pack(values, width):
+    """Packs a list of input vectors into bit-parallel words
+
+    Each word holds one bit of every vector, so that bit k of word i is
+    bit i of the k-th vector.
+
+    Args:
+        values (list of int): The input vectors
+        width (int): The number of bits in each vector
+
+    Returns:
+        list of int: One word per bit of the vectors
+    """
+    if not values:
+        return [0] * width
+    # Transpose the vectors' binary strings, so that each word can be parsed
+    # in one go instead of being assembled bit by bit
+    rows = [format(v, "0{0}b".format(width))[-width:] for v in values]
+    words = [int("".join(reversed(col)), 2) for col in zip(*rows)]
+    return words[::-1]
+
+
+def unpack(words, lanes):
+    """Unpacks bit-parallel words into a list of vectors
+
+    This is the inverse of pack.
+
+    Args:
+        words (list of int): One word per bit of the vectors
+        lanes (int): The number of vectors packed into the words
+
+    Returns:
+        list of int: The vectors
+    """
+    if not words:
+        return [0] * lanes
+    mask = (1 << lanes) - 1
+    rows = [format(w & mask, "0{0}b".format(lanes)) for w in words]
+    values = [int("".join(reversed(col)), 2) for col in zip(*rows)]
+    return values[::-1]
+
+
+def _port_nets(ports):
+    """Yields the nets of a graph's ports, along with their names and bits"""
+    for (name, width), _ in ports:
+        if width == 1:
+            yield port_net(name), name, 0
+        else:
+            for i in range(width):
+                yield port_net(name, i), name, i
+
+
+def _simulate_tree(tree, inputs, mask, nets):
+    """Evaluates a tree's nodes and returns the words on its output ports"""
+    for net, name, i in _port_nets(tree.in_ports):
+        nets[net] = inputs[name][i]
+
+    # Visit deeper rows first, so that children precede parents
+    for depth in sorted(tree._rows, reverse=True):
+        for node in tree._rows[depth]:
+            logic = node.node_data.get("logic")
+            if logic is None:
+                raise ValueError("Node {0} has no logic".format(node))
+            # Multi-bit pins are listed most-significant bit first
+            kwargs = {}
+            for pin, pin_nets in node.in_nets.items():
+                words = [nets[x] for x in reversed(pin_nets)]
+                kwargs[pin] = words[0] if len(words) == 1 else words
+            outs = logic(**kwargs)
+            for (pin, _), word in zip(node.node_data["outs"], outs):
+                # Python integers have no fixed width, so complements
+                # must be truncated to the number of lanes
+                if isinstance(word, int):
+                    word &= mask
+                for net in node.out_nets[pin]:
+                    if net is not None:
+                        nets[net] = word
+
+    outputs = {}
+    for net, name, i in _port_nets(tree.out_ports):
+        outputs.setdefault(name, []).append(nets[net])
+    return outputs
+
+
+class _Symbol:
+    """Records the operations that a logic function applies to its inputs"""
+
+    __slots__ = ("expr",)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def _binary(self, other, op):
+        if isinstance(other, _Symbol):
+            other = other.expr
+        return _Symbol("({0} {1} {2})".format(self.expr, op, other))
+
+    def __and__(self, other):
+        return self._binary(other, "&")
+
+    def __or__(self, other):
+        return self._binary(other, "|")
+
+    def __xor__(self, other):
+        return self._binary(other, "^")
+
+    def __invert__(self):
+        return _Symbol("~" + self.expr)
+
+    __rand__ = __and__
+    __ror__ = __or__
+    __rxor__ = __xor__
+
+
+def _kernel_source(graph):
+    """Generates the source code of a graph's simulation kernel
+
+    Nodes with the same value and leafs, whose children are also identical,
+    compute the same function. Each such expression is generated only once,
+    which shares logic across the trees of a forest just as its equivalence
+    classes do in HDL.
+    """
+    lines = ["def kernel(inputs):"]
+    variables = {}
+    nets = {}
+    bits = {}
+    # Structurally identical nodes map to the same class, and its outputs
+    classes = {}
+    node_classes = {}
+
+    def new_variable(expr, prefix="v"):
+        # Pass-throughs, such as buffers, need no new variable
+        if expr.isidentifier():
+            return expr
+        name = "{0}{1}".format(prefix, len(variables))
+        variables[name] = expr
+        lines.append("    {0} = {1}".format(name, expr))
+        return name
+
+    if isinstance(graph, ExpressionForest):
+        trees = list(reversed(graph.trees))
+    else:
+        trees = [graph]
+
+    tree_outputs = []
+    for tree in trees:
+        for net, name, i in _port_nets(tree.in_ports):
+            if (name, i) not in bits:
+                expr = "inputs[{0!r}][{1}]".format(name, i)
+                bits[(name, i)] = new_variable(expr, "i")
+            nets[net] = bits[(name, i)]
+
+        # Visit deeper rows first, so that children precede parents
+        for depth in sorted(tree._rows, reverse=True):
+            for node in tree._rows[depth]:
+                children = tuple(
+                    None if c is None else node_classes[c]
+                    for c in node.children
+                )
+                key = (node.value, node.leafs, children)
+                if key in classes:
+                    outs = classes[key][1]
+                else:
+                    logic = node.node_data.get("logic")
+                    if logic is None:
+                        raise ValueError("Node {0} has no logic".format(node))
+                    kwargs = {}
+                    for pin, pin_nets in node.in_nets.items():
+                        try:
+                            words = [
+                                _Symbol(nets[x]) for x in reversed(pin_nets)
+                            ]
+                        except KeyError:
+                            raise ValueError(
+                                "Node {0} has an undriven input".format(node)
+                            )
+                        kwargs[pin] = words[0] if len(words) == 1 else words
+                    outs = [
+                        new_variable(
+                            x.expr if isinstance(x, _Symbol) else repr(x)
+                        )
+                        for x in logic(**kwargs)
+                    ]
+                    classes[key] = (len(classes), outs)
+                node_classes[node] = classes[key][0]
+                for (pin, _), var in zip(node.node_data["outs"], outs):
+                    for net in node.out_nets[pin]:
+                        if net is not None:
+                            nets[net] = var
+
+        outputs = {}
+        for net, name, i in _port_nets(tree.out_ports):
+            outputs.setdefault(name, []).append(nets[net])
+        tree_outputs.append(outputs)
+
+    # Tree k drives bit k of the forest's outputs
+    if isinstance(graph, ExpressionForest):
+        outputs = {name: [] for (name, _), _ in graph.out_ports}
+        for tree_out in reversed(tree_outputs):
+            for name, words in tree_out.items():
+                outputs[name].append(words[0])
+    else:
+        outputs = tree_outputs[0]
+    ret = ", ".join(
+        "{0!r}: [{1}]".format(name, ", ".join(words))
+        for name, words in outputs.items()
+    )
+    lines.append("    return {" + ret + "}")
+    return "\n".join(lines) + "\n"
+
+
+@lru_cache(maxsize=64)
+def _compile_kernel(source):
+    """Compiles the source code of a kernel, caching the result"""
+    namespace = {}
+    exec(compile(source, "<pptrees kernel>", "exec"), namespace)
+    return namespace["kernel"]
+
+
+def compile_graph(graph):
+    """Compiles a tree or forest into a straight-line simulation kernel
+
+    The kernel is a Python function that takes a dict mapping each input
+    port's name to a list of words, and returns a dict mapping each output
+    port's name to a list of words, as simulate does. Kernels are cached on
+    the graph until its structure changes, and by their source code, so that
+    graphs of the same structure share a kernel.
+
+    Complements are not truncated in the kernel; negative Python integers
+    must be masked to the number of lanes by the caller.
+
+    Args:
+        graph (ExpressionTree or ExpressionForest): The graph to compile
+
+    Returns:
+        function: The simulation kernel of the graph
+    """
+    if isinstance(graph, ExpressionForest):
+        version = tuple(t._version for t in graph.trees)
+    else:
+        version = graph._version
+
+    # Only generate the kernel's source again if the graph has changed
+    if graph._kernel is None or graph._kernel[0] != version:
+        graph._kernel = (version, _compile_kernel(_kernel_source(graph)))
+    return graph._kernel[1]
+
+
+def simulate(graph, inputs, lanes=None, compiled=False):
+    """Evaluates a tree or forest over many input vectors at once
+
+    Each node's logic function is called once per batch of vectors, on
+    bit-parallel words such as those returned by pack. Words can be Python
+    integers of any length, or any other type with bitwise operators, such as
+    NumPy arrays of unsigned integers.
+
+    Args:
+        graph (ExpressionTree or ExpressionForest): The graph to evaluate
+        inputs (dict): Maps each input port's name to a list of words,
+            one per bit of the port
+        lanes (int): The number of vectors packed into the words
+            This is only needed for Python integers, to truncate complements
+        compiled (bool): Whether to evaluate the graph's compiled kernel
+            instead of walking its nodes; see compile_graph
+
+    Returns:
+        dict: Maps each output port's name to a list of words
+    """
+    if lanes is None:
+        mask = -1
+    else:
+        mask = (1 << lanes) - 1
+
+    if compiled:
+        outputs = compile_graph(graph)(inputs)
+        for words in outputs.values():
+            for i, word in enumerate(words):
+                if isinstance(word, int):
+                    words[i] = word & mask
+        return outputs
+
+    # Nets are shared across trees, as equivalent nodes may be read by
+    # narrower trees once a forest has been prepared for HDL
+    nets = {}
+    if not isinstance(graph, ExpressionForest):
+        return _simulate_tree(graph, inputs, mask, nets)
+
+    # Tree k drives bit k of the forest's outputs
+    outputs = {name: [] for (name, _), _ in graph.out_ports}
+    for t in reversed(graph.trees):
+        for name, words in _simulate_tree(t, inputs, mask, nets).items():
+            outputs[name].append(words[0])
+    for words in outputs.values():
+        words.reverse()
+    return outputs
+
+
+def equivalent(graph, reference, lanes=256, seed=None, compiled=False):
+    """Checks whether a graph computes the same function as a reference
+
+    If there are no more input combinations than lanes, all of them are
+    checked. Otherwise, lanes random input vectors are checked.
+
+    Args:
+        graph (ExpressionTree or ExpressionForest): The graph to check
+        reference (function): Maps the values of the graph's input ports,
+            passed as keyword arguments, to a dict of output port values
+        lanes (int): The number of input vectors to check
+        seed (int): The seed of the random number generator
+        compiled (bool): Whether to simulate the graph's compiled kernel
+
+    Returns:
+        bool: Whether the graph matched the reference on all vectors
+    """
+    in_ports = [x[0] for x in graph.in_ports]
+    in_bits = sum(w for _, w in in_ports)
+
+    # Draw the input vectors
+    if 1 << in_bits <= lanes:
+        lanes = 1 << in_bits
+        combined = range(lanes)
+    else:
+        rng = random.Random(seed)
+        combined = [rng.getrandbits(in_bits) for _ in range(lanes)]
+    vectors = {}
+    shift = 0
+    for name, width in in_ports:
+        vectors[name] = [c >> shift & ((1 << width) - 1) for c in combined]
+        shift += width
+
+    inputs = {n: pack(vectors[n], w) for n, w in in_ports}
+    outputs = simulate(graph, inputs, lanes, compiled=compiled)
+    outputs = {n: unpack(words, lanes) for n, words in outputs.items()}
+
+    for k in range(lanes):
+        expected = reference(**{n: vectors[n][k] for n, _ in in_ports})
+        for name, values in outputs.items():
+            if values[k] != expected[name]:
+                return False
+    return True
+
+
+def is_adder(graph, lanes=256, seed=None, compiled=False):
+    """Checks whether an adder tree or forest computes a + b
+
+    A forest of width w must compute the w-bit sum of its inputs.
+    A tree of width w must compute the most significant bit of that sum.
+
+    Args:
+        graph (AdderTree or AdderForest): The graph to check
+        lanes (int): The number of input vectors to check
+        seed (int): The seed of the random number generator
+        compiled (bool): Whether to simulate the graph's compiled kernel
+
+    Returns:
+        bool: Whether the graph adds its inputs
+    """
+    width = graph.width
+    if isinstance(graph, ExpressionForest):
+        shift, mask = 0, (1 << width) - 1
+    else:
+        shift, mask = width - 1, 1
+
+    def reference(a_in, b_in):
+        return {"sum": (a_in + b_in) >> shift & mask}
+
+    return equivalent(
+        graph, reference, lanes=lanes, seed=seed, compiled=compiled
+    )
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
@@ -0,0 +1,287 @@
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from .AdderTree import AdderTree
+from .constrained import count, unrank_constrained
+from .SkeletonTree import SkeletonTree
+from .util import catalan, lg
+
+
+def random_ranks(width, samples, seed=None, height=None):
+    """Yields random Catalan IDs of trees of a given width
+
+    Args:
+        width (int): The number of leaves in the trees
+        samples (int): The number of Catalan IDs to yield
+        seed (int): The seed of the random number generator
+        height (int): The maximum height of the trees
+            If given, trees are drawn uniformly among those of bounded height
+    """
+    rng = random.Random(seed)
+    if height is None:
+        max_id = catalan(width - 1)
+        for _ in range(samples):
+            yield rng.randrange(max_id)
+        return
+    max_id = count(width, height)
+    if not max_id:
+        raise ValueError("No tree of this width has the given height")
+    for _ in range(samples):
+        yield unrank_constrained(width, height, rng.randrange(max_id))
+
+
+def _rotation_moves(n):
+    """Yields the rotations of a Gray code over all binary trees of n nodes
+
+    Nodes are named 1 to n, in the order of an in-order traversal, which
+    rotations keep. The walk starts from the tree whose right children are
+    all leafs.
+
+    Node m sweeps along the right arm of every tree of nodes 1 to m - 1, in
+    alternating directions, one rotation per step. Between sweeps, node m is
+    at either end of the arm, where the rotations of the smaller trees leave
+    it in place. This is the Gray code of Lucas, Roelants van Baronaigien and
+    Ruskey. Node n makes most of the moves, so a move takes amortized O(1).
+
+    Args:
+        n (int): The number of internal nodes of the trees
+
+    Yields:
+        (int, int): The node to rotate, and the index of the node under its
+            parent; 1 for left rotations and 0 for right rotations
+    """
+    # 0 stands for a leaf, or for no parent
+    parent = [0] * (n + 1)
+    left = [0] * (n + 1)
+    right = [0] * (n + 1)
+    for k in range(2, n + 1):
+        left[k] = k - 1
+        parent[k - 1] = k
+    # Leafs have no children, so their parent may be overwritten
+    left[0] = right[0] = -1
+
+    def rotate(x):
+        p = parent[x]
+        g = parent[p]
+        if left[p] == x:
+            inner = left[p] = right[x]
+            right[x] = p
+        else:
+            inner = right[p] = left[x]
+            left[x] = p
+        parent[inner] = p
+        parent[p] = x
+        parent[x] = g
+        if left[g] == p:
+            left[g] = x
+        elif right[g] == p:
+            right[g] = x
+
+    def walk(m):
+        sub = walk(m - 1) if m > 1 else iter(())
+        down = True
+        while True:
+            if down:
+                while left[m]:
+                    x = left[m]
+                    rotate(x)
+                    yield x, 0
+            else:
+                while right[parent[m]] == m:
+                    rotate(m)
+                    yield m, 1
+            down = not down
+            move = next(sub, None)
+            if move is None:
+                return
+            yield move
+
+    yield from walk(n)
+
+
+def rotation_walk(tree, start=0, stop=None):
+    """Visits every tree of a width, by rotating a tree in place
+
+    Consecutive trees differ by a single left_rotate or right_rotate, so the
+    tree is never rebuilt. The tree is first rotated into the tree whose
+    right children are all leafs, where the walk starts. Between steps, the
+    tree can be scored in place, and analyses that update incrementally, such
+    as StaticTiming, only revisit the rotated nodes.
+
+    The trees are visited in the order of a rotation Gray code, not in the
+    order of their Catalan IDs. start and stop select a contiguous portion of
+    the walk, as with itertools.islice. Steps before start are still taken,
+    but without ranking the tree.
+
+    Args:
+        tree (ExpressionTree or SkeletonTree): The tree to rotate
+            Its nodes must be unoptimized, and free of buffers
+        start (int): The first step of the walk to yield
+        stop (int): The step of the walk to stop at
+            By default, the walk visits all catalan(width - 1) trees
+
+    Yields:
+        int: The Catalan ID of the tree, after each step
+    """
+    if not isinstance(start, int) or start < 0:
+        raise ValueError("Start must be a non-negative integer")
+    if stop is not None and not isinstance(stop, int):
+        raise TypeError("Stop must be an integer")
+
+    n = tree.width - 1
+    if stop is None or stop > catalan(n):
+        stop = catalan(n)
+
+    if isinstance(tree, SkeletonTree):
+
+        def child(node, index):
+            return (tree.left, tree.right)[index][node]
+
+        def is_leaf(node):
+            return node < tree.width
+
+    else:
+
+        def child(node, index):
+            return node[index]
+
+        def is_leaf(node):
+            return not node.children
+
+    # Rotate the tree into the one whose right children are all leafs
+    node = tree.root
+    while n and not is_leaf(node):
+        while not is_leaf(child(node, 1)):
+            node = tree.left_rotate(child(node, 1))
+        node = child(node, 0)
+
+    # Its nodes are n to 1 in order, down its left spine
+    # The node that splits leafs k and k - 1 is the (n + 1 - k)th in order
+    nodes = [None] * (n + 1)
+    node = tree.root
+    for k in range(n, 0, -1):
+        nodes[k] = node
+        node = child(node, 0)
+
+    rotate = (tree.right_rotate, tree.left_rotate)
+    moves = _rotation_moves(n)
+    for step in range(stop):
+        if step:
+            k, side = next(moves)
+            node = nodes[k] = rotate[side](nodes[k])
+            # Rotations through the left spine replace both nodes
+            if not isinstance(tree, SkeletonTree):
+                node = node[1 - side]
+                nodes[n + 1 - lg(node[0].leafs & -node[0].leafs)] = node
+        if step >= start:
+            yield tree.rank()
+
+
+def _score_chunk(width, ranks, score, tree_type, tree_kwargs):
+    """Builds and scores the trees of a chunk of Catalan IDs
+
+    This runs inside of the worker processes.
+
+    Returns:
+        list of (int, object): The Catalan IDs and scores of the trees
+    """
+    ret = []
+    for rank in ranks:
+        tree = tree_type(width=width, start_point=rank, **tree_kwargs)
+        ret.append((rank, score(tree)))
+    return ret
+
+
+def sweep(
+    width,
+    score,
+    ranks=None,
+    tree_type=AdderTree,
+    tree_kwargs=None,
+    chunk_size=64,
+    max_workers=None,
+    max_pending=None,
+):
+    """Scores trees over a portion of the Catalan space, in parallel
+
+    Trees are built and scored in chunks of Catalan IDs, by a pool of worker
+    processes. Results are streamed back in the order of the Catalan IDs.
+    Catalan IDs are drawn lazily, and only a bounded number of chunks are in
+    flight at any given time, so memory use does not depend on the size of
+    the range being swept.
+
+    Args:
+        width (int): The number of leaves in the trees
+        score (function): Maps a tree to its score
+            This must be picklable, such as a module-level function
+        ranks (iterable of int): The Catalan IDs to sweep
+            This can be a range, or a sampler such as random_ranks.
+            By default, the whole Catalan space of the width is swept.
+        tree_type (class): The type of tree to build
+            SkeletonTree is much faster, if score only needs the tree's shape
+        tree_kwargs (dict): Further arguments for the tree's constructor
+        chunk_size (int): The number of Catalan IDs in a unit of work
+        max_workers (int): The number of worker processes
+            If this is 0, the sweep runs in this process
+        max_pending (int): The maximum number of chunks in flight
+            By default, this is twice the number of worker processes
+
+    Yields:
+        (int, object): The Catalan ID of a tree, and its score
+    """
+    if not isinstance(width, int):
+        raise TypeError("Tree width must be an integer")
+    if width < 1:
+        raise ValueError("Tree width must be at least 1")
+    if not isinstance(chunk_size, int) or chunk_size < 1:
+        raise ValueError("Chunk size must be a positive integer")
+
+    if ranks is None:
+        ranks = range(catalan(width - 1))
+    if tree_kwargs is None:
+        tree_kwargs = {}
+
+    ranks = iter(ranks)
+    chunks = iter(lambda: list(islice(ranks, chunk_size)), [])
+
+    # Provide support for sweeping without a process pool
+    if max_workers == 0:
+        for chunk in chunks:
+            yield from _score_chunk(width, chunk, score, tree_type, tree_kwargs)
+        return
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 2 * max_workers
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = deque()
+        try:
+            for chunk in chunks:
+                # Keep only a bounded number of chunks in flight
+                if len(pending) >= max_pending:
+                    yield from pending.popleft().result()
+                pending.append(
+                    pool.submit(
+                        _score_chunk,
+                        width,
+                        chunk,
+                        score,
+                        tree_type,
+                        tree_kwargs,
+                    )
+                )
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            # If the caller stops early, drop the work that is still queued
+            for future in pending:
+                future.cancel()
+
+
+if __name__ == "__main__":
+    raise RuntimeError("This file is importable, but not executable")
@@ -1,6 +1,14 @@
 import os
+import pickle
 import re
-import uuid
+import tempfile
+from bisect import bisect_right
+from functools import lru_cache
+
+try:
+    from importlib.resources import path as respath
+except ImportError:
+    from importlib_resources import path as respath
 
 
 def lg(x):
@@ -26,23 +34,61 @@ def verso_pin(x):
     return x.replace("out", "in") if "out" in x else x.replace("in", "out")
 
 
+# Process-wide Catalan tables, grown lazily as wider trees are requested
+_catalan_table = [1]
+_catalan_splits_table = {}
+
+
 def catalan(n):
     """Returns the nth Catalan number"""
-    if n == 0:
-        return 1
-    return catalan(n - 1) * (4 * n - 2) // (n + 1)
+    table = _catalan_table
+    while len(table) <= n:
+        k = len(table)
+        table.append(table[-1] * (4 * k - 2) // (k + 1))
+    return table[n]
+
+
+def catalan_splits(n):
+    """Returns the prefix sums of the nth Catalan number's recurrence
+
+    The nth Catalan number is the sum of C(i) * C(n - i - 1) over all i.
+    Entry i of the returned list holds the sum of the first i such terms,
+    so that a rank can be split into its (left, right) subtree widths with a
+    binary search. Only the lists of the requested n are kept.
+
+    The returned list is shared, and must not be modified.
+    """
+    splits = _catalan_splits_table.get(n)
+    if splits is None:
+        splits = [0]
+        for i in range(n):
+            splits.append(splits[-1] + catalan(i) * catalan(n - i - 1))
+        _catalan_splits_table[n] = splits
+    return splits
+
+
+def catalan_split(n, rank):
+    """Splits a rank of the nth Catalan number into its recurrence term
+
+    Args:
+        n (int): The number of internal nodes of the tree
+        rank (int): The rank of the tree
+
+    Returns:
+        int: The index i of the term C(i) * C(n - i - 1) containing the rank
+        int: The remainder of the rank within that term
+    """
+    splits = catalan_splits(n)
+    i = bisect_right(splits, rank) - 1
+    return i, rank - splits[i]
 
 
 def catalan_mirror_point(n):
     """Returns the first safe mirror mark for the nth Catalan number"""
-    # Get the halfway mark
-    half = catalan(n) >> 1
-    # If n is odd, there's no clean split
-    if n & 1:
-        return half + (catalan(n // 2) ** 2) / 2
+    # The recurrence of Catalan numbers is symmetrical around its midpoint
     # If n is even, there's a clean split
-    else:
-        return half
+    # If n is odd, the mark falls right after the middle term
+    return catalan_splits(n)[(n + 1) // 2]
 
 
 def catalan_bounds(n):
@@ -53,19 +99,28 @@ def catalan_bounds(n):
 def match_nodes(parent, child, index):
     """Attempts to match the ports of two nodes
 
+    The match only depends on the nodes' definitions, so it is cached.
+
     Args:
         parent (Node): The parent node
         child (Node): The child node
         index (int): The index of the parent's input port
+
+    Returns:
+        tuple: (parent_pin, child_pin) pairs to connect, or None if the
+            ports do not match
     """
-    # If no match is found, will return None
-    # Otherwise will return a list of pins to be connected
-    # List items will be of the format (parent_pin, child_pin)
+    return _match_definitions(parent.node_data, child.node_data, index)
+
+
+@lru_cache(maxsize=4096)
+def _match_definitions(parent_def, child_def, index):
+    """Matches the ports of two node definitions; see match_nodes"""
     ret = []
 
     # Get the parent and child ports
-    parent_ports = parent.node_data["ins"]
-    child_ports = child.node_data["outs"]
+    parent_ports = parent_def["ins"]
+    child_ports = child_def["outs"]
 
     # Iterate over all input ports
     for port in parent_ports:
@@ -86,41 +141,39 @@ def match_nodes(parent, child, index):
             pin2 = (matching_port[0], b)
             ret.append((pin1, pin2))
 
-    return ret
+    return tuple(ret)
 
 
-def change_in_nets(node, old_nets, new_nets, index):
+def change_in_nets(node, old_nets, new_nets, index, in_nets=None):
     """Overwrites the input nets of a node's parent with new nets
 
     Args:
         node (Node): The node whose in_nets will change
         old_nets (dict): A dictionary that is node.child.out_nets
         new_nets (dict): A dictionary similar to old_nets
+        in_nets (dict): The input nets to overwrite, instead of node.in_nets
     """
+    if in_nets is None:
+        in_nets = node.in_nets
+    node_def = node.node_data
     # Loop through all output nets, making a dictionary
     dic = {}
     for k in new_nets:
         new_port = new_nets[k]
         old_port = old_nets[k]
-        verso = verso_pin(k)
+        verso = node_def.verso.get(k)
         # Check if the net is in the node's inputs
-        try:
-            node_port = node.in_nets[verso]
-        except KeyError:
+        node_port = in_nets.get(verso)
+        if node_port is None:
             continue
         # Check if the net is on the correct side of the node's inputs
-        flag = False
-        for tup in node.node_data["ins"]:
-            if tup[0] == verso and tup[2 + index] == 0:
-                flag = True
-                break
-        if flag:
+        if node_def.in_sides[verso][index] == 0:
             continue
         # Change the net names
         for a in range(len(new_port)):
             dic[old_port[a]] = new_port[a]
         node_port = [dic.get(x, x) for x in node_port]
-        node.in_nets[verso] = node_port
+        in_nets[verso] = node_port
     return node
 
 
@@ -137,23 +190,6 @@ def get_matching_port(port, other_ports):
     raise ValueError("No matching port found for {0}".format(port[0]))
 
 
-def parse_net(x):
-    """Converts a net's ID to its name in HDL
-
-    These come in 3 possible flavors:
-        - None (unassigned net) -> parsed to n0
-        - Integer (assigned net) -> parsed to n`Integer
-        - Hardcoded name ($net_name) -> parsed to net_name
-    """
-    if x is None:
-        return "n0"
-    if isinstance(x, int):
-        return "n" + str(x)
-    if "$" in x:
-        return x.replace("$", "")
-    raise TypeError("net stored in node {0} is invalid".format(repr(x)))
-
-
 hdl_syntax = {
     "verilog": {
         "entity": "module {0}(\n\t{1}\n);\n",
@@ -170,10 +206,10 @@ hdl_syntax = {
         "file_extension": ".v",
     },
     "vhdl": {
-        "entity": "entity {0} is\n\tport (\n{1}\n);\nend entity;\n\n",
+        "entity": "entity {0} is\n\tport (\n\t{1}\n\t);\nend entity;\n\n",
         "entity_in": "in",
         "entity_out": "out",
-        "entity_port": "\t\t{1} : {0} std_logic{2};\n",
+        "entity_port": "\t{1} : {0} std_logic{2};",
         "port_range": "_vector({0} downto {1})",
         "arch": (
             "architecture {0}_arch of {0} is"
@@ -181,7 +217,7 @@ hdl_syntax = {
             "end architecture {0}_arch;\n"
         ),
         "inst": ("\t{0}: {1}\n" "\t\tport map (\n{2}\n" "\t\t);"),
-        "inst_port": "\t\t{0} => {1}\n",
+        "inst_port": "\t\t\t{0} => {1}",
         "slice_markers": lambda x: x.replace("[", "(")
         .replace("]", ")")
         .replace(":", " downto "),
@@ -231,10 +267,23 @@ def hdl_arch(name, body, language="verilog"):
         body (str): The body of the architecture
         language (str): The language in which to generate the HDL
     """
-    syntax = hdl_syntax[language]
+    head, tail = hdl_arch_parts(name, language)
     if body[-1] == "\n":
         body = body[:-1]
-    return syntax["arch"].format(name, body)
+    return head + body + tail
+
+
+def hdl_arch_parts(name, language="verilog"):
+    """Returns the text before and after the body of an architecture
+
+    This lets the body be streamed; see hdl_arch.
+
+    Args:
+        name (str): The name of the entity
+        language (str): The language in which to generate the HDL
+    """
+    head, tail = hdl_syntax[language]["arch"].split("{1}")
+    return head.format(name), tail.format(name)
 
 
 def hdl_inst(inst_id, name, ports, language="verilog"):
@@ -253,18 +302,46 @@ def hdl_inst(inst_id, name, ports, language="verilog"):
     return syntax["inst"].format(inst_id, name, ",\n".join(ports_list))
 
 
+# Matches an HDL identifier, along with its bit select, if any
+hdl_identifier = re.compile(r"(?<![\w$'])([A-Za-z_][\w$]*)(\[\d+\])?")
+
+
+def sub_tokens(hdl, subs):
+    """Substitutes whole identifiers in an HDL string, in a single pass
+
+    An identifier with a bit select, such as 'a[3]', is looked up as a whole
+    first. Failing that, only its name is substituted.
+
+    Args:
+        hdl (str): The HDL in which to substitute identifiers
+        subs (dict): Maps identifiers to their substitutes
+
+    Returns:
+        str: The HDL, with its identifiers substituted
+    """
+
+    def sub(match):
+        token = match.group(0)
+        if token in subs:
+            return subs[token]
+        name, bit = match.groups()
+        if bit is not None and name in subs:
+            return subs[name] + bit
+        return token
+
+    return hdl_identifier.sub(sub, hdl)
+
+
 def sub_ports(hdl, ports):
     """Substitutes port in an HDL string with corresponding module ports"""
-    for port in sorted(ports, key=lambda x: natural_keys(x[1]), reverse=True):
-        ((local, num), remote) = port
-        if num == 1:
-            hdl = hdl.replace(local, remote)
+    subs = {}
+    for (local, num), remote in ports:
         ### NOTE: This is a complete 2 AM hack
         ### It assumes that all ports are zero-indexed, forever
-        else:
+        if num != 1:
             remote = remote.split("[")[0]
-            hdl = hdl.replace(local, remote)
-    return hdl
+        subs[local] = remote
+    return sub_tokens(hdl, subs)
 
 
 def atoi(x):
@@ -307,91 +384,224 @@ def parse_mapping(mapping_file):
     return mapping
 
 
-### NOTE: This needs to be reworked when map files are reworked
+class _CellTemplates(dict):
+    """Maps each cell of a mapping to its ports and body template
+
+    Each template is a tuple of literal strings, indices of ports, and None
+    wherever the instance name goes. Cells merged with the templates are
+    memoized, as most nodes of a graph share the same few definitions.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.merged = {}
+
+
+def compile_mapping(mapping):
+    """Tokenizes the cell bodies of a parsed mapping into templates
+
+    Behavioral bodies refer to ports by name anywhere. Structural bodies
+    refer to ports only as connections, as in '.A(A)', and name the instance
+    of the cell after the cell itself.
+
+    Args:
+        mapping (dict): A mapping, as returned by parse_mapping
+
+    Returns:
+        dict: Maps each cell to its list of ports and its body template
+    """
+    templates = _CellTemplates()
+    for cell, (ports, body) in mapping.items():
+        behav = "assign" in body
+        # Tokens alternate between literals and identifiers
+        tokens = re.split(r"([A-Za-z_]\w*)", body[:-1])
+        template = []
+        for i, token in enumerate(tokens):
+            if i % 2:
+                prev, after = tokens[i - 1], tokens[i + 1]
+                connection = prev.endswith("(") and after.startswith(")")
+                if token in ports and (behav or connection):
+                    token = ports.index(token)
+                elif token == cell and not behav and prev.endswith(" "):
+                    if after.startswith("(."):
+                        token = None
+            if isinstance(token, str) and template:
+                if isinstance(template[-1], str):
+                    template[-1] += token
+                    continue
+            template.append(token)
+        templates[cell] = (ports, tuple(template))
+    return templates
+
+
+# Process-wide registry of compiled mappings, keyed by name and language
+_mapping_registry = {}
+
+# Directory in which compiled mappings are pickled across processes
+mapping_cache_dir = None
+
+
+def _write_pickle(path, data):
+    """Pickles data to a file, which other processes only ever see whole
+
+    The cache is only an optimization, so failing to write it is ignored.
+    """
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+            try:
+                pickle.dump(data, f)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.remove(f.name)
+            raise
+    except OSError:
+        pass
+
+
+def load_mapping(mapping, language="verilog", cache_dir=None):
+    """Loads one of the package's technology mappings
+
+    Each mapping file is parsed and compiled only once per process, or until
+    the file is modified. If a cache directory is given, compiled mappings
+    are also pickled there, keyed by the mapping file's modification time.
+
+    Args:
+        mapping (str): The name of the mapping, such as 'behavioral'
+        language (str): The language of the mapping file
+        cache_dir (str): The directory in which to pickle compiled mappings
+            By default, this is mapping_cache_dir
+
+    Returns:
+        dict: Maps each cell to its list of ports and its body template
+    """
+    if cache_dir is None:
+        cache_dir = mapping_cache_dir
+    map_file = "{0}_map{1}".format(
+        mapping, hdl_syntax[language]["file_extension"]
+    )
+    with respath("pptrees.mappings", map_file) as map_path:
+        mtime = os.stat(map_path).st_mtime_ns
+        entry = _mapping_registry.get(map_file)
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+
+        templates = None
+        if cache_dir is not None:
+            pickle_file = os.path.join(cache_dir, map_file + ".pickle")
+            try:
+                with open(pickle_file, "rb") as f:
+                    cached_mtime, cached = pickle.load(f)
+                if cached_mtime == mtime:
+                    templates = _CellTemplates(cached)
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                pass
+        if templates is None:
+            templates = compile_mapping(parse_mapping(map_path))
+            if cache_dir is not None:
+                _write_pickle(pickle_file, (mtime, dict(templates)))
+
+    _mapping_registry[map_file] = (mtime, templates)
+    return templates
+
+
 def merge_mapping_into_cells(hdl, mapping):
-    """Merges the definitions found inside a mapping into HDL cells"""
+    """Merges the definitions found inside a mapping into HDL cells
+
+    Args:
+        hdl (str): The HDL whose cells to replace
+        mapping (dict): A mapping, as returned by load_mapping or parse_mapping
+
+    Returns:
+        str: The HDL, with the mapping's definitions in place of its cells
+    """
+    if not isinstance(mapping, _CellTemplates):
+        mapping = compile_mapping(mapping)
+    merged = mapping.merged.get(hdl)
+    if merged is not None:
+        return merged
+
     new_hdl = []
     for line in hdl.split("\n"):
-        first_word = None
-        split_line = line.strip().split()
-        if len(split_line) > 0:
-            first_word = split_line[0]
-        if first_word in mapping:
-            # Extract the nets from the line of HDL
-            net_string = re.search(r"\((.*?)\)", line).group(1)
-            # Extract the instance name from the line of HDL
-            inst_name = re.search(r"U\d+", line).group(0)
-            nets = net_string.split(",")
-            data = mapping[first_word][1]
-            behav = "assign" in data
-            new_string = data.replace(f" {first_word}(.", f" {inst_name}(.")
-            for a in range(len(nets)):
-                net_name = nets[a]
-                port_name = mapping[first_word][0][a]
-                if not behav:
-                    net_name = "({0})".format(net_name)
-                    port_name = "({0})".format(port_name)
-                new_string = new_string.replace(port_name, net_name)
-            new_hdl.append(new_string[:-1])
-        else:
+        split_line = line.split(None, 1)
+        if not split_line or split_line[0] not in mapping:
             new_hdl.append(line)
-    return "\n".join(new_hdl)
-
+            continue
+        ports, template = mapping[split_line[0]]
+        # Cells are instantiated as 'cell U1(net, net, ...);'
+        head, _, nets = line.partition("(")
+        inst_name = head.split()[1]
+        nets = nets.partition(")")[0].split(",")
+        cell = []
+        for x in template:
+            if x is None:
+                x = inst_name
+            elif not isinstance(x, str):
+                x = nets[x] if x < len(nets) else ports[x]
+            cell.append(x)
+        new_hdl.append("".join(cell))
+    merged = "\n".join(new_hdl)
+    mapping.merged[hdl] = merged
+    return merged
+
+
+# Matches the names of instances and wires in HDL, such as 'U1' and 'w1'
+hdl_cell_name = re.compile(r"\b([Uw])\d+\b")
+
+
+@lru_cache(maxsize=4096)
+def hdl_names(hdl):
+    """Indexes the names of instances and wires in HDL
 
-def increment_iname(nodes, match_ctr, language="verilog"):
-    """Assigns unique names for all cells in the given nodes
+    Args:
+        hdl (str): The HDL definition of a node
 
-    By default, instances are named U0, U1, U2, etc;
-                wires are named w0, w1, w2, etc.
-    These names need to be made unique.
+    Returns:
+        dict: Maps each instance and wire name to its index among the names
+            of the same kind, in order of first appearance
     """
-    # Iterate over all nodes
-    for node in nodes:
-        # Keep track of name substitutions
-        name_sub = {}
-        # Get the list of all matches
-        match_list = set(re.findall(r"U\d+", node.node_data[language]))
-        # Sort the list of all matches in terms of reverse string length
-        match_list = sorted(match_list, key=lambda x: -len(x))
-        # Substitute the names, using a character unlikely to cause collision
-        for old_name in match_list:
-            new_name = "$$${0}".format(match_ctr)
-            node.node_data[language] = node.node_data[language].replace(
-                old_name, new_name
-            )
-            name_sub[old_name] = new_name.replace("$$$", "U")
-            match_ctr += 1
-        # Substitute the original "U" character in
-        node.node_data[language] = node.node_data[language].replace("$$$", "U")
-    return match_ctr
-
-
-def increment_wname(nodes, match_ctr, language="verilog"):
-    """Assigns unique names for all cells in the given nodes
-
-    By default, instances are named U0, U1, U2, etc;
-                wires are named w0, w1, w2, etc.
-    These names need to be made unique.
+    names = {}
+    counts = {"U": 0, "w": 0}
+    for match in hdl_cell_name.finditer(hdl):
+        name = match.group(0)
+        if name not in names:
+            names[name] = counts[match.group(1)]
+            counts[match.group(1)] += 1
+    return names
+
+
+def reserve_names(nodes, iname=1, wname=1, language="verilog"):
+    """Reserves unique instance and wire names for the cells of nodes
+
+    By default, instances are named U1, U2, U3, etc;
+                wires are named w1, w2, w3, etc.
+    These names need to be made unique. Each node is given a range of names,
+    which replace its own when its HDL is rendered.
+
+    Args:
+        nodes (iterable of ExpressionNode): The nodes to uniquify
+        iname (int): The number of the next instance name
+        wname (int): The number of the next wire name
+        language (str): The language of the nodes' HDL definitions
+
+    Returns:
+        (int, int): The numbers of the next instance and wire names
     """
-    # Iterate over all nodes
     for node in nodes:
-        # Keep track of name substitutions
-        name_sub = {}
-        # Get the list of all matches
-        match_list = set(re.findall(r"w\d+", node.node_data[language]))
-        # Sort the list of all matches in terms of reverse string length
-        match_list = sorted(match_list, key=lambda x: -len(x))
-        # Substitute the names, using a character unlikely to cause collision
-        for old_name in match_list:
-            new_name = "$$${0}".format(match_ctr)
-            node.node_data[language] = node.node_data[language].replace(
-                old_name, new_name
-            )
-            name_sub[old_name] = new_name.replace("$$$", "w")
-            match_ctr += 1
-        # Substitute the original "U" character in
-        node.node_data[language] = node.node_data[language].replace("$$$", "w")
-    return match_ctr
+        names = hdl_names(node.node_data[language])
+        node.name_offsets = {"U": iname, "w": wname}
+        for name in names:
+            if name[0] == "U":
+                iname += 1
+            else:
+                wname += 1
+    return iname, wname
 
 
 def display_png(graph, *args, **kwargs):
@@ -402,6 +612,8 @@ def display_png(graph, *args, **kwargs):
         *args: The arguments to pass to the graph's png() method
         **kwargs: The keyword arguments to pass to the graph's png() method
     """
+    import uuid
+
     # Get a temporary file name
     fname = str(uuid.uuid4()) + ".png"
     # Execute the function
@@ -423,6 +635,8 @@ def display_gif(graphs, *args, **kwargs):
         **kwargs: The keyword arguments to pass to the graphs' png() method
     """
     # Import PIL.Image here to prevent instant crash on Python 3.6
+    import uuid
+
     import PIL.Image
 
     # Get temporary file names
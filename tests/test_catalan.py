@@ -0,0 +1,52 @@
+import random
+
+
+def test_catalan_splits():
+    from pptrees.util import catalan, catalan_splits
+
+    for n in range(1, 40):
+        splits = catalan_splits(n)
+        assert len(splits) == n + 1
+        assert splits[-1] == catalan(n)
+        for i in range(n):
+            assert splits[i + 1] - splits[i] == catalan(i) * catalan(n - i - 1)
+
+
+def test_rank_unrank():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.util import catalan
+
+    for width in range(1, 9):
+        for rank in range(catalan(width - 1)):
+            assert AdderTree(width, start_point=rank).rank() == rank
+
+    for width in [32, 64, 128]:
+        for _ in range(5):
+            rank = random.randrange(catalan(width - 1))
+            assert AdderTree(width, start_point=rank).rank() == rank
+
+
+def test_constrained_ranking():
+    from pptrees.constrained import count, rank_constrained, unrank_constrained
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.sweep import random_ranks
+    from pptrees.util import catalan
+
+    # Trees of bounded height keep the order of their Catalan IDs
+    for width in range(1, 10):
+        skeleton = SkeletonTree(width)
+        heights = [
+            skeleton.unrank(r).height() for r in range(catalan(width - 1))
+        ]
+        for height in range(width + 1):
+            ranks = [r for r, h in enumerate(heights) if h <= height]
+            assert count(width, height) == len(ranks)
+            for index, rank in enumerate(ranks):
+                assert unrank_constrained(width, height, index) == rank
+                assert rank_constrained(width, height, rank) == index
+
+    assert count(64, 6) == 1
+    assert count(64, 7) < catalan(63) // 10**14
+    for rank in random_ranks(64, 20, seed=1, height=7):
+        assert SkeletonTree(64, rank).height() <= 7
+        assert unrank_constrained(64, 7, rank_constrained(64, 7, rank)) == rank
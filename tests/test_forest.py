@@ -0,0 +1,126 @@
+import gzip
+import re
+
+
+def _structure(node):
+    return (
+        node.value,
+        node.leafs,
+        tuple(None if c is None else _structure(c) for c in node.children),
+    )
+
+
+def test_equivalent_nodes():
+    from pptrees.AdderForest import AdderForest
+
+    for kwargs in [
+        {"alias": "ripple"},
+        {"alias": "kogge-stone"},
+        {"alias": "brent-kung"},
+        {"tree_start_points": [0, 0, 1, 3, 7, 20, 100, 300]},
+    ]:
+        forest = AdderForest(8, **kwargs)
+        forest.optimize_nodes()
+        forest.find_equivalent_nodes()
+
+        # Nodes are equivalent if and only if their subtrees match
+        groups = {}
+        for t in forest:
+            for n in t:
+                groups.setdefault(_structure(n), set()).add(n)
+        classes = set(frozenset(ec) for ec in forest.equiv_classes)
+        assert classes == set(frozenset(g) for g in groups.values())
+
+        # Representatives come from the widest tree in their class
+        for ec in forest.equiv_classes:
+            assert ec.rep in ec
+            assert all(ec.rep.graph.width >= n.graph.width for n in ec)
+            for n in ec:
+                assert n.equiv_class is ec
+
+
+def _hdl_lines(hdl):
+    # Instance and wire numbers, and the order of nodes, vary between runs
+    hdl = re.sub(r"\b[Uw]\d+\b", "#", hdl)
+    return sorted(x.rstrip(",") for x in hdl.splitlines())
+
+
+def test_streamed_hdl(tmp_path):
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+
+    for optimization in [0, 1, 2]:
+        hdl = AdderForest(9, alias="brent-kung").hdl(optimization=optimization)
+        forest = AdderForest(9, alias="brent-kung")
+        chunks = list(forest.iter_hdl(optimization=optimization))
+        assert _hdl_lines("".join(chunks)) == _hdl_lines(hdl[2])
+        # Modules are streamed a node or instance at a time
+        assert len(chunks) > len(hdl[1])
+        assert max(len(x) for x in chunks) < len(hdl[2]) // 8
+
+    tree = AdderTree(7, alias="sklansky")
+    hdl = "".join(tree.iter_hdl(mapping="sky130_fd_sc_hd"))
+    tree = AdderTree(7, alias="sklansky")
+    assert hdl == tree.hdl(mapping="sky130_fd_sc_hd")[2]
+
+    AdderForest(5).write_hdl(tmp_path / "adder.v.gz")
+    with gzip.open(tmp_path / "adder.v.gz", "rt") as f:
+        assert _hdl_lines(f.read()) == _hdl_lines(AdderForest(5).hdl()[2])
+
+
+def test_unique_names():
+    from pptrees.AdderForest import AdderForest
+
+    for mapping in ["behavioral", "sky130_fd_sc_hd"]:
+        forest = AdderForest(9, alias="kogge-stone")
+        hdl = forest.hdl(optimization=2, mapping=mapping)[2]
+        for module in re.findall(r"module.*?endmodule", hdl, re.S):
+            insts = re.findall(r"^\s*\S+ (U\d+)\(", module, re.M)
+            assert len(insts) == len(set(insts))
+            wires = re.findall(
+                r"\bw\d+\b", ",".join(re.findall("wire.*;", module))
+            )
+            assert len(wires) == len(set(wires))
+
+
+def test_multiple_mappings(tmp_path):
+    from pptrees.AdderForest import AdderForest
+
+    mappings = ["sky130_fd_sc_hd", "behavioral", "GTECH", "sky130_fd_sc_hd"]
+    for optimization in [1, 2]:
+        forest = AdderForest(7, alias="sklansky")
+        hdl = forest.hdl_mappings(mappings, optimization=optimization)
+        threaded = forest.hdl_mappings(
+            mappings,
+            out=tmp_path / "adder_{mapping}.v",
+            max_workers=2,
+            optimization=optimization,
+        )
+        assert threaded == hdl
+        for mapping in mappings:
+            fresh = AdderForest(7, alias="sklansky").hdl(
+                optimization=optimization, mapping=mapping
+            )
+            assert _hdl_lines(hdl[mapping]) == _hdl_lines(fresh[2])
+            with open(tmp_path / "adder_{0}.v".format(mapping)) as f:
+                assert f.read() == hdl[mapping]
+
+
+def test_copies():
+    import copy
+
+    from pptrees.AdderForest import AdderForest
+    from pptrees.simulate import is_adder
+
+    forest = AdderForest(8, alias="brent-kung")
+    forest.optimize_nodes()
+    forest.find_equivalent_nodes()
+    new = copy.copy(forest)
+
+    assert len(new.equiv_classes) == len(forest.equiv_classes)
+    for ec in new.equiv_classes:
+        assert ec.rep in ec
+        for n in ec:
+            assert n.equiv_class is ec and n.graph in new.trees
+    assert _hdl_lines(new.hdl()[0]) == _hdl_lines(forest.hdl()[0])
+    assert is_adder(new)
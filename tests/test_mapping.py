@@ -0,0 +1,79 @@
+import glob
+import os
+import re
+
+MAPPING_DIR = os.path.join(
+    os.path.dirname(__file__), "..", "src", "pptrees", "mappings"
+)
+
+
+def _legacy_merge(hdl, mapping):
+    """Merges a mapping into cells by string replacement, as was done before"""
+    new_hdl = []
+    for line in hdl.split("\n"):
+        split_line = line.strip().split()
+        first_word = split_line[0] if split_line else None
+        if first_word not in mapping:
+            new_hdl.append(line)
+            continue
+        nets = re.search(r"\((.*?)\)", line).group(1).split(",")
+        inst_name = re.search(r"U\d+", line).group(0)
+        data = mapping[first_word][1]
+        behav = "assign" in data
+        new_string = data.replace(f" {first_word}(.", f" {inst_name}(.")
+        for net_name, port_name in zip(nets, mapping[first_word][0]):
+            if not behav:
+                net_name = "({0})".format(net_name)
+                port_name = "({0})".format(port_name)
+            new_string = new_string.replace(port_name, net_name)
+        new_hdl.append(new_string[:-1])
+    return "\n".join(new_hdl)
+
+
+def test_templates_match_legacy_merge():
+    from pptrees.util import (
+        load_mapping,
+        merge_mapping_into_cells,
+        parse_mapping,
+    )
+
+    map_files = glob.glob(os.path.join(MAPPING_DIR, "*_map.v"))
+    assert map_files
+    for map_file in map_files:
+        name = os.path.basename(map_file)[: -len("_map.v")]
+        templates = load_mapping(name)
+        assert load_mapping(name) is templates
+
+        parsed = parse_mapping(map_file)
+        assert set(parsed) == set(templates)
+        for cell, (ports, _) in parsed.items():
+            # Cells' nets may carry stray whitespace, as in 'U2(w1 , x)'
+            nets = ["$n{0}_adder".format(i) for i in range(len(ports) - 1)]
+            hdl = "\twire w1;\n\t{0} U7({1});\n".format(
+                cell, ",".join(nets + ["w1 "])
+            )
+            expected = _legacy_merge(hdl, parsed)
+            assert merge_mapping_into_cells(hdl, templates) == expected
+            assert merge_mapping_into_cells(hdl, parsed) == expected
+
+
+def test_pickled_mappings(tmp_path):
+    from pptrees import util
+
+    util._mapping_registry.clear()
+    templates = util.load_mapping("sky130_fd_sc_hd", cache_dir=str(tmp_path))
+    assert (tmp_path / "sky130_fd_sc_hd_map.v.pickle").exists()
+
+    util._mapping_registry.clear()
+    cached = util.load_mapping("sky130_fd_sc_hd", cache_dir=str(tmp_path))
+    assert cached is not templates
+    assert cached == templates
+    assert [x.name for x in tmp_path.iterdir()] == [
+        "sky130_fd_sc_hd_map.v.pickle"
+    ]
+
+    # A cache that cannot be written is skipped
+    util._mapping_registry.clear()
+    blocked = tmp_path / "sky130_fd_sc_hd_map.v.pickle"
+    uncached = util.load_mapping("sky130_fd_sc_hd", cache_dir=str(blocked))
+    assert uncached == templates
@@ -0,0 +1,258 @@
+import random
+import re
+
+# Logic of the cells instantiated by the package's nodes
+CELLS = {
+    "assign": lambda a: a,
+    "buffer": lambda a: a,
+    "and2": lambda a, b: a & b,
+    "or2": lambda a, b: a | b,
+    "xor2": lambda a, b: a ^ b,
+    "xnor2": lambda a, b: ~(a ^ b),
+    "ao21": lambda a0, a1, b0: (a0 & a1) | b0,
+    "mux2": lambda s, a, b: (s & b) | (~s & a),
+}
+
+
+def _evaluate(netlist, a, b, width):
+    """Evaluates a netlist's cells, whose first pin is their output"""
+    values = {}
+    for bit in range(width):
+        values[netlist.net_names.index("a_in[{0}]".format(bit))] = a >> bit & 1
+        values[netlist.net_names.index("b_in[{0}]".format(bit))] = b >> bit & 1
+    pending = list(range(len(netlist)))
+    while pending:
+        waiting = []
+        for index in pending:
+            cell, nets = netlist.cell(index)
+            if any(x not in values for x in nets[1:]):
+                waiting.append(index)
+                continue
+            values[nets[0]] = CELLS[cell](*[values[x] for x in nets[1:]]) & 1
+        assert len(waiting) < len(pending)
+        pending = waiting
+    return sum(
+        values[netlist.net_names.index("sum[{0}]".format(bit))] << bit
+        for bit in range(width)
+    )
+
+
+def test_netlist():
+    from pptrees.AdderForest import AdderForest
+
+    for alias in ["ripple", "sklansky", "kogge-stone"]:
+        for optimization in [0, 1]:
+            forest = AdderForest(6, alias=alias)
+            netlist = forest.netlist(optimization=optimization)
+            assert forest.netlist(optimization=optimization) is netlist
+            for _ in range(32):
+                a, b = random.getrandbits(6), random.getrandbits(6)
+                assert _evaluate(netlist, a, b, 6) == (a + b) % 64
+
+    # Equivalent nodes are built only once
+    forest = AdderForest(8, alias="sklansky")
+    shared = len(forest.netlist())
+    forest = AdderForest(8, alias="sklansky")
+    assert shared < sum(len(t.netlist()) for t in forest)
+
+
+def test_netlist_hdl():
+    from pptrees.AdderTree import AdderTree
+
+    tree = AdderTree(5, start_point=3)
+    netlist = tree.netlist()
+    verilog = tree.hdl(language="verilog", mapping="behavioral", flat=True)[0]
+    assert netlist.hdl().count("assign") >= len(netlist) > 0
+    assert len(set(netlist.wires())) == len(netlist.wires())
+    for net in netlist.wires():
+        if net[0] == "n":
+            assert net in verilog
+
+    vhdl = tree.hdl(language="vhdl")[2]
+    assert "entity adder is" in vhdl and "end architecture;" in vhdl
+    assert vhdl.count("port map") == len(
+        [x for x in range(len(netlist)) if netlist.cell(x)[0] != "assign"]
+    )
+    assert "sum <= " in vhdl or "Y => sum" in vhdl
+
+    # Netlists are lowered again only once the tree changes
+    tree = AdderTree(9, start_point=700)
+    netlist = tree.netlist()
+    assert tree.netlist() is netlist
+    tree.left_rotate(tree[7, 5])
+    assert tree.netlist() is not netlist
+
+
+def _simulate_aiger(aig, inputs):
+    """Decodes a binary AIGER file and evaluates its outputs"""
+    header, _, data = aig.partition(b"\n")
+    _, m, i, _, o, a = header.split()
+    values = [0] + list(inputs)
+    lines = data.split(b"\n", int(o))
+    outputs, data = [int(x) for x in lines[: int(o)]], lines[int(o)]
+    position = 0
+    for lhs in range(2 * (int(i) + 1), 2 * (int(m) + 1), 2):
+        deltas = []
+        for _ in range(2):
+            delta, shift = 0, 0
+            while data[position] & 0x80:
+                delta |= (data[position] & 0x7F) << shift
+                position, shift = position + 1, shift + 7
+            deltas.append(delta | data[position] << shift)
+            position += 1
+        rhs0 = lhs - deltas[0]
+        rhs1 = rhs0 - deltas[1]
+        values.append(
+            (values[rhs0 >> 1] ^ rhs0 & 1) & (values[rhs1 >> 1] ^ rhs1 & 1)
+        )
+    assert int(a) == len(values) - int(i) - 1
+    return [values[x >> 1] ^ x & 1 for x in outputs]
+
+
+def _simulate_blif(blif, inputs):
+    """Parses a BLIF model and evaluates its outputs"""
+    lines = blif.splitlines()
+    names = lines[1].split()[1:]
+    values = dict(zip(names, inputs))
+    functions = []
+    for line in lines[3:]:
+        if line.startswith(".names"):
+            functions.append((line.split()[1:], []))
+        elif line != ".end":
+            functions[-1][1].append(line.split()[0] if " " in line else "")
+    while functions:
+        waiting = []
+        for nets, cover in functions:
+            if any(x not in values for x in nets[:-1]):
+                waiting.append((nets, cover))
+                continue
+            row = "".join(str(values[x]) for x in nets[:-1])
+            # Constant functions have no inputs, and a single row if true
+            values[nets[-1]] = int(row in cover or cover == [""])
+        assert len(waiting) < len(functions)
+        functions = waiting
+    return [values[x] for x in lines[2].split()[1:]]
+
+
+def test_aiger_blif():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+
+    for graph, kwargs, width in [
+        (AdderForest(6, alias="sklansky"), {}, 6),
+        (AdderForest(6, alias="sklansky"), {"optimization": 2}, 6),
+        (AdderForest(6, alias="ripple"), {"optimization": 0}, 6),
+        (AdderTree(6, start_point=3), {}, 1),
+    ]:
+        aig, blif = graph.aiger(**kwargs), graph.blif(**kwargs)
+        assert aig.startswith(b"aig ") and blif.startswith(".model ")
+        for _ in range(32):
+            a, b = random.getrandbits(6), random.getrandbits(6)
+            inputs = [a >> x & 1 for x in range(6)]
+            inputs += [b >> x & 1 for x in range(6)]
+            # Trees compute the most significant bit of the sum
+            total = (a + b) >> (6 - width)
+            expected = [total >> x & 1 for x in range(width)]
+            assert _simulate_aiger(aig, inputs) == expected
+            assert _simulate_blif(blif, inputs) == expected
+
+
+def _vhdl_logic(expression):
+    """Translates the logic of a VHDL cell into a Python expression"""
+    match = re.match(r"(.*) when (\w+) = '1' else (.*)$", expression)
+    if match is not None:
+        return "({1}) if {0} else ({2})".format(
+            match.group(2),
+            _vhdl_logic(match.group(1)),
+            _vhdl_logic(match.group(3)),
+        )
+    # Python's not also binds tighter than its and/or, as in VHDL
+    return expression.replace(" xor ", " != ")
+
+
+def _simulate_vhdl(vhdl, inputs):
+    """Parses a VHDL netlist and its cells, and evaluates its outputs"""
+    cells = dict(
+        re.findall(
+            r"^architecture behavior of (\w+) is\nbegin\n  Y <= (.*);$",
+            vhdl,
+            re.M,
+        )
+    )
+    ports = {"in": [], "out": []}
+    for name, direction, msb in re.findall(
+        r"^\t\t(\w+) : (in|out) std_logic(?:_vector\((\d+) downto 0\))?",
+        vhdl,
+        re.M,
+    ):
+        if msb:
+            name = ["{0}({1})".format(name, x) for x in range(int(msb) + 1)]
+        ports[direction] += name if msb else [name]
+    values = {"'0'": 0, "'1'": 1}
+    values.update(zip(ports["in"], inputs))
+
+    body = vhdl.partition("architecture netlist of")[2]
+    statements = [
+        (cells[cell], dict(re.findall(r"(\w+) => ([^,\s]+)", pins)))
+        for cell, pins in re.findall(
+            r"entity work\.(\w+)\s+port map \((.*?)\);", body, re.S
+        )
+    ]
+    statements += [
+        ("A", {"Y": y, "A": a})
+        for y, a in re.findall(r"^\t([^\s:]+) <= (\S+);$", body, re.M)
+    ]
+    while statements:
+        waiting = []
+        for logic, pins in statements:
+            if any(pins[x] not in values for x in pins if x != "Y"):
+                waiting.append((logic, pins))
+                continue
+            args = {x: values[y] for x, y in pins.items() if x != "Y"}
+            values[pins["Y"]] = int(eval(_vhdl_logic(logic), {}, args))
+        assert len(waiting) < len(statements)
+        statements = waiting
+    return [values[x] for x in ports["out"]]
+
+
+def test_vhdl():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+    from pptrees.Netlist import (
+        _bit_ops,
+        _cell_logic,
+        _evaluate,
+        _logical_ports,
+        _vhdl_library,
+    )
+
+    # The VHDL cells compute the logic of the Verilog ones
+    for entity, vhdl in _vhdl_library("behavioral").items():
+        cell = re.sub(r"_module$", "", entity)
+        logic = re.search(r"^  Y <= (.*);$", vhdl, re.M).group(1)
+        ports = _logical_ports(cell)
+        for x in range(1 << (len(ports) - 1)):
+            bits = [0] + [x >> i & 1 for i in range(len(ports) - 1)]
+            args = dict(zip(ports[1:], bits[1:]))
+            assert int(eval(_vhdl_logic(logic), {}, args)) == _evaluate(
+                _cell_logic(cell), bits, _bit_ops
+            )
+
+    for graph, width in [
+        (AdderForest(6, alias="sklansky"), 6),
+        (AdderForest(6, alias="ripple"), 6),
+        (AdderTree(6, start_point=3), 1),
+    ]:
+        vhdl = graph.hdl(language="vhdl")[2]
+        # Only the entities of the cells in use are written out
+        cells = set(re.findall(r"entity work\.(\w+)", vhdl))
+        assert set(re.findall(r"^entity (\w+) is", vhdl, re.M)) == cells | {
+            "adder"
+        }
+        for _ in range(32):
+            a, b = random.getrandbits(6), random.getrandbits(6)
+            inputs = [a >> x & 1 for x in range(6)]
+            inputs += [b >> x & 1 for x in range(6)]
+            total = (a + b) >> (6 - width)
+            expected = [total >> x & 1 for x in range(width)]
+            assert _simulate_vhdl(vhdl, inputs) == expected
@@ -0,0 +1,52 @@
+def test_net_table():
+    from pptrees.NetTable import (
+        NetTable,
+        net_port,
+        net_sort_key,
+        parse_net,
+        port_net,
+    )
+
+    table = NetTable()
+    nets = [table.add_net("tree_{0}".format(i % 3), i) for i in range(12)]
+    assert len(set(nets)) == len(table) == 12
+    assert table.next_net() not in nets
+    assert parse_net(nets[10]) == "n10_tree_1"
+    assert net_port(nets[10]) is None
+
+    # Ports are shared by all graphs
+    assert port_net("a_in", 3) == port_net("a_in", 3) != port_net("a_in", 4)
+    assert parse_net(port_net("a_in", 3)) == "a_in[3]"
+    assert parse_net(port_net("cin")) == "cin"
+    assert net_port(port_net("a_in", 3)) == "a_in"
+
+    # Nets sort in the natural order of their names
+    names = [parse_net(x) for x in nets + [port_net("a_in", 9), None]]
+    nets = sorted(nets + [port_net("a_in", 9), None], key=net_sort_key)
+    assert [parse_net(x) for x in nets] == sorted(names, key=_natural)
+
+    # Plain and hardcoded nets are still supported
+    assert parse_net(4) == "n4"
+    assert parse_net("$a_in[12]") == "a_in[12]"
+    assert net_port("$a_in[12]") == "a_in"
+
+
+def _natural(name):
+    from pptrees.util import natural_keys
+
+    # Port nets are listed after internal nets
+    return ("[" in name or not name.startswith("n"), natural_keys(name))
+
+
+def test_tree_nets():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.NetTable import parse_net
+
+    t1 = AdderTree(5, name="t")
+    t2 = AdderTree(5, name="t")
+    # Trees of the same name have nets of the same names, but distinct IDs
+    nets1 = set().union(*t1._get_internal_nets()) - {None}
+    nets2 = set().union(*t2._get_internal_nets()) - {None}
+    assert nets1 and not nets1 & nets2
+    assert {parse_net(x) for x in nets1} == {parse_net(x) for x in nets2}
+    assert len(nets1) == t1.next_net - 1
@@ -3,3 +3,83 @@ def test_init():
 
     node("invis")
     assert True
+
+
+def test_shared_definitions():
+    import pytest
+
+    from pptrees.AdderTree import AdderTree
+    from pptrees.ExpressionNode import ExpressionNode as node
+
+    a, b = node("ppa_pre"), node("ppa_pre")
+    assert a.node_data is b.node_data
+    with pytest.raises(TypeError):
+        a.node_data["pd"] = 0
+    with pytest.raises(AttributeError):
+        a.color = "red"
+
+    # Ports are matched once per pair of definitions
+    from pptrees.util import match_nodes
+
+    c, d = node("ppa_rspine"), node("ppa_rspine")
+    assert match_nodes(c, a, 1) is match_nodes(d, b, 1)
+    assert all(
+        c.node_data.verso[x[1][0]] == x[0][0] for x in match_nodes(c, a, 1)
+    )
+
+    # Equivalence classes are only created when used
+    tree = AdderTree(8)
+    assert all(n._equiv_class is None for n in tree)
+    leaf = tree.root.leftmost_leaf()
+    assert leaf.equiv_class.parents == {leaf.parent}
+    assert tree.nodes[leaf]["label"] and "verilog" not in tree.nodes[leaf]
+
+
+def test_verilog_pins():
+    from pptrees.ExpressionNode import ExpressionNode as node
+
+    n = node("ppa_lspine")
+    n.in_nets = {"xin": [1], "yin": [2], "pin": [3], "gin": ["$a_in[12]"]}
+    n.out_nets["xout"][0] = 4
+    n.out_nets["yout"][0] = 5
+    hdl = n.hdl()
+    assert "or2  U1(w1, n3, a_in[12]);" in hdl
+    assert "mux2 U2(n4,a_in[12],n1,n2);" in hdl
+    assert "pin" not in hdl and "gin" not in hdl
+
+
+def test_sub_tokens():
+    from pptrees.util import sub_ports, sub_tokens
+
+    hdl = "assign a_in_31 = a_in_3 & x[3] & xy & 1'b0;"
+    subs = {"a_in_3": "a_in[3]", "a_in_31": "a_in[31]", "x": "y", "b0": "z"}
+    assert (
+        sub_tokens(hdl, subs) == "assign a_in[31] = a_in[3] & y[3] & xy & 1'b0;"
+    )
+    ports = [(("sum", 1), "s"), (("a_in", 4), "a[3:0]")]
+    assert sub_ports("assign sum = a_in[2];", ports) == "assign s = a[2];"
+
+
+def test_lazy_imports():
+    import os
+    import subprocess
+    import sys
+
+    import pptrees
+
+    # The Yosys flow imports pptrees in fresh interpreters
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(pptrees.__file__))
+    env["PYTHONPATH"] = os.pathsep.join([src, env.get("PYTHONPATH", "")])
+    script = "import sys, pptrees.yosys_alu; print(' '.join(sys.modules))"
+    modules = subprocess.run(
+        [sys.executable, "-c", script],
+        env=env,
+        stdout=subprocess.PIPE,
+        check=True,
+        universal_newlines=True,
+    ).stdout.split()
+
+    # Node definitions and renderers are loaded on use
+    assert not [x for x in modules if x.startswith("pptrees.node_data.")]
+    assert "PIL" not in modules and "pydot" not in modules
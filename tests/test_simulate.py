@@ -0,0 +1,49 @@
+def test_pack():
+    from pptrees.simulate import pack, unpack
+
+    values = [0, 5, 255, 128, 77]
+    words = pack(values, 8)
+    assert len(words) == 8
+    assert words[0] == 0b10110
+    assert unpack(words, len(values)) == values
+
+
+def test_simulate_adders():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import equivalent, is_adder
+
+    for width in [1, 2, 3, 9]:
+        for alias in ["ripple", "sklansky", "kogge-stone", "brent-kung"]:
+            assert is_adder(AdderTree(width, alias=alias))
+            assert is_adder(AdderForest(width, alias=alias))
+
+            # Check forests after equivalent nodes have been merged
+            forest = AdderForest(width, alias=alias)
+            forest.hdl(optimization=2)
+            assert is_adder(forest, seed=width)
+
+    tree = AdderTree(9, start_point=700)
+    tree.insert_buffer(tree[4, 1])
+    assert is_adder(tree)
+    assert not equivalent(tree, lambda a_in, b_in: {"sum": 0})
+
+
+def test_compiled_kernels():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import compile_graph, is_adder
+
+    for alias in ["ripple", "sklansky", "kogge-stone", "brent-kung"]:
+        forest = AdderForest(9, alias=alias)
+        assert is_adder(forest, compiled=True)
+        forest.hdl(optimization=2)
+        assert is_adder(forest, compiled=True)
+
+    # Kernels are reused until the tree's structure changes
+    tree = AdderTree(9, start_point=700)
+    kernel = compile_graph(tree)
+    assert compile_graph(tree) is kernel
+    tree.left_rotate(tree[7, 5])
+    assert compile_graph(tree) is not kernel
+    assert is_adder(tree, compiled=True)
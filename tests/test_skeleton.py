@@ -0,0 +1,41 @@
+def test_skeleton_matches_tree():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.util import catalan
+
+    for width in range(1, 8):
+        skeleton = SkeletonTree(width)
+        for rank in range(catalan(width - 1)):
+            skeleton.unrank(rank)
+            tree = AdderTree(width, start_point=rank)
+            assert skeleton.rank() == rank
+            assert len(skeleton) == len(tree)
+            if width > 1:
+                masks = sorted(n.leafs for n in tree.nodes if n.children)
+                assert masks == sorted(skeleton.leafs[width:])
+    assert SkeletonTree(9, 1000).materialize().rank() == 1000
+
+
+def test_skeleton_rotations():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.SkeletonTree import SkeletonTree
+
+    width = 8
+    for rank in range(0, 429, 7):
+        skeleton = SkeletonTree(width, rank)
+        for node in range(width, 2 * width - 1):
+            parent = skeleton.parent[node]
+            if parent == -1:
+                continue
+            tree = AdderTree(width, start_point=rank)
+            s = skeleton.copy()
+            n = next(x for x in tree if x.leafs == s.leafs[node] and x.children)
+            if s.right[parent] == node:
+                tree.left_rotate(n)
+                s.left_rotate(node)
+            else:
+                tree.right_rotate(n)
+                s.right_rotate(node)
+            assert s.rank() == tree.rank()
+            assert len(s) == len(tree)
+            assert s.height() == SkeletonTree(width, s.rank()).height()
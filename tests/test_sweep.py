@@ -0,0 +1,41 @@
+def test_sweep():
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.sweep import random_ranks, sweep
+
+    serial = list(sweep(7, len, max_workers=0))
+    assert [r for r, _ in serial] == list(range(132))
+    parallel = list(sweep(7, len, chunk_size=10, max_workers=2))
+    assert parallel == serial
+
+    ranks = list(random_ranks(40, 20, seed=1))
+    skeletons = list(sweep(40, len, ranks, tree_type=SkeletonTree))
+    assert [r for r, _ in skeletons] == ranks
+
+    # Stopping early must not wait for the rest of a huge range
+    gen = sweep(64, len, range(10**30), tree_type=SkeletonTree, max_workers=2)
+    assert next(gen)[0] == 0
+    gen.close()
+
+
+def test_rotation_walk():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import is_adder
+    from pptrees.SkeletonTree import SkeletonTree
+    from pptrees.sweep import rotation_walk
+
+    for width in range(1, 9):
+        tree = SkeletonTree(width)
+        ranks = list(rotation_walk(tree))
+        assert sorted(ranks) == list(range(len(ranks)))
+    assert len(ranks) == 429
+
+    tree = AdderTree(6, alias="sklansky")
+    ranks = []
+    for rank in rotation_walk(tree):
+        ranks.append(rank)
+        assert is_adder(tree)
+    assert sorted(ranks) == list(range(42))
+
+    # Skipped steps are walked without being yielded
+    part = list(rotation_walk(SkeletonTree(8), 100, 150))
+    assert part == list(rotation_walk(SkeletonTree(8)))[100:150]
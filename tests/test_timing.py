@@ -0,0 +1,61 @@
+import random
+
+
+def _timing(sta, graph):
+    trees = getattr(graph, "trees", [graph])
+    return sorted(
+        (n.leafs, n.value, round(sta.arrival(n), 9), round(sta.slack(n), 9))
+        for t in trees
+        for n in t
+    )
+
+
+def _check_incremental(sta, graph):
+    from pptrees.StaticTiming import StaticTiming
+
+    expected = _timing(StaticTiming(graph), graph)
+    sta.graph._timing = sta
+    for t in sta.trees:
+        t._timing = sta
+    assert _timing(sta, graph) == expected
+
+
+def test_static_timing():
+    from pptrees.AdderForest import AdderForest
+    from pptrees.AdderTree import AdderTree
+    from pptrees.StaticTiming import StaticTiming
+
+    tree = AdderTree(4, alias="ripple")
+    sta = StaticTiming(tree)
+    path = sta.critical_path()
+    assert path[0] is tree.root and not path[-1].children
+    assert sta.delay() == sta.arrival(tree.root)
+    assert min(sta.slack(n) for n in tree) == 0
+
+    # Check incremental updates against a fresh analysis
+    rng = random.Random(0)
+    tree = AdderTree(12, alias="ripple")
+    sta = StaticTiming(tree)
+    cocycle = tree.node_defs["cocycle"]
+    rotations = 0
+    while rotations < 40:
+        node = rng.choice([n for n in tree if n.parent and n.value == cocycle])
+        if node.parent.value != cocycle:
+            continue
+        if node.parent[1] is node:
+            tree.left_rotate(node)
+        else:
+            tree.right_rotate(node)
+        rotations += 1
+        if rotations % 8 == 0:
+            node = rng.choice([n for n in tree if n.value == cocycle])
+            tree.insert_buffer(node[1])
+        _check_incremental(sta, tree)
+
+    # Equivalent nodes drive the parents of their whole class
+    forest = AdderForest(8, alias="sklansky")
+    sta = StaticTiming(forest)
+    before = sta.delay()
+    forest.find_equivalent_nodes()
+    assert sta.delay() > before
+    _check_incremental(sta, forest)
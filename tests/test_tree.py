@@ -0,0 +1,196 @@
+def _height(node):
+    if not node.children:
+        return 0
+    return 1 + max(_height(x) for x in node)
+
+
+def _check_caches(tree):
+    for node in tree:
+        assert len(node) == _height(node)
+    depths = set(n.y_pos for n in tree)
+    for d in depths:
+        row = set(n for n in tree if n.y_pos == d)
+        assert set(tree._get_row(d)) == row
+    assert sum(len(r) for r in tree._rows.values()) == len(tree.nodes)
+
+
+def test_height_and_row_caches():
+    from pptrees.AdderTree import AdderTree
+
+    for alias in ["sklansky", "kogge-stone", "brent-kung"]:
+        tree = AdderTree(12, alias=alias)
+        _check_caches(tree)
+
+    tree = AdderTree(9, start_point=700)
+    tree.insert_buffer(tree[4, 1])
+    _check_caches(tree)
+    tree.left_rotate(tree[7, 5])
+    _check_caches(tree)
+    tree.optimize_nodes()
+    _check_caches(tree)
+
+
+def _layout(tree):
+    tree._fix_diagram_positions()
+    layout = {n.leafs: (n.x_pos, n.y_pos) for n in tree}
+    assert len(layout) == len(tree.nodes)
+    return layout
+
+
+def test_lazy_layout():
+    import random
+
+    from pptrees.AdderTree import AdderTree
+
+    tree = AdderTree(10, alias="sklansky")
+    lspine = tree.node_defs["lspine"]
+    cases = set()
+    random.seed(3)
+    for _ in range(150):
+        node = random.choice(list(tree))
+        if node.parent is None or None in node.children or not node.children:
+            continue
+        if node.parent is tree.root:
+            cases.add("root")
+        if lspine in [node.value, node.parent.value]:
+            cases.add("lspine")
+        if node.parent[1] is node:
+            tree.left_rotate(node)
+        else:
+            tree.right_rotate(node)
+        # The layout is only refreshed when it is read
+        if random.random() < 0.2:
+            expected = AdderTree(10, start_point=tree.rank())
+            assert _layout(tree) == _layout(expected)
+    assert cases == {"root", "lspine"}
+    assert _layout(tree) == _layout(AdderTree(10, start_point=tree.rank()))
+
+
+def test_pointer_rotations():
+    import random
+
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import is_adder
+
+    tree = AdderTree(12, alias="sklansky")
+    random.seed(12)
+    for _ in range(200):
+        node = random.choice(list(tree))
+        if node.parent is None or None in node.children or not node.children:
+            continue
+        if node.parent[1] is node:
+            tree.left_rotate(node)
+        else:
+            tree.right_rotate(node)
+
+    # networkx follows the rewired pointers
+    edges = {(p, c) for p in tree for c in p if c is not None}
+    assert set(tree.edges) == edges
+    assert {(p, c) for c in tree for p in tree.pred[c]} == edges
+    for p, c, data in tree.edges(data=True):
+        nets = [p.in_nets[x][i] for x, i in data["ins"]]
+        assert data["edge_nets"] == nets
+    for node in tree:
+        leafs = [c.leafs for c in node if c is not None]
+        if leafs:
+            assert node.leafs == sum(leafs)
+    _check_caches(tree)
+    assert is_adder(tree)
+
+
+def test_copies():
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import is_adder
+
+    tree = AdderTree(9, start_point=700)
+    tree.insert_buffer(tree[4, 1])
+    tree.optimize_nodes()
+    hdl = tree.hdl()[0]
+    new = tree.copy()
+
+    # Buffers and swapped nodes survive, as a rank cannot describe them
+    assert [n.value for n in new] == [n.value for n in tree]
+    assert new.hdl()[0] == hdl
+    assert all(n.graph is new for n in new)
+    assert not set(new) & set(tree)
+    _check_caches(new)
+
+    # The copies are independent
+    new.left_rotate(new[7, 5])
+    assert tree.hdl()[0] == hdl
+    assert is_adder(new) and is_adder(tree)
+
+
+def _state(tree):
+    nodes = [
+        (
+            n,
+            n.value,
+            n.children.copy(),
+            n.parent,
+            {k: v.copy() for k, v in n.in_nets.items()},
+            {k: v.copy() for k, v in n.out_nets.items()},
+            n.leafs,
+            n.x_pos,
+            n.y_pos,
+        )
+        for n in tree
+    ]
+    edges = [(p, c, d["ins"].copy()) for p, c, d in tree.edges(data=True)]
+    rows = {d: r.copy() for d, r in tree._rows.items()}
+    return nodes, edges, rows, tree.root, tree._dirty_nodes.copy()
+
+
+def test_transactions():
+    import random
+
+    import pytest
+
+    from pptrees.AdderTree import AdderTree
+    from pptrees.simulate import is_adder
+
+    def rotate(tree):
+        node = random.choice(list(tree))
+        if node.parent is None:
+            return
+        if len(node.parent.children) == len(node.children) == 2:
+            if node.parent[1] is node:
+                tree.left_rotate(node)
+            else:
+                tree.right_rotate(node)
+
+    tree = AdderTree(12, alias="sklansky")
+    cocycle = tree.node_defs["cocycle"]
+    random.seed(5)
+    for _ in range(20):
+        hdl = tree.hdl()[0]
+        state = _state(tree)
+        with tree.transaction() as tx:
+            for _ in range(5):
+                node = random.choice(list(tree))
+                parent = node.parent
+                if random.random() < 0.3 and parent and parent.value == cocycle:
+                    tree.insert_buffer(node)
+                else:
+                    rotate(tree)
+            tx.rollback()
+            assert not len(tx)
+            assert _state(tree) == state
+            assert tree.hdl()[0] == hdl
+            _check_caches(tree)
+
+            # The transaction stays open after a rollback
+            with pytest.raises(ValueError):
+                tree.transaction().__enter__()
+            rotate(tree)
+        assert is_adder(tree)
+
+    # Node definitions are swapped back, and errors roll back
+    tree.hdl()
+    state = _state(tree)
+    with pytest.raises(KeyError):
+        with tree.transaction():
+            tree.optimize_nodes()
+            raise KeyError
+    assert _state(tree) == state
+    assert is_adder(tree)